@@ -0,0 +1,163 @@
+"""
+Opt-in profiling of the views, the listener and the Celery tasks.
+
+Profiling is switched on at runtime for all processes with
+`manage.py profiling on` (it is stored in the cache), or permanently
+with the PROFILING_ENABLED setting. The profiles are dumped with
+cProfile in PROFILING_DIR, and can be read with `pstats` or snakeviz.
+"""
+import cProfile
+import functools
+import json
+import logging
+import os
+import re
+import signal
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+#: Cache key of the runtime switch
+SWITCH_KEY = 'profiling:enabled'
+#: The switch is read again after this number of seconds
+SWITCH_CHECK_INTERVAL = 10
+
+query_logger = logging.getLogger('editgroups.queries')
+
+_switch = {'checked_at': None, 'enabled': False}
+
+
+def profiling_enabled():
+    if settings.PROFILING_ENABLED:
+        return True
+    now = time.monotonic()
+    if _switch['checked_at'] is None or now - _switch['checked_at'] > SWITCH_CHECK_INTERVAL:
+        _switch['enabled'] = bool(cache.get(SWITCH_KEY))
+        _switch['checked_at'] = now
+    return _switch['enabled']
+
+def switch_profiling(enabled, duration=None):
+    """
+    Switches profiling on or off in all processes (within
+    SWITCH_CHECK_INTERVAL), for `duration` seconds or until
+    it is switched off.
+    """
+    if enabled:
+        cache.set(SWITCH_KEY, True, duration)
+    else:
+        cache.delete(SWITCH_KEY)
+    _switch['checked_at'] = None
+
+def dump_profile(profiler, kind, name):
+    """
+    Writes a profile to PROFILING_DIR, as `<kind>-<time>-<name>.prof`.
+
+    :returns: the path of the file
+    """
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    filename = '{}-{}-{}.prof'.format(kind, time.strftime('%Y%m%dT%H%M%S'),
+        re.sub(r'[^\w.-]+', '_', name).strip('_')[:100] or 'root')
+    path = os.path.join(settings.PROFILING_DIR, filename)
+    profiler.dump_stats(path)
+    return path
+
+class ProfilingMiddleware(object):
+    """
+    Profiles the requests when profiling is on, and keeps
+    the profiles of the ones slower than PROFILING_SLOW_REQUEST.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling_enabled():
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            # streamed responses are only profiled until their content starts
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        if time.perf_counter() - start >= settings.PROFILING_SLOW_REQUEST:
+            dump_profile(profiler, 'view', request.path)
+        return response
+
+class QueryCountMiddleware(object):
+    """
+    Logs the number of SQL queries of each request and the time
+    spent in them when profiling is on, as JSON lines in the
+    `editgroups.queries` logger.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling_enabled():
+            return self.get_response(request)
+
+        counter = {'queries': 0, 'time': 0.}
+
+        def count(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                counter['queries'] += 1
+                counter['time'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count):
+            response = self.get_response(request)
+        query_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+            'queries': counter['queries'],
+            'query_ms': round(counter['time'] * 1000, 1),
+        }))
+        return response
+
+def profiled(name):
+    """
+    Decorates a function (such as a Celery task) so that each call
+    is profiled when profiling is on.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiling_enabled():
+                return function(*args, **kwargs)
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(function, *args, **kwargs)
+            finally:
+                dump_profile(profiler, 'task', name)
+        return wrapper
+    return decorator
+
+class SignalProfiler(object):
+    """
+    Profiles a long-running process between two signals:
+    the first one starts the profiler, the second one dumps
+    the profile. Used by the listener (with SIGUSR1).
+    """
+    def __init__(self, name, signum=signal.SIGUSR1):
+        self.name = name
+        self.profiler = None
+        signal.signal(signum, self.toggle)
+
+    def toggle(self, signum, frame):
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            print('Profiling started')
+        else:
+            self.profiler.disable()
+            print('Profile written to {}'.format(dump_profile(self.profiler, 'process', self.name)))
+            self.profiler = None
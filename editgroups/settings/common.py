@@ -63,6 +63,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'social_django.middleware.SocialAuthExceptionMiddleware',
+    'editgroups.profiling.QueryCountMiddleware',
+    'editgroups.profiling.ProfilingMiddleware',
 ]
 
 
@@ -92,6 +94,8 @@ TEMPLATES = [
                     "social_django.context_processors.backends",
                     "social_django.context_processors.login_redirect",
                     "tagging.filters.context_processor",
+                    "store.status.context_processor",
+                    "store.live.context_processor",
                 ),
                 'debug': True
             }
@@ -191,6 +195,92 @@ BROKER_URL = 'redis://'+REDIS_URL
 CELERY_RESULT_BACKEND = BROKER_URL
 
 CELERY_ACCEPT_CONTENT = ['pickle', 'json', 'msgpack', 'yaml']
-CELERY_IMPORTS = ['revert.tasks']
+CELERY_IMPORTS = ['revert.tasks', 'store.tasks']
+# Periodic tasks, run by the worker started with -B (see celery.sh)
+CELERYBEAT_SCHEDULE = {
+    'reconcile-daily-stats': {
+        'task': 'reconcile_daily_stats',
+        'schedule': 60*60,
+    },
+}
 
+### Reverts ###
+# The MediaWiki API used to undo edits
+MEDIAWIKI_API_URL = 'https://www.wikidata.org/w/api.php'
+# Pause between two undo requests, in seconds
+REVERT_DELAY = 1
+# When the wiki asks us to slow down (rate limit, replication lag), the undo
+# is sent again after this number of seconds, doubled at each attempt,
+# and the revert stops after this number of attempts
+REVERT_BACKOFF = 30
+REVERT_MAX_ATTEMPTS = 5
+# Undos are refused by the wiki when its replicas lag by more than
+# this number of seconds (recommended value for bots on Wikimedia wikis)
+REVERT_MAXLAG = 5
+
+### Storage ###
+# Set to True once the Edit table is partitioned (see the partition_edits
+# command) to restrict queries to the relevant partitions
+PARTITION_EDITS = False
+
+### Caching ###
+# Time after which the cached rows of the list of batches expire, in seconds
+# (they are also invalidated by the version of each batch)
+BATCH_ROWS_CACHE_TIMEOUT = 24*60*60
+# Share of the pages whose cached rows are counted in the hit rate
+BATCH_ROWS_STATS_SAMPLING = 0.1
+# Same for the statistics of each batch (see store.stats)
+BATCH_STATS_CACHE_TIMEOUT = 24*60*60
+# The statistics of a batch receiving edits are computed
+# again at most once in this number of seconds
+BATCH_STATS_REFRESH_DELAY = 60
+
+### Rollups ###
+# Number of days (including today) whose daily rollups are recomputed
+# from the edits by the periodic reconcile_daily_stats task
+DAILY_STATS_RECONCILE_DAYS = 2
+
+### Ingestion status ###
+# Lag behind the stream of edits, in seconds, above which the pages
+# warn that the latest batches may be incomplete
+INGESTION_LAG_WARNING = 10*60
+
+### Profiling ###
+# Profile all requests, listener chunks and tasks (profiling can also be
+# switched on at runtime with `manage.py profiling on`, see editgroups.profiling)
+PROFILING_ENABLED = False
+# Where the profiles are written
+PROFILING_DIR = os.path.join(BASE_DIR, '../profiles')
+# Only the profiles of the requests slower than this are kept, in seconds
+PROFILING_SLOW_REQUEST = 1.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # the number of SQL queries of each request, as JSON lines
+        'editgroups.queries': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
 
+### Live updates ###
+# Each event stream (the api-batch-updates view) is open for minutes,
+# so it must not be served by the WSGI workers of the site: live updates
+# are only shown when the stream is served by a separate asynchronous
+# process (such as gunicorn with gevent workers), at this URL
+LIVE_UPDATES_URL = None
+# Publish the changes of batches on Redis after each chunk of ingested
+# edits, so that the pages watching them are updated in place
+PUBLISH_BATCH_UPDATES = False
+BATCH_UPDATES_CHANNEL = 'editgroups:batch-updates'
+# Duration after which the event streams are closed (browsers reconnect)
+BATCH_UPDATES_STREAM_DURATION = 5*60
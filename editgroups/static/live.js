@@ -0,0 +1,52 @@
+/*
+ * Updates the batches shown on a page in place, with the changes
+ * pushed by the server as server-sent events.
+ *
+ * The page opts in with a `data-live-updates` attribute holding the URL
+ * of the event stream. The elements showing a batch have a `data-batch`
+ * attribute with its full uid, and the fields to update are marked with
+ * the `live-*` classes.
+ */
+$(function() {
+    var stream = $('[data-live-updates]').first();
+    if (!stream.length || !window.EventSource) {
+        return;
+    }
+
+    function updateBatch(element, update) {
+        if ('nb_edits' in update) {
+            element.find('.live-nb-edits').text(update.nb_edits);
+        }
+        if ('nb_reverted' in update) {
+            element.find('.live-nb-reverted').text(update.nb_reverted);
+        }
+        if ('ended' in update) {
+            element.find('.live-ended').each(function() {
+                var cell = $(this);
+                if (cell.data('format') === 'ago') {
+                    cell.text('just now');
+                } else {
+                    cell.text(new Date(update.ended).toLocaleString());
+                }
+            });
+        }
+        (update.tags || []).forEach(function(tag) {
+            if (tag.display_name) {
+                element.find('.live-tags').append(' ', $('<span class="label"></span>')
+                    .css('background-color', tag.color)
+                    .text(tag.display_name));
+            }
+        });
+    }
+
+    var source = new EventSource(stream.data('live-updates'));
+    source.addEventListener('batches', function(event) {
+        JSON.parse(event.data).forEach(function(update) {
+            $('[data-batch]').filter(function() {
+                return $(this).data('batch') === update.full_uid;
+            }).each(function() {
+                updateBatch($(this), update);
+            });
+        });
+    });
+});
@@ -34,6 +34,8 @@ urlpatterns = [
     path('', views.BatchesView.as_view(), name='list-batches'),
     path('b/<tool>/<uid>/', views.BatchView.as_view(), name='batch-view'),
     path('b/<tool>/<uid>/edits/', views.BatchEditsView.as_view(), name='batch-edits'),
+    path('entity/<title>/', views.EntityView.as_view(), name='entity-view'),
+    path('stats/', views.DailyStatsView.as_view(), name='daily-stats'),
     path('b/<tool>/<uid>/undo/', initiate_revert_view, name='initiate-revert'),
     path('b/<tool>/<uid>/undo/start/', RevertTaskView.as_view(), name='submit-revert'),
     path('b/<tool>/<uid>/undo/stop/', StopRevertTaskView.as_view(), name='stop-revert'),
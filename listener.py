@@ -12,6 +12,11 @@ if __name__ == '__main__':
     from store.stream import WikidataEditStream
     from store.utils import grouper
     from store.models import Edit
+    from store.status import record_chunk
+    from editgroups.profiling import SignalProfiler
+
+    # kill -USR1 starts profiling the listener, a second one dumps the profile
+    SignalProfiler('listener')
 
     print('Listening to Wikidata edits...')
     s = WikidataEditStream()
@@ -20,6 +25,7 @@ if __name__ == '__main__':
             print('batch %d' % i)
        sys.stdout.flush()
        Edit.ingest_edits(batch)
+       record_chunk(batch)
 
     print('End of stream')
 
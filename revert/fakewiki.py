@@ -0,0 +1,235 @@
+"""
+A local stand-in for the MediaWiki API, implementing the few
+calls made when reverting batches (tokens, current revisions and
+undos), so that the revert engine can be tested and benchmarked
+without touching Wikidata.
+"""
+import json
+import threading
+import time
+from collections import Counter
+from collections import deque
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl
+from urllib.parse import urlparse
+
+
+class FakeWiki(object):
+    """
+    An in-memory wiki: each page is a list of revision ids,
+    the last one being the current revision.
+
+    :param latency: time (in seconds) spent answering each request
+    :param lag: simulated replication lag (in seconds): requests with a lower
+        `maxlag` parameter are rejected, like on Wikimedia wikis
+    :param edits_per_minute: rate limit on edits, if any
+    """
+
+    def __init__(self, latency=0, lag=0, edits_per_minute=None):
+        self.latency = latency
+        self.lag = lag
+        self.edits_per_minute = edits_per_minute
+
+        self.pages = {}
+        self.next_revid = 1
+        self.calls = Counter()
+        #: number of errors returned, by error code
+        self.errors = Counter()
+        #: number of revisions undone by successful undos
+        self.nb_undone = 0
+        self.edit_times = deque()
+        self.lock = threading.Lock()
+        self.server = None
+
+    def add_page(self, title, revids):
+        """
+        Creates a page with the given history
+        """
+        self.pages[title] = list(revids)
+        self.next_revid = max([self.next_revid] + [revid + 1 for revid in revids])
+
+    def delete_page(self, title):
+        self.pages[title] = None
+
+    def add_revision(self, title):
+        """
+        Simulates an edit by someone else on the page.
+
+        :returns: the new revision id
+        """
+        revid = self.next_revid
+        self.next_revid += 1
+        self.pages[title].append(revid)
+        return revid
+
+    def make_batch(self, uid, nb_edits, edits_per_page=5, user='BenchmarkUser', start=1520000000):
+        """
+        Creates pages on the wiki as if a QuickStatements batch had
+        made consecutive edits on each of them.
+
+        :returns: the list of the corresponding recent changes, oldest first,
+            as they would be sent by the Wikimedia event stream
+        """
+        changes = []
+        for idx in range(nb_edits):
+            title = 'Q{}'.format(1000000 + idx // edits_per_page)
+            if idx % edits_per_page == 0:
+                self.add_page(title, [self.next_revid])
+            oldrevid = self.pages[title][-1]
+            newrevid = self.add_revision(title)
+            changes.append({
+                'id': newrevid,
+                'type': 'edit',
+                'namespace': 0,
+                'title': title,
+                'comment': '/* wbcreateclaim-create:1| */ [[Property:P31]]: [[Q5]], #quickstatements; '
+                    '[[:toollabs:quickstatements/#mode=batch&batch={}|batch #{}]] by [[User:{}|]]'.format(uid, uid, user),
+                'parsedcomment': 'Created claim: <a href="/wiki/Property:P31">Property:P31</a>: '
+                    '<a href="/wiki/Q5">Q5</a>, #quickstatements',
+                'timestamp': start + idx,
+                'user': 'QuickStatementsBot',
+                'bot': True,
+                'minor': False,
+                'patrolled': True,
+                'length': {'old': 1000 + 100 * (idx % edits_per_page), 'new': 1100 + 100 * (idx % edits_per_page)},
+                'revision': {'old': oldrevid, 'new': newrevid},
+                'meta': {'uri': 'https://www.wikidata.org/wiki/' + title},
+                'wiki': 'wikidatawiki',
+            })
+        return changes
+
+    @property
+    def nb_calls(self):
+        return sum(self.calls.values())
+
+    def error(self, code, info):
+        return {'error': {'code': code, 'info': info}}
+
+    def handle(self, params):
+        """
+        Answers an API request.
+
+        :param params: the GET or POST parameters of the request
+        :returns: the JSON response, as a dictionary
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self.lock:
+            action = params.get('action')
+            self.calls[action] += 1
+            response = self.dispatch(action, params)
+            if 'error' in response:
+                self.errors[response['error']['code']] += 1
+            return response
+
+    def dispatch(self, action, params):
+        maxlag = params.get('maxlag')
+        if maxlag is not None and self.lag > int(maxlag):
+            return self.error('maxlag',
+                'Waiting for a database server: {} seconds lagged.'.format(self.lag))
+
+        if action == 'query' and params.get('meta') == 'tokens':
+            return {'batchcomplete': True, 'query': {'tokens': {'csrftoken': 'fake+\\'}}}
+        elif action == 'query' and params.get('prop') == 'revisions':
+            return self.query_revisions(params['titles'].split('|'))
+        elif action == 'edit':
+            return self.edit(params)
+        return self.error('badvalue', 'Unsupported request.')
+
+    def query_revisions(self, titles):
+        pages = []
+        for title in titles:
+            revids = self.pages.get(title)
+            if not revids:
+                pages.append({'ns': 0, 'title': title, 'missing': True})
+            else:
+                pages.append({'ns': 0, 'title': title,
+                    'revisions': [{'revid': revids[-1]}]})
+        return {'batchcomplete': True, 'query': {'pages': pages}}
+
+    def edit(self, params):
+        if self.edits_per_minute:
+            now = time.time()
+            while self.edit_times and self.edit_times[0] < now - 60:
+                self.edit_times.popleft()
+            if len(self.edit_times) >= self.edits_per_minute:
+                return self.error('ratelimited',
+                    "As an anti-abuse measure, you are limited from performing this action too many times in a short space of time.")
+            self.edit_times.append(now)
+
+        title = params.get('title')
+        revids = self.pages.get(title)
+        if not revids:
+            return self.error('missingtitle', "The page you specified doesn't exist.")
+
+        undo = int(params['undo'])
+        if undo not in revids:
+            return self.error('nosuchrevid', 'There is no revision with ID {}.'.format(undo))
+
+        nb_undone = 1
+        undoafter = params.get('undoafter')
+        if undoafter is not None:
+            undoafter = int(undoafter)
+            if undoafter not in revids or revids.index(undoafter) >= revids.index(undo):
+                return self.error('nosuchrevid', 'There is no revision with ID {}.'.format(undoafter))
+            # we do not attempt to merge range undos with later changes
+            if undo != revids[-1]:
+                return self.error('undofailure',
+                    'The edit could not be undone due to conflicting intermediate edits.')
+            nb_undone = revids.index(undo) - revids.index(undoafter)
+
+        self.nb_undone += nb_undone
+
+        oldrevid = revids[-1]
+        newrevid = self.add_revision(title)
+        return {'edit': {'result': 'Success', 'title': title,
+            'oldrevid': oldrevid, 'newrevid': newrevid}}
+
+    def start(self, host='localhost', port=0):
+        """
+        Serves the API in a background thread.
+
+        :returns: the URL of the API endpoint
+        """
+        wiki = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def respond(self, params):
+                data = wiki.handle(params)
+                response = json.dumps(data).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(response)))
+                if 'error' in data:
+                    self.send_header('MediaWiki-API-Error', data['error']['code'])
+                self.end_headers()
+                self.wfile.write(response)
+
+            def do_GET(self):
+                self.respond(dict(parse_qsl(urlparse(self.path).query)))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length).decode('utf-8')
+                self.respond(dict(parse_qsl(body)))
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.server = Server((host, port), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return 'http://{}:{}/w/api.php'.format(host, self.server.server_address[1])
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,100 @@
+import resource
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from social_django.models import UserSocialAuth
+
+from revert.fakewiki import FakeWiki
+from revert.models import RevertTask
+from revert.tasks import revert_batch
+from store.models import Batch
+from store.models import Edit
+from store.utils import grouper
+
+
+class Command(BaseCommand):
+    help = ('Measures how fast a synthetic batch is reverted against a local fake MediaWiki API. '
+            'Runs in a temporary test database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--edits', type=int, default=1000,
+            help='number of edits in the batch')
+        parser.add_argument('--edits-per-page', type=int, default=5,
+            help='number of consecutive edits made by the batch on each page')
+        parser.add_argument('--conflicting', type=float, default=0.,
+            help='proportion of pages edited by someone else after the batch')
+        parser.add_argument('--deleted', type=float, default=0.,
+            help='proportion of pages deleted after the batch')
+        parser.add_argument('--latency', type=float, default=0.,
+            help='time taken by the API to answer each request, in seconds')
+        parser.add_argument('--lag', type=int, default=0,
+            help='simulated replication lag, in seconds (compared to REVERT_MAXLAG)')
+        parser.add_argument('--edits-per-minute', type=int, default=None,
+            help='rate limit on edits')
+        parser.add_argument('--delay', type=float, default=0.,
+            help='pause between undo requests, in seconds (REVERT_DELAY in production)')
+        parser.add_argument('--backoff', type=float, default=1.,
+            help='first wait after the wiki refuses an undo, in seconds (REVERT_BACKOFF in production)')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def benchmark(self, options):
+        wiki = FakeWiki(latency=options['latency'], lag=options['lag'],
+            edits_per_minute=options['edits_per_minute'])
+
+        changes = wiki.make_batch('1', options['edits'], edits_per_page=options['edits_per_page'])
+        for batch in grouper(changes, 50):
+            Edit.ingest_edits(batch)
+        batch = Batch.objects.get()
+
+        titles = sorted(wiki.pages)
+        nb_conflicting = int(len(titles) * options['conflicting'])
+        nb_deleted = int(len(titles) * options['deleted'])
+        for title in titles[:nb_conflicting]:
+            wiki.add_revision(title)
+        for title in titles[nb_conflicting:nb_conflicting+nb_deleted]:
+            wiki.delete_page(title)
+
+        user = User.objects.create(username='benchmark')
+        UserSocialAuth.objects.create(user=user, provider='mediawiki', uid='1',
+            extra_data={'access_token': {'oauth_token': 'fake', 'oauth_token_secret': 'fake'}})
+        task = RevertTask.objects.create(batch=batch, user=user, comment='benchmark')
+        nb_edits = batch.nb_revertable_edits
+
+        url = wiki.start()
+        try:
+            with override_settings(MEDIAWIKI_API_URL=url, REVERT_DELAY=options['delay'],
+                    REVERT_BACKOFF=options['backoff']):
+                tracemalloc.start()
+                start = time.perf_counter()
+                revert_batch(task.id)
+                elapsed = time.perf_counter() - start
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+        finally:
+            wiki.stop()
+
+        task = RevertTask.objects.get(id=task.id)
+        self.stdout.write('Edits to revert:      {}'.format(nb_edits))
+        self.stdout.write('Pre-flight:           {} undoable, {} conflicting, {} obsolete'.format(
+            task.nb_undoable, task.nb_conflicting, task.nb_obsolete))
+        self.stdout.write('Undone edits:         {}'.format(wiki.nb_undone))
+        self.stdout.write('Failed requests:      {} ({})'.format(sum(wiki.errors.values()),
+            ', '.join('{}: {}'.format(code, count) for code, count in sorted(wiki.errors.items()))))
+        self.stdout.write('Elapsed time:         {:.2f} s'.format(elapsed))
+        self.stdout.write('Throughput:           {:.1f} undone edits/s'.format(wiki.nb_undone / elapsed))
+        self.stdout.write('API calls:            {} ({})'.format(wiki.nb_calls,
+            ', '.join('{}: {}'.format(action, count) for action, count in sorted(wiki.calls.items()))))
+        self.stdout.write('API calls per edit:   {:.2f}'.format(wiki.nb_calls / max(wiki.nb_undone, 1)))
+        self.stdout.write('Peak Python memory:   {:.1f} MiB'.format(peak_memory / 2**20))
+        self.stdout.write('Max resident memory:  {:.1f} MiB'.format(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
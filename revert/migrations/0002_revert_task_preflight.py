@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('revert', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reverttask',
+            name='nb_conflicting',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reverttask',
+            name='nb_obsolete',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reverttask',
+            name='nb_undoable',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('revert', '0002_revert_task_preflight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reverttask',
+            name='nb_failed',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -2,13 +2,32 @@ from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import User
 import json
+from datetime import datetime
+from pytz import UTC
+import logging
 import random
+from collections import Counter
 import requests
 from requests_oauthlib import OAuth1
 from cached_property import cached_property
 
 from store.models import Batch
 from store.models import Edit
+from .preflight import classify_runs
+from .preflight import UNDOABLE
+from .preflight import CONFLICTING
+from .preflight import OBSOLETE
+
+logger = logging.getLogger(__name__)
+
+#: Error codes by which the wiki asks us to edit more slowly
+THROTTLING_ERRORS = {'ratelimited', 'maxlag'}
+
+class UndoThrottled(Exception):
+    """
+    Raised when the wiki refuses an undo because we edit too fast
+    or its replicas are lagging: it should be sent again later.
+    """
 
 def generate_uid():
     uid_length = 7
@@ -27,6 +46,13 @@ class RevertTask(models.Model):
     cancel = models.BooleanField(default=False)
     complete = models.BooleanField(default=False)
 
+    # Outcome of the pre-flight check (null until it has run)
+    nb_undoable = models.IntegerField(null=True, blank=True)
+    nb_conflicting = models.IntegerField(null=True, blank=True)
+    nb_obsolete = models.IntegerField(null=True, blank=True)
+    #: Number of undos refused by the wiki
+    nb_failed = models.IntegerField(default=0)
+
     def __str__(self):
         return 'reverting '+str(self.batch)
 
@@ -49,9 +75,85 @@ class RevertTask(models.Model):
         dct = socialauth.extra_data
         return dct['access_token']
 
+    def preflight(self, runs):
+        """
+        Checks the current revisions of the pages touched by
+        the runs of edits to revert, before sending any edit,
+        and records how many edits can be undone cleanly, conflict
+        with later edits or are obsolete.
+
+        :returns: the list of classes of the runs (see :mod:`revert.preflight`)
+        """
+        classes = classify_runs(runs)
+        counts = Counter()
+        for run, status in zip(runs, classes):
+            counts[status] += len(run)
+        self.nb_undoable = counts[UNDOABLE]
+        self.nb_conflicting = counts[CONFLICTING]
+        self.nb_obsolete = counts[OBSOLETE]
+        self.save(update_fields=['nb_undoable', 'nb_conflicting', 'nb_obsolete'])
+        return classes
+
     def revert_edit(self, edit):
         """
-        Reverts the given edit via the MediaWiki API.
+        Reverts the given edit via the MediaWiki API,
+        counting it as failed if the wiki refuses the undo.
+
+        :returns: whether the edit was undone
+        """
+        response = self.undo(edit.title, edit.newrevid, self.summary(edit))
+        if self.check_undo(response, edit):
+            return True
+        self.nb_failed += 1
+        RevertTask.objects.filter(id=self.id).update(nb_failed=models.F('nb_failed') + 1)
+        return False
+
+    def check_undo(self, response, edit):
+        """
+        Checks the response of the API to the undo of an edit
+        (the newest one for a range undo), logging errors.
+
+        :raises UndoThrottled: if the undo should be sent again later
+        :returns: whether the undo succeeded
+        """
+        if response.get('edit', {}).get('result') == 'Success':
+            return True
+        error = response.get('error') or {}
+        logger.warning('Undo of revision %s on %s failed: %s (%s)',
+            edit.newrevid, edit.title, error.get('code'), error.get('info'))
+        if error.get('code') in THROTTLING_ERRORS:
+            raise UndoThrottled(error['code'])
+        return False
+
+    def revert_run(self, edits):
+        """
+        Reverts a run of consecutive edits on the same page
+        (as returned by :func:`group_consecutive_edits`) with
+        a single range undo.
+
+        :returns: whether the range undo succeeded. If MediaWiki refused
+            it (for instance because of a conflict), the edits should be
+            undone one by one instead.
+        """
+        newest = edits[0]
+        oldest = edits[-1]
+        response = self.undo(newest.title, newest.newrevid,
+            self.summary(newest), undoafter=oldest.oldrevid)
+
+        if self.check_undo(response, newest):
+            # the undo summary only mentions the newest edit,
+            # so the ingestion will not mark the other ones as reverted
+            Edit.objects.filter(id__in=[edit.id for edit in edits]).update(reverted=True)
+            Batch.objects.filter(id=self.batch_id).update(changed=datetime.now(UTC))
+            return True
+        return False
+
+    def undo(self, title, undo, summary, undoafter=None):
+        """
+        Undoes a revision (or a range of revisions, if undoafter
+        is provided) via the MediaWiki API.
+
+        :returns: the JSON response of the API
         """
         auth = OAuth1(
             settings.SOCIAL_AUTH_MEDIAWIKI_KEY,
@@ -60,33 +162,64 @@ class RevertTask(models.Model):
             self.oauth_tokens['oauth_token_secret'])
 
         # Get token
-        r = requests.get('https://www.wikidata.org/w/api.php', params={
+        r = requests.get(settings.MEDIAWIKI_API_URL, params={
         'action':'query',
         'meta':'tokens',
             'format': 'json',
         }, auth=auth)
-        print('#### GET TOKEN')
-        print(r.url)
-        print(r.text)
+        logger.debug('Token request: %s (status %s)', r.url, r.status_code)
         r.raise_for_status()
-        token = r.json()['query']['tokens']['csrftoken']
+        tokens = r.json()
+        if 'error' in tokens:
+            return tokens
+        token = tokens['query']['tokens']['csrftoken']
 
         # Undo the edit
         data = {
             'action':'edit',
-            'title': edit.title,
-            'undo': edit.newrevid,
-            'summary': self.summary(edit),
+            'title': title,
+            'undo': undo,
+            'summary': summary,
             'format': 'json',
             'token': token,
             'watchlist': 'nochange',
+            'maxlag': settings.REVERT_MAXLAG,
         }
-        r = requests.post('https://www.wikidata.org/w/api.php',
+        if undoafter:
+            data['undoafter'] = undoafter
+        r = requests.post(settings.MEDIAWIKI_API_URL,
                 data=data, auth=auth)
 
-        print('#### UNDO EDIT')
-        print(data)
-        print(r.text)
-        #r.raise_for_status()
+        logger.debug('Undo of revision %s on %s: %s',
+            undo, title, r.text)
+        if not r.ok:
+            return {'error': {'code': 'http-{}'.format(r.status_code), 'info': r.reason}}
+        try:
+            return r.json()
+        except ValueError:
+            return {'error': {'code': 'invalidjson', 'info': r.text[:200]}}
+
 
+def group_consecutive_edits(edits):
+    """
+    Groups edits, ordered by decreasing timestamp, into runs
+    of consecutive revisions of the same page: an edit joins
+    the run of the edit just after it when it created the revision
+    that this newer edit was based on, so no other edit falls
+    in between. Page creations always form their own run, since
+    they cannot be used as the base of a range undo.
+
+    :returns: a generator of non-empty lists of edits
+    """
+    run = []
+    for edit in edits:
+        if (run and edit.title == run[-1].title and
+            edit.newrevid == run[-1].oldrevid and edit.oldrevid):
+            run.append(edit)
+        else:
+            if run:
+                yield run
+            run = [edit]
+    if run:
+        yield run
 
@@ -0,0 +1,82 @@
+import logging
+import requests
+from django.conf import settings
+
+from store.utils import grouper
+
+logger = logging.getLogger(__name__)
+
+#: Maximum number of titles the MediaWiki API accepts in one query
+#: (for clients without the apihighlimits right)
+MAX_TITLES_PER_QUERY = 50
+
+#: The run is the latest thing that happened to the page: it can be undone cleanly
+UNDOABLE = 'undoable'
+#: Someone edited the page after the run: undoing it might fail
+CONFLICTING = 'conflicting'
+#: The page does not exist anymore: there is nothing to undo
+OBSOLETE = 'obsolete'
+
+def fetch_latest_revisions(titles):
+    """
+    Fetches the current revision ids of the given pages,
+    querying the API for up to 50 titles at once.
+
+    :returns: a dictionary from titles to revision ids.
+        Pages which do not exist have None as revision id.
+        Pages which could not be checked are left out.
+    """
+    latest = {}
+    for chunk in grouper(titles, MAX_TITLES_PER_QUERY):
+        chunk = [title for title in chunk if title is not None]
+        try:
+            r = requests.get(settings.MEDIAWIKI_API_URL, params={
+                'action': 'query',
+                'prop': 'revisions',
+                'rvprop': 'ids',
+                'titles': '|'.join(chunk),
+                'format': 'json',
+                'formatversion': 2,
+            })
+            r.raise_for_status()
+            query = r.json().get('query', {})
+        except (requests.RequestException, ValueError) as e:
+            logger.warning('Could not fetch the latest revisions of %d pages: %s', len(chunk), e)
+            continue
+
+        # map back normalized titles to the ones we asked for
+        original_titles = {
+            n['to']: n['from'] for n in query.get('normalized', [])
+        }
+        for page in query.get('pages', []):
+            title = original_titles.get(page['title'], page['title'])
+            revisions = page.get('revisions')
+            if page.get('missing') or not revisions:
+                latest[title] = None
+            else:
+                latest[title] = revisions[0]['revid']
+    return latest
+
+def classify_runs(runs):
+    """
+    Classifies runs of consecutive edits (as returned by
+    :func:`revert.models.group_consecutive_edits`) before
+    reverting them, without sending any edit.
+
+    :returns: the list of classes of the runs (UNDOABLE, CONFLICTING or OBSOLETE),
+        in the same order. Runs on pages which could not be checked
+        are CONFLICTING, so they are undone edit by edit.
+    """
+    titles = sorted({run[0].title for run in runs})
+    latest = fetch_latest_revisions(titles)
+
+    classes = []
+    for run in runs:
+        title = run[0].title
+        if title in latest and latest[title] is None:
+            classes.append(OBSOLETE)
+        elif latest.get(title) == run[0].newrevid:
+            classes.append(UNDOABLE)
+        else:
+            classes.append(CONFLICTING)
+    return classes
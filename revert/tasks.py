@@ -1,21 +1,70 @@
 
+from django.conf import settings
 from editgroups.celery import app
+from editgroups.profiling import profiled
 from .models import RevertTask
+from .models import UndoThrottled
+from .models import group_consecutive_edits
+from .preflight import UNDOABLE
+from .preflight import OBSOLETE
 from time import sleep
 from store.utils import grouper
+import logging
 
+logger = logging.getLogger(__name__)
+
+
+def canceled(task):
+    """
+    Reads again whether the task was canceled by its user,
+    before sending the next undo.
+    """
+    task.refresh_from_db(fields=['cancel'])
+    return task.cancel
+
+def send(undo, *args):
+    """
+    Sends an undo (or a range undo) and pauses before the next one.
+    When the wiki asks us to slow down, the undo is sent again after
+    waiting longer and longer, up to REVERT_MAX_ATTEMPTS times.
+
+    :raises UndoThrottled: if the wiki still refuses it after that
+    """
+    for attempt in range(settings.REVERT_MAX_ATTEMPTS):
+        try:
+            result = undo(*args)
+            sleep(settings.REVERT_DELAY)
+            return result
+        except UndoThrottled as e:
+            if attempt + 1 == settings.REVERT_MAX_ATTEMPTS:
+                raise
+            logger.info('Throttled by the wiki (%s), waiting before trying again', e)
+            sleep(settings.REVERT_BACKOFF * 2**attempt)
 
 @app.task(name='revert_batch')
+@profiled('revert_batch')
 def revert_batch(task_pk):
     try:
         task = RevertTask.objects.get(pk=task_pk)
-        edits = task.batch.edits.filter(reverted=False).order_by('-timestamp')
-        for idx, edit in enumerate(edits):
-            if idx % 10 == 0:
-                task = RevertTask.objects.get(pk=task_pk)
-            task.revert_edit(edit)
-            sleep(1)
+        edits = task.batch.revertable_edits.select_related('username').order_by('-timestamp', '-newrevid')
+        runs = list(group_consecutive_edits(edits))
+        classes = task.preflight(runs)
+        for run, status in zip(runs, classes):
+            if status == OBSOLETE:
+                continue
+            elif status == UNDOABLE and len(run) > 1:
+                if canceled(task):
+                    return
+                if send(task.revert_run, run):
+                    continue
+            # the range undo failed, or would most likely fail for a conflicting
+            # run: MediaWiki might still be able to undo the edits individually
+            for edit in run:
+                if canceled(task):
+                    return
+                send(task.revert_edit, edit)
+    except UndoThrottled:
+        logger.warning('Stopped undoing batch %s: the wiki refuses to take more edits', task.batch_id)
     finally:
         task.complete = True
         task.save(update_fields=['complete'])
-
@@ -1,4 +1,5 @@
 from django.test import TestCase
+from django.test import override_settings
 from django.test import Client
 from django.urls import reverse
 from django.contrib.auth.models import User
@@ -7,15 +8,27 @@ from requests_oauthlib import OAuth1
 from social_django.models import UserSocialAuth
 import requests_mock
 from editgroups.celery import app as celery_app
+from unittest.mock import call
 from unittest.mock import patch
 
 from store.models import Edit
 from store.models import Batch
 from .models import RevertTask
+from .models import group_consecutive_edits
+from .preflight import classify_runs
+from .preflight import UNDOABLE
+from .preflight import CONFLICTING
+from .preflight import OBSOLETE
+from .tasks import revert_batch
+from .fakewiki import FakeWiki
+from store.utils import grouper
 
 def fake_revert(*args, **kwargs):
     pass
 
+def fake_preflight(task, runs):
+    return [UNDOABLE for run in runs]
+
 class RevertTaskTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -77,6 +90,7 @@ class RevertTaskTest(TestCase):
         self.assertEquals(400, response.status_code)
 
     @patch.object(RevertTask, 'revert_edit', fake_revert)
+    @patch.object(RevertTask, 'preflight', fake_preflight)
     def test_revert_batch_fine(self):
         response = self.client.post(
             reverse('submit-revert', args=[self.batch.tool.shortid, self.batch.uid]),
@@ -84,6 +98,7 @@ class RevertTaskTest(TestCase):
         self.assertEquals(302, response.status_code)
 
     @patch.object(RevertTask, 'revert_edit', fake_revert)
+    @patch.object(RevertTask, 'preflight', fake_preflight)
     def test_revert_batch_previous_canceled(self):
         task = RevertTask(batch=self.batch, user=self.mary, comment="Already reverting")
         task.cancel = True
@@ -171,5 +186,231 @@ class RevertTaskTest(TestCase):
         pass
 
 
+class RangeUndoTest(TestCase):
+    def setUp(self):
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        self.batch = Batch.objects.get()
+        self.mary = User.objects.create(username='mary')
+        UserSocialAuth.objects.create(
+            user=self.mary, provider='wikidata', uid='39834872',
+            extra_data={"access_token":
+                {"oauth_token": "12345",
+                 "oauth_token_secret": "67890"}})
+        self.task = RevertTask.objects.create(batch=self.batch, user=self.mary, comment="bad batch")
+        self.edits = self.batch.edits.order_by('-timestamp', '-newrevid')
+
+    def test_group_consecutive_edits(self):
+        # the four edits of this batch are consecutive revisions of Q4115189
+        runs = list(group_consecutive_edits(self.edits))
+        self.assertEquals([[edit.id for edit in self.edits]],
+            [[edit.id for edit in run] for run in runs])
+
+    def test_group_interrupted_by_other_edit(self):
+        edits = list(self.edits)
+        # pretend someone else edited the page between the second and third edit
+        edits[1].oldrevid = 1234
+        runs = list(group_consecutive_edits(edits))
+        self.assertEquals([2, 2], [len(run) for run in runs])
+
+    def test_group_different_pages(self):
+        edits = list(self.edits)
+        edits[2].title = 'Q42'
+        runs = list(group_consecutive_edits(edits))
+        self.assertEquals([2, 1, 1], [len(run) for run in runs])
+
+    def test_range_undo(self):
+        with requests_mock.mock() as m:
+            m.get('https://www.wikidata.org/w/api.php?action=query&meta=tokens&format=json',
+                text='{"batchcomplete":"","query":{"tokens":{"csrftoken":"abcd"}}}')
+            m.post('https://www.wikidata.org/w/api.php',
+                text='{"edit":{"result":"Success","pageid":4246474,"title":"Q4115189","contentmodel":"wikibase-item","oldrevid":645094166,"newrevid":647388912,"newtimestamp":"2018-03-10T20:19:49Z"}}')
+
+            self.task.revert_run(list(self.edits))
+
+            posts = [req for req in m.request_history if req.method == 'POST']
+            self.assertEquals(1, len(posts))
+            self.assertTrue('undo=645094166' in posts[0].text)
+            self.assertTrue('undoafter=644900469' in posts[0].text)
+        self.assertEquals(4, self.batch.nb_reverted)
+
+    def mock_undoable_revert(self, m, undo_responses):
+        m.get('https://www.wikidata.org/w/api.php?action=query&prop=revisions',
+            text='{"batchcomplete":true,"query":{"pages":[{"ns":0,"title":"Q4115189","revisions":[{"revid":645094166}]}]}}')
+        m.get('https://www.wikidata.org/w/api.php?action=query&meta=tokens&format=json',
+            text='{"batchcomplete":"","query":{"tokens":{"csrftoken":"abcd"}}}')
+        m.post('https://www.wikidata.org/w/api.php', undo_responses)
+
+    @override_settings(REVERT_DELAY=2)
+    def test_range_undo_conflict(self):
+        with requests_mock.mock() as m, patch('revert.tasks.sleep') as sleep:
+            self.mock_undoable_revert(m, [
+                {'text': '{"error":{"code":"undofailure","info":"The edit could not be undone due to conflicting intermediate edits."}}'},
+                {'text': '{"edit":{"result":"Success"}}'},
+            ])
+            with self.assertLogs('revert.models', 'WARNING'):
+                revert_batch(self.task.id)
+
+            posts = [req for req in m.request_history if req.method == 'POST']
+            # one failed range undo, then one undo per edit, pausing after each of them
+            self.assertEquals(5, len(posts))
+            self.assertFalse('undoafter' in posts[1].text)
+            self.assertEquals([call(2)] * 5, sleep.call_args_list)
+        # individual undos are marked as reverted by the ingestion
+        self.assertEquals(0, self.batch.nb_reverted)
+        # the failed range undo is not counted as a failure
+        self.assertEquals(0, RevertTask.objects.get(id=self.task.id).nb_failed)
+
+    def test_range_undo_conflict_canceled(self):
+        def undo(request, context):
+            if 'undoafter' in request.text:
+                return '{"error":{"code":"undofailure","info":"The edit could not be undone."}}'
+            RevertTask.objects.filter(id=self.task.id).update(cancel=True)
+            return '{"edit":{"result":"Success"}}'
+
+        with requests_mock.mock() as m, patch('revert.tasks.sleep'):
+            self.mock_undoable_revert(m, [{'text': undo}])
+            with self.assertLogs('revert.models', 'WARNING'):
+                revert_batch(self.task.id)
+            self.assertEquals(2, len([req for req in m.request_history if req.method == 'POST']))
+
+    def test_preflight(self):
+        edits = list(self.edits)
+        edits[2].title = 'Q42'
+        edits[3].title = 'Q43'
+        runs = list(group_consecutive_edits(edits))
+        with requests_mock.mock() as m:
+            m.get('https://www.wikidata.org/w/api.php?action=query&prop=revisions',
+                text='{"batchcomplete":true,"query":{"pages":['
+                     '{"pageid":4246474,"ns":0,"title":"Q4115189","revisions":[{"revid":645094166,"parentid":645094153}]},'
+                     '{"pageid":138,"ns":0,"title":"Q42","revisions":[{"revid":700000000,"parentid":645094140}]},'
+                     '{"ns":0,"title":"Q43","missing":true}]}}')
+            self.assertEquals([UNDOABLE, CONFLICTING, OBSOLETE], classify_runs(runs))
+            # all titles are checked in one request
+            self.assertEquals(1, len(m.request_history))
+
+    def test_preflight_failure(self):
+        runs = list(group_consecutive_edits(self.edits))
+        with requests_mock.mock() as m:
+            m.get('https://www.wikidata.org/w/api.php?action=query&prop=revisions', status_code=503)
+            self.assertEquals([CONFLICTING], classify_runs(runs))
+
+    def test_revert_batch_canceled(self):
+        def undo(request, context):
+            RevertTask.objects.filter(id=self.task.id).update(cancel=True)
+            return '{"edit":{"result":"Success"}}'
+
+        with requests_mock.mock() as m, patch('revert.tasks.sleep'):
+            m.get('https://www.wikidata.org/w/api.php?action=query&prop=revisions',
+                text='{"batchcomplete":true,"query":{"pages":[{"ns":0,"title":"Q4115189","revisions":[{"revid":700000000}]}]}}')
+            m.get('https://www.wikidata.org/w/api.php?action=query&meta=tokens&format=json',
+                text='{"batchcomplete":"","query":{"tokens":{"csrftoken":"abcd"}}}')
+            m.post('https://www.wikidata.org/w/api.php', text=undo)
+            revert_batch(self.task.id)
+
+            # the conflicting run stops being undone edit by edit once canceled
+            self.assertEquals(1, len([req for req in m.request_history if req.method == 'POST']))
+        self.assertTrue(RevertTask.objects.get(id=self.task.id).complete)
+
+    def mock_conflicting_revert(self, m, undo_responses):
+        m.get('https://www.wikidata.org/w/api.php?action=query&prop=revisions',
+            text='{"batchcomplete":true,"query":{"pages":[{"ns":0,"title":"Q4115189","revisions":[{"revid":700000000}]}]}}')
+        m.get('https://www.wikidata.org/w/api.php?action=query&meta=tokens&format=json',
+            text='{"batchcomplete":"","query":{"tokens":{"csrftoken":"abcd"}}}')
+        m.post('https://www.wikidata.org/w/api.php', undo_responses)
+
+    def test_revert_batch_failed_undos(self):
+        with requests_mock.mock() as m, patch('revert.tasks.sleep'):
+            self.mock_conflicting_revert(m, [
+                {'text': '{"error":{"code":"undofailure","info":"The edit could not be undone."}}'},
+                {'text': '{"edit":{"result":"Success"}}'},
+                {'status_code': 503, 'text': 'unavailable'},
+                {'text': 'not json'},
+            ])
+            with self.assertLogs('revert.models', 'WARNING'):
+                revert_batch(self.task.id)
+        task = RevertTask.objects.get(id=self.task.id)
+        self.assertTrue(task.complete)
+        self.assertEquals(3, task.nb_failed)
+
+    @override_settings(REVERT_MAX_ATTEMPTS=3)
+    def test_revert_batch_throttled(self):
+        ratelimited = {'text': '{"error":{"code":"ratelimited","info":"You have exceeded your rate limit."}}'}
+        success = {'text': '{"edit":{"result":"Success"}}'}
+        with requests_mock.mock() as m, patch('revert.tasks.sleep') as sleep:
+            # the undo is sent again after waiting
+            self.mock_conflicting_revert(m, [ratelimited, ratelimited, success])
+            revert_batch(self.task.id)
+            self.assertEquals(6, len([req for req in m.request_history if req.method == 'POST']))
+            self.assertIn(call(60), sleep.call_args_list)
+        self.assertEquals(0, RevertTask.objects.get(id=self.task.id).nb_failed)
+
+        task = RevertTask.objects.create(batch=self.batch, user=self.mary, comment="bad batch")
+        with requests_mock.mock() as m, patch('revert.tasks.sleep'):
+            # the task stops when the wiki keeps refusing it
+            self.mock_conflicting_revert(m, [ratelimited])
+            revert_batch(task.id)
+            self.assertEquals(3, len([req for req in m.request_history if req.method == 'POST']))
+        self.assertTrue(RevertTask.objects.get(id=task.id).complete)
+
+    def test_revert_batch_skips_obsolete(self):
+        with requests_mock.mock() as m, patch('revert.tasks.sleep'):
+            m.get('https://www.wikidata.org/w/api.php?action=query&prop=revisions',
+                text='{"batchcomplete":true,"query":{"pages":[{"ns":0,"title":"Q4115189","missing":true}]}}')
+            revert_batch(self.task.id)
+
+            self.assertFalse([req for req in m.request_history if req.method == 'POST'])
+        task = RevertTask.objects.get(id=self.task.id)
+        self.assertTrue(task.complete)
+        self.assertEquals((0, 0, 4), (task.nb_undoable, task.nb_conflicting, task.nb_obsolete))
+
+
+class FakeWikiTest(TestCase):
+    def setUp(self):
+        self.wiki = FakeWiki()
+        for batch in grouper(self.wiki.make_batch('1234', 12, edits_per_page=3), 50):
+            Edit.ingest_edits(batch)
+        self.batch = Batch.objects.get()
+        self.mary = User.objects.create(username='mary')
+        UserSocialAuth.objects.create(
+            user=self.mary, provider='mediawiki', uid='39834872',
+            extra_data={"access_token":
+                {"oauth_token": "12345",
+                 "oauth_token_secret": "67890"}})
+        self.url = self.wiki.start()
+
+    def tearDown(self):
+        self.wiki.stop()
+
+    def test_make_batch(self):
+        self.assertEquals(12, self.batch.nb_edits)
+        self.assertEquals(4, self.batch.nb_pages)
+        self.assertEquals(4, len(self.wiki.pages))
+
+    def test_revert_batch(self):
+        titles = sorted(self.wiki.pages)
+        self.wiki.add_revision(titles[0])
+        self.wiki.delete_page(titles[1])
+        task = RevertTask.objects.create(batch=self.batch, user=self.mary, comment="test")
+
+        with override_settings(MEDIAWIKI_API_URL=self.url, REVERT_DELAY=0):
+            revert_batch(task.id)
+
+        task = RevertTask.objects.get(id=task.id)
+        self.assertEquals((6, 3, 3), (task.nb_undoable, task.nb_conflicting, task.nb_obsolete))
+        # two range undos, then three single undos for the conflicting page
+        self.assertEquals(5, self.wiki.calls['edit'])
+        self.assertEquals(6, self.batch.nb_reverted)
+        self.assertEquals(9, self.wiki.nb_undone)
+
+    def test_revert_batch_lagged(self):
+        self.wiki.lag = 10
+        task = RevertTask.objects.create(batch=self.batch, user=self.mary, comment="test")
 
+        with override_settings(MEDIAWIKI_API_URL=self.url, REVERT_DELAY=0, REVERT_MAXLAG=5,
+                REVERT_BACKOFF=0, REVERT_MAX_ATTEMPTS=2):
+            revert_batch(task.id)
 
+        # the undos are refused, so the task stops after waiting twice
+        self.assertEquals({'maxlag': 2}, self.wiki.errors)
+        self.assertEquals(0, self.wiki.nb_undone)
+        self.assertTrue(RevertTask.objects.get(id=task.id).complete)
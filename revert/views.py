@@ -4,6 +4,7 @@ from django import forms
 from django.core.exceptions import ValidationError
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -64,7 +65,7 @@ class RevertTaskView(CreateAPIView):
         task.save()
 
         from .tasks import revert_batch
-        revert_batch.apply_async(args=[task.id])
+        transaction.on_commit(lambda: revert_batch.apply_async(args=[task.id]))
 
         return redirect(form.batch.url)
 
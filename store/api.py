@@ -6,6 +6,14 @@ from django.urls import path
 urlpatterns = [
     path('b/<tool>/<uid>/', views.APIBatchView.as_view(), name='api-batch-view'),
     path('', views.APIBatchesView.as_view(), name='api-list-batches'),
+    path('b/<tool>/<uid>/stats/', views.APIBatchStatsView.as_view(), name='api-batch-stats'),
     path('b/<tool>/<uid>/edits/', views.APIBatchEditsView.as_view(), name='api-batch-edits'),
+    path('b/<tool>/<uid>/edits.<export_format>', views.BatchEditsExportView.as_view(), name='api-batch-edits-export'),
+    path('entity/<title>/', views.APIEntityView.as_view(), name='api-entity-view'),
+    path('revisions/', views.APIRevisionsBatchesView.as_view(), name='api-revisions-batches'),
+    path('stream/', views.BatchUpdatesStreamView.as_view(), name='api-batch-updates'),
+    path('status/', views.APIStatusView.as_view(), name='api-status'),
+    path('stats/daily/<by>/', views.APIDailyStatsView.as_view(), name='api-daily-stats'),
+    path('stats/batch-rows/', views.APIBatchRowCacheStatsView.as_view(), name='api-batch-row-cache-stats'),
 ]
 
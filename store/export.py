@@ -0,0 +1,64 @@
+"""
+Exports of all the edits of a batch, streamed chunk by chunk
+so that large batches are exported in constant memory.
+"""
+import csv
+
+from .renderers import FastJSONRenderer
+from .serializers import EditRowSerializer
+
+
+class Echo(object):
+    """
+    A file-like object which returns what is written to it,
+    so that the csv module can be used to build lines.
+    """
+    def write(self, value):
+        return value
+
+def iterate_edit_rows(batch, chunk_size=1000):
+    """
+    Generates the serialized edits of a batch, in chunks read in the order
+    of their ids (keyset pagination, which stays fast deep in the batch).
+    """
+    if batch.archived:
+        chunk = []
+        for edit in batch.archive.edits():
+            chunk.append(edit)
+            if len(chunk) == chunk_size:
+                yield EditRowSerializer.to_representation(chunk)
+                chunk = []
+        if chunk:
+            yield EditRowSerializer.to_representation(chunk)
+        return
+
+    edits = EditRowSerializer.values_queryset(batch.partitioned_edits).order_by('id')
+    last_id = None
+    while True:
+        chunk_edits = edits if last_id is None else edits.filter(id__gt=last_id)
+        chunk = list(chunk_edits[:chunk_size])
+        if not chunk:
+            return
+        yield EditRowSerializer.to_representation(chunk)
+        last_id = chunk[-1]['id']
+
+def ndjson_lines(rows, fields):
+    renderer = FastJSONRenderer()
+    for chunk in rows:
+        yield b''.join(
+            renderer.render({ field: row[field] for field in fields }) + b'\n'
+            for row in chunk)
+
+def csv_lines(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields).encode('utf-8')
+    for chunk in rows:
+        yield ''.join(
+            writer.writerow([row[field] for field in fields])
+            for row in chunk).encode('utf-8')
+
+#: The export formats, with their content types and line generators
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+    'csv': ('text/csv; charset=utf-8', csv_lines),
+}
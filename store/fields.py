@@ -0,0 +1,49 @@
+from django.db import models
+
+import zlib
+
+#: Preset dictionary for the compression of edit summaries.
+#: Short strings compress poorly on their own, so we prime the compressor with the
+#: fragments that appear in most of them.
+#: Changing this dictionary would make the values already stored unreadable.
+COMPRESSION_DICTIONARY = (
+    '<a href="/wiki/Q" title="Q">Q</a>, #quickstatements; '
+    '<a href="/wiki/Property:P" title="Property:P">Property:P</a>: '
+    ' description: label: Created claim: Added [en] Changed claim: '
+    '</span></span> \u200e<span dir="auto"><span class="autocomment">'
+).encode('utf-8')
+
+class CompressedTextField(models.BinaryField):
+    """
+    A text field, stored compressed in a binary column.
+
+    Values are compressed with raw deflate, primed with
+    a preset dictionary of common edit summary fragments.
+    """
+
+    def compress(self, text):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9,
+            zlib.Z_DEFAULT_STRATEGY, COMPRESSION_DICTIONARY)
+        return compressor.compress(text.encode('utf-8')) + compressor.flush()
+
+    def decompress(self, data):
+        decompressor = zlib.decompressobj(-15, COMPRESSION_DICTIONARY)
+        return (decompressor.decompress(bytes(data)) + decompressor.flush()).decode('utf-8')
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return self.decompress(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return self.decompress(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, str):
+            value = self.compress(value)
+        return super(CompressedTextField, self).get_db_prep_value(value, connection, prepared)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
@@ -0,0 +1,33 @@
+from rest_framework import filters
+from django import forms
+from django.db.models import QuerySet
+
+
+class EditFilteringForm(forms.Form):
+    action = forms.CharField(required=False)
+    language = forms.CharField(required=False)
+
+
+class EditFilterBackend(filters.BaseFilterBackend):
+    """
+    Filters the edits of a batch on the fields
+    parsed from their autocomments.
+    """
+    def filter_queryset(self, request, queryset, view):
+        form = EditFilteringForm(data=request.GET)
+        if not form.is_valid():
+            return queryset
+
+        criteria = {
+            field: value for field, value in form.cleaned_data.items() if value
+        }
+        if not criteria:
+            return queryset
+        elif isinstance(queryset, QuerySet):
+            return queryset.filter(**criteria)
+        else:
+            # archived edits
+            return [
+                edit for edit in queryset
+                if all(getattr(edit, field) == value for field, value in criteria.items())
+            ]
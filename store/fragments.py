@@ -0,0 +1,96 @@
+from hashlib import md5
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from tagging.filters import pagination_params
+
+from .utils import incr_counter
+
+
+class BatchRowCache(object):
+    """
+    Caches the rendered rows of the list of batches.
+
+    A row is identified by the id and version of its batch and by the
+    filters of the page (its links keep them), so rows are rendered
+    again only when their batch changes, whatever the page. The latest
+    edit cell, which depends on the current time, is not cached: each
+    row is stored as the cells before and after it.
+    """
+    template_name = 'store/batchrow.html'
+    separator = '<!-- latest edit -->'
+    stats_keys = {
+        'hits': 'batchrows:hits',
+        'misses': 'batchrows:misses',
+    }
+
+    def __init__(self, request, tagging_form=None):
+        self.request = request
+        self.tagging_form = tagging_form
+        params = sorted((k, v) for k, v in request.GET.lists() if k not in pagination_params)
+        self.params_key = md5(repr((request.path, params)).encode('utf-8')).hexdigest()
+
+    def key(self, batch):
+        return 'batchrow:{}:{}:{}'.format(batch['id'], batch['version'], self.params_key)
+
+    def render(self, batch):
+        html = get_template(self.template_name).render({
+            'batch': batch,
+            'request': self.request,
+            'tagging_form': self.tagging_form,
+        })
+        return tuple(html.split(self.separator, 1))
+
+    def add_cells(self, batches):
+        """
+        Adds the cached cells of each batch (as `cells`),
+        rendering and caching the missing ones.
+        """
+        keys = { batch['id']: self.key(batch) for batch in batches }
+        cached = cache.get_many(list(keys.values()))
+        missing = {}
+        for batch in batches:
+            cells = cached.get(keys[batch['id']])
+            if cells is None:
+                cells = self.render(batch)
+                missing[keys[batch['id']]] = cells
+            batch['cells'] = [mark_safe(html) for html in cells]
+
+        if missing:
+            cache.set_many(missing, settings.BATCH_ROWS_CACHE_TIMEOUT)
+        self.record(hits=len(batches) - len(missing), misses=len(missing))
+
+    @classmethod
+    def record(cls, **counts):
+        """
+        Adds the counts of a sample of the pages to the counters,
+        to keep the cache round trips off most of the pages.
+        """
+        if random.random() >= settings.BATCH_ROWS_STATS_SAMPLING:
+            return
+        for name, count in counts.items():
+            if count:
+                incr_counter(cls.stats_keys[name], count)
+
+    @classmethod
+    def stats(cls):
+        """
+        The number of rows found in the cache or rendered in the
+        sampled pages since the counters were reset, and the hit rate.
+        """
+        counts = cache.get_many(list(cls.stats_keys.values()))
+        hits = counts.get(cls.stats_keys['hits'], 0)
+        misses = counts.get(cls.stats_keys['misses'], 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else None,
+        }
+
+    @classmethod
+    def reset_stats(cls):
+        cache.delete_many(list(cls.stats_keys.values()))
@@ -0,0 +1,142 @@
+"""
+Pushes the changes of batches to the pages watching them:
+the listener publishes them on a Redis channel after each chunk
+of edits, and the pages receive them as server-sent events.
+"""
+import json
+import logging
+import time
+
+import redis
+from django.conf import settings
+from rest_framework.fields import DateTimeField
+
+logger = logging.getLogger(__name__)
+
+#: Whether the publication failures were already reported
+publication_failed = False
+#: The Redis client shared by the publications and the streams
+_client = None
+
+
+def redis_client():
+    """
+    The Redis client of this process, created on first use: its
+    connection pool is reused by all publications and streams.
+    """
+    global _client
+    if _client is None:
+        _client = redis.StrictRedis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            password=settings.REDIS_PASSWORD or None,
+            socket_connect_timeout=1)
+    return _client
+
+def batch_updates(batches, new_tags=None, reverted_ids=()):
+    """
+    Builds the changes of batches to publish.
+
+    :param batches: the batches which received new edits
+    :param new_tags: a dictionary from batch ids to the ids of their new tags
+    :param reverted_ids: the revision ids of the edits which were undone
+    :returns: a list of dictionaries, with the `full_uid` of the batch
+        and its changed fields
+    """
+    from store.models import Batch
+    from store.models import Edit
+    from tagging.models import Tag
+    from tagging.serializers import TagSerializer
+
+    new_tags = new_tags or {}
+    tag_ids = { tag_id for tag_ids in new_tags.values() for tag_id in tag_ids }
+    tags = {
+        tag.id: TagSerializer(tag).data
+        for tag in Tag.objects.filter(id__in=tag_ids)
+    }
+
+    updates = {}
+    for batch in batches:
+        update = updates.setdefault(batch.id, {'full_uid': batch.full_uid})
+        update['nb_edits'] = batch.nb_edits
+        update['ended'] = DateTimeField().to_representation(batch.ended)
+        if new_tags.get(batch.id):
+            update['tags'] = sorted(
+                (tags[tag_id] for tag_id in new_tags[batch.id] if tag_id in tags),
+                key=lambda tag: (-tag['priority'], tag['id']))
+    reverted_batch_ids = set(Edit.objects.filter(newrevid__in=reverted_ids)
+        .values_list('batch_id', flat=True)) if reverted_ids else set()
+    for batch in Batch.objects.filter(id__in=reverted_batch_ids).select_related('tool'):
+        update = updates.setdefault(batch.id, {'full_uid': batch.full_uid})
+        update['nb_reverted'] = batch.nb_reverted
+    return list(updates.values())
+
+def publish_batch_updates(*args, **kwargs):
+    """
+    Publishes the changes of batches (see :func:`batch_updates`),
+    unless no page is watching them. Failures are reported once,
+    and never interrupt the ingestion.
+    """
+    global publication_failed
+    if not settings.PUBLISH_BATCH_UPDATES:
+        return
+    try:
+        client = redis_client()
+        # the updates are only built (which takes a few queries) for subscribers
+        [(_, nb_subscribers)] = client.pubsub_numsub(settings.BATCH_UPDATES_CHANNEL)
+        if not nb_subscribers:
+            return
+        updates = batch_updates(*args, **kwargs)
+        if updates:
+            client.publish(settings.BATCH_UPDATES_CHANNEL, json.dumps(updates))
+        publication_failed = False
+    except redis.RedisError as e:
+        if not publication_failed:
+            logger.warning('Could not publish batch updates: %s', e)
+            publication_failed = True
+
+def context_processor(request):
+    """
+    Gives the URL of the event stream to the pages, when live updates are on
+    """
+    if settings.LIVE_UPDATES_URL:
+        return {'live_updates_url': settings.LIVE_UPDATES_URL}
+    return {}
+
+def batch_update_events(full_uids=None, duration=None, heartbeat=15):
+    """
+    Generates the server-sent events for the published changes of batches.
+
+    :param full_uids: the batches to follow (all of them by default)
+    :param duration: after how many seconds the stream is closed,
+        so that long-lived connections do not pile up (browsers
+        reconnect automatically)
+    :param heartbeat: how often a comment is sent when nothing changes,
+        to keep the connection open
+    """
+    duration = duration or settings.BATCH_UPDATES_STREAM_DURATION
+    deadline = time.monotonic() + duration
+    yield 'retry: 5000\n\n'
+
+    try:
+        pubsub = redis_client().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(settings.BATCH_UPDATES_CHANNEL)
+    except redis.RedisError:
+        return
+
+    try:
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=max(0, min(heartbeat, deadline - time.monotonic())))
+            if message is None:
+                yield ': heartbeat\n\n'
+                continue
+            updates = json.loads(message['data'])
+            if full_uids:
+                updates = [update for update in updates if update['full_uid'] in full_uids]
+            if updates:
+                yield 'event: batches\ndata: {}\n\n'.format(json.dumps(updates))
+    except redis.RedisError:
+        pass
+    finally:
+        pubsub.close()
@@ -0,0 +1,41 @@
+from datetime import datetime
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from pytz import UTC
+
+from store.models import Batch
+from store.models import BatchArchive
+
+
+class Command(BaseCommand):
+    help = ('Moves the edits of old batches to compressed archives, '
+            'or restores the edits of an archived batch.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=180,
+            help='archive batches which ended more than this number of days ago')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+            help='number of edits per compressed chunk')
+        parser.add_argument('--restore', metavar='TOOL/UID',
+            help='restore the edits of the given batch instead')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            tool, _, uid = options['restore'].partition('/')
+            try:
+                batch = Batch.objects.get(tool__shortid=tool, uid=uid, archived=True)
+            except Batch.DoesNotExist:
+                raise CommandError('No archived batch {}'.format(options['restore']))
+            batch.archive.restore()
+            self.stdout.write('Restored {}'.format(batch))
+            return
+
+        cutoff = datetime.now(UTC) - timedelta(days=options['days'])
+        batches = (Batch.objects.filter(archived=False, ended__lt=cutoff)
+            .exclude(revert_tasks__cancel=False, revert_tasks__complete=False)
+            .order_by('ended'))
+        for batch in batches.iterator():
+            BatchArchive.archive(batch, chunk_size=options['chunk_size'])
+            self.stdout.write('Archived {}'.format(batch))
@@ -0,0 +1,79 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from store.models import Batch
+from store.renderers import FastJSONRenderer
+from store.serializers import BatchRowSerializer
+from store.serializers import BatchSimpleSerializer
+from store.serializers import EditRowSerializer
+from store.serializers import EditSerializer
+from store.views import BatchesView
+from store.views import BatchEditsView
+
+
+class Command(BaseCommand):
+    help = ('Compares the time taken to serialize and render pages of batches '
+            'and of edits with the serializers and with the row serializers, '
+            'and times the rendering of the HTML pages.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='50,500',
+            help='comma-separated page sizes')
+        parser.add_argument('--repeat', type=int, default=10,
+            help='number of times each page is rendered')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('Invalid page sizes: {}'.format(options['sizes']))
+        self.repeat = options['repeat']
+
+        batches = Batch.objects.select_related('username', 'tool').order_by('-started')
+        largest = batches.filter(archived=False).order_by('-nb_edits').first()
+        if largest is None:
+            raise CommandError('No batch to benchmark on')
+        edits = largest.ordered_edits
+
+        for size in sizes:
+            self.compare('batches', size,
+                lambda: BatchSimpleSerializer(batches[:size], many=True).data,
+                lambda: BatchRowSerializer.to_representation(
+                    BatchRowSerializer.values_queryset(batches)[:size]))
+            self.compare('edits of {}'.format(largest.full_uid), size,
+                lambda: EditSerializer(edits[:size], many=True).data,
+                lambda: EditRowSerializer.to_representation(
+                    EditRowSerializer.values_queryset(edits)[:size]))
+
+        for size in sizes:
+            self.time_html('batches', size, BatchesView)
+            self.time_html('edits of {}'.format(largest.full_uid), size, BatchEditsView,
+                tool=largest.tool.shortid, uid=largest.uid)
+
+    def time(self, serialize, renderer):
+        start = perf_counter()
+        for i in range(self.repeat):
+            content = renderer.render(serialize())
+        return (perf_counter() - start) * 1000 / self.repeat, content
+
+    def compare(self, name, size, serialize, serialize_rows):
+        before, expected = self.time(serialize, JSONRenderer())
+        after, content = self.time(serialize_rows, FastJSONRenderer())
+        self.stdout.write('{} ({} rows): {:.1f} ms -> {:.1f} ms ({:.1f}x){}'.format(
+            name, size, before, after, before / after,
+            '' if content == expected else ', DIFFERENT OUTPUT'))
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def time_html(self, name, size, view_class, **kwargs):
+        view = view_class.as_view()
+        request = RequestFactory().get('/', {'limit': size}, HTTP_ACCEPT='text/html')
+        start = perf_counter()
+        for i in range(self.repeat):
+            view(request, **kwargs).render()
+        self.stdout.write('HTML page of {} ({} rows): {:.1f} ms'.format(
+            name, size, (perf_counter() - start) * 1000 / self.repeat))
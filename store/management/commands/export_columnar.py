@@ -0,0 +1,274 @@
+from datetime import datetime
+import json
+import os
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import models
+from pytz import UTC
+
+from store.models import Batch
+from store.models import Edit
+from tagging.models import Tag
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+#: Name of the file recording how far each table was exported
+STATE_FILE = '_export_state.json'
+
+
+def table_schemas():
+    """
+    The columns of the exported tables, with their Arrow types.
+    """
+    timestamp = pyarrow.timestamp('s', tz='UTC')
+    # precise enough to tell runs apart
+    exported = pyarrow.timestamp('us', tz='UTC')
+    return {
+        'edits': [
+            ('id', pyarrow.int64()),
+            ('batch_id', pyarrow.int64()),
+            ('oldrevid', pyarrow.int64()),
+            ('newrevid', pyarrow.int64()),
+            ('oldlength', pyarrow.int64()),
+            ('newlength', pyarrow.int64()),
+            ('timestamp', timestamp),
+            ('entity_type', pyarrow.int16()),
+            ('entity_id', pyarrow.int64()),
+            ('other_title', pyarrow.string()),
+            ('namespace', pyarrow.int32()),
+            ('comment', pyarrow.string()),
+            ('bot', pyarrow.bool_()),
+            ('minor', pyarrow.bool_()),
+            ('changetype', pyarrow.string()),
+            ('action', pyarrow.string()),
+            ('language', pyarrow.string()),
+            ('property_id', pyarrow.int64()),
+            ('target_type', pyarrow.int16()),
+            ('target_id', pyarrow.int64()),
+            ('patrolled', pyarrow.bool_()),
+            ('reverted', pyarrow.bool_()),
+            ('exported', exported),
+        ],
+        'batches': [
+            ('id', pyarrow.int64()),
+            ('tool', pyarrow.string()),
+            ('uid', pyarrow.string()),
+            ('user', pyarrow.string()),
+            ('summary', pyarrow.string()),
+            ('started', timestamp),
+            ('ended', timestamp),
+            ('nb_edits', pyarrow.int64()),
+            ('nb_reverted', pyarrow.int64()),
+            ('archived', pyarrow.bool_()),
+            ('version', pyarrow.int64()),
+            ('exported', exported),
+        ],
+        'batch_tags': [
+            ('id', pyarrow.int64()),
+            ('batch_id', pyarrow.int64()),
+            ('tag_id', pyarrow.string()),
+            ('exported', exported),
+        ],
+        'tags': [
+            ('id', pyarrow.string()),
+            ('priority', pyarrow.int64()),
+            ('color', pyarrow.string()),
+            ('rule', pyarrow.string()),
+        ],
+    }
+
+def keyset_chunks(queryset, chunk_size, last_id=None):
+    """
+    Reads the rows of a .values() queryset in chunks ordered by id,
+    starting after `last_id`: each chunk is a query on a range of
+    the primary key, however far in the table it is.
+    """
+    queryset = queryset.order_by('id')
+    while True:
+        chunk_queryset = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        chunk = list(chunk_queryset[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]['id']
+
+
+class Command(BaseCommand):
+    help = ('Exports the batches, edits and tags to Parquet files in a directory, '
+            'for offline analysis. Each run only appends the rows added or changed '
+            'since the previous one: new edits are read in the order of their ids, '
+            'and the batches which received new edits, or whose edits were undone '
+            'or tags recomputed, are exported again with their edits and tag links. '
+            'The rows have the time of their `exported` run: the latest row of each '
+            'edit and batch is current, as are the tag links of the latest run which '
+            'exported each batch. Edits and batches are partitioned by month. '
+            'Requires pyarrow.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory',
+            help='directory of the exported files (created if needed)')
+        parser.add_argument('--chunk-size', type=int, default=100000,
+            help='number of rows read at once, and written in each file')
+
+    def handle(self, *args, **options):
+        if pyarrow is None:
+            raise CommandError('pyarrow is required to export Parquet files')
+        self.directory = options['directory']
+        self.chunk_size = options['chunk_size']
+        self.schemas = table_schemas()
+        self.now = datetime.now(UTC)
+        self.run = self.now.strftime('%Y%m%dT%H%M%S%f')
+        os.makedirs(self.directory, exist_ok=True)
+        self.state = self.load_state()
+
+        changed_batch_ids = self.changed_batch_ids()
+        last_edit_id = self.state.get('edits')
+        touched_batch_ids = self.export_edits()
+        self.export_changed_edits(changed_batch_ids, last_edit_id)
+        batch_ids = self.export_batches(touched_batch_ids | changed_batch_ids)
+        self.export_batch_tags(batch_ids)
+        self.export_tags()
+        self.save_state('run', self.now.timestamp())
+
+    def load_state(self):
+        try:
+            with open(os.path.join(self.directory, STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save_state(self, table, last_id):
+        self.state[table] = last_id
+        path = os.path.join(self.directory, STATE_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.state, f)
+        os.replace(path + '.tmp', path)
+
+    def write(self, table, rows, partition=None, name=None):
+        """
+        Writes rows to a new file of a table, under the directory
+        of their partition if any. Files are renamed once complete,
+        so that readers never see a partial file.
+        """
+        directory = os.path.join(self.directory, table)
+        if partition is not None:
+            directory = os.path.join(directory, partition)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name or 'part-{}-{}.parquet'.format(self.run, rows[0]['id']))
+
+        schema = pyarrow.schema(self.schemas[table])
+        arrow_table = pyarrow.Table.from_pylist(rows, schema=schema)
+        pyarrow.parquet.write_table(arrow_table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def write_by_month(self, table, rows, field):
+        months = {}
+        for row in rows:
+            months.setdefault(row[field].strftime('month=%Y-%m'), []).append(row)
+        for month, month_rows in sorted(months.items()):
+            self.write(table, month_rows, partition=month)
+
+    def changed_batch_ids(self):
+        """
+        The ids of the batches whose edits were undone or whose
+        tags were recomputed since the previous run (see Batch.changed).
+        """
+        if 'run' not in self.state:
+            return set()
+        since = datetime.fromtimestamp(self.state['run'], UTC)
+        return set(Batch.objects.filter(changed__gte=since).values_list('id', flat=True))
+
+    def edit_fields(self):
+        return [name for name, _ in self.schemas['edits'] if name != 'exported']
+
+    def export_edits(self):
+        """
+        :returns: the ids of the batches of the new edits
+        """
+        batch_ids = set()
+        nb_rows = 0
+        for chunk in keyset_chunks(Edit.objects.values(*self.edit_fields()), self.chunk_size, self.state.get('edits')):
+            for row in chunk:
+                row['exported'] = self.now
+            self.write_by_month('edits', chunk, 'timestamp')
+            self.save_state('edits', chunk[-1]['id'])
+            batch_ids.update(row['batch_id'] for row in chunk)
+            nb_rows += len(chunk)
+        self.stdout.write('Exported {} edits'.format(nb_rows))
+        return batch_ids
+
+    def export_changed_edits(self, batch_ids, last_edit_id):
+        """
+        Exports the edits of the changed batches again (except the
+        ones exported for the first time in this run), since some
+        of them were undone.
+        """
+        if not batch_ids or last_edit_id is None:
+            return
+        edits = Edit.objects.filter(batch_id__in=batch_ids, id__lte=last_edit_id).values(*self.edit_fields())
+        nb_rows = 0
+        for chunk in keyset_chunks(edits, self.chunk_size):
+            for row in chunk:
+                row['exported'] = self.now
+            self.write_by_month('edits', chunk, 'timestamp')
+            nb_rows += len(chunk)
+        self.stdout.write('Exported {} changed edits again'.format(nb_rows))
+
+    def export_batches(self, touched_batch_ids):
+        """
+        Exports the new batches, and the given ones again, since their
+        end, number of edits or number of edits undone changed.
+
+        :returns: the ids of the exported batches
+        """
+        batches = Batch.objects.values('id', 'tool__shortid', 'uid', 'username__name',
+            'summary', 'started', 'ended', 'nb_edits', 'archived', 'version')
+        last_id = self.state.get('batches')
+        new_ids = Batch.objects.all()
+        if last_id is not None:
+            new_ids = new_ids.filter(id__gt=last_id)
+        batch_ids = sorted(touched_batch_ids.union(new_ids.values_list('id', flat=True)))
+
+        for start in range(0, len(batch_ids), self.chunk_size):
+            chunk_ids = batch_ids[start:start+self.chunk_size]
+            chunk = list(batches.filter(id__in=chunk_ids).order_by('id'))
+            nb_reverted = dict(Edit.objects.filter(batch_id__in=chunk_ids, reverted=True)
+                .values_list('batch_id').annotate(models.Count('id')).order_by())
+            for row in chunk:
+                row['tool'] = row.pop('tool__shortid')
+                row['user'] = row.pop('username__name')
+                row['nb_reverted'] = nb_reverted.get(row['id'], 0)
+                row['exported'] = self.now
+            self.write_by_month('batches', chunk, 'started')
+        if batch_ids:
+            self.save_state('batches', max(batch_ids[-1], last_id or 0))
+        self.stdout.write('Exported {} batches'.format(len(batch_ids)))
+        return batch_ids
+
+    def export_batch_tags(self, batch_ids):
+        """
+        Exports all the tag links of the exported batches, which
+        replace the ones exported for these batches before.
+        """
+        links = Tag.batches.through.objects.values('id', 'batch_id', 'tag_id')
+        nb_rows = 0
+        for start in range(0, len(batch_ids), self.chunk_size):
+            for chunk in keyset_chunks(links.filter(batch_id__in=batch_ids[start:start+self.chunk_size]), self.chunk_size):
+                for row in chunk:
+                    row['exported'] = self.now
+                self.write('batch_tags', chunk)
+                nb_rows += len(chunk)
+        self.stdout.write('Exported {} tag links'.format(nb_rows))
+
+    def export_tags(self):
+        """
+        The tags are few, so they are exported again as a whole.
+        """
+        tags = list(Tag.objects.values('id', 'priority', 'color', 'rule').order_by('id'))
+        if tags:
+            self.write('tags', tags, name='tags.parquet')
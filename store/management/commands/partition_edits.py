@@ -0,0 +1,109 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db import models
+from pytz import UTC
+
+from store.models import Batch
+from store.models import BatchArchive
+from store.models import Edit
+from store.models import EditPartition
+
+#: Name of the partition catching the edits above the last recorded partition
+OVERFLOW_PARTITION = 'pmax'
+
+
+def partition_definitions(bounds):
+    """
+    Generates the definitions of partitions of the Edit table
+    for the given upper bounds, followed by the overflow partition.
+    """
+    definitions = [
+        'PARTITION p{0} VALUES LESS THAN ({0})'.format(bound)
+        for bound in bounds
+    ]
+    definitions.append('PARTITION {} VALUES LESS THAN MAXVALUE'.format(OVERFLOW_PARTITION))
+    return ', '.join(definitions)
+
+
+class Command(BaseCommand):
+    help = ('Partitions the Edit table by ranges of ids (on MySQL), '
+            'creates partitions for the edits to come and drops old ones.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=20000000,
+            help='number of recent changes ids covered by each new partition')
+        parser.add_argument('--ahead', type=int, default=2,
+            help='number of empty partitions to keep for the edits to come')
+        parser.add_argument('--drop-before', metavar='YYYY-MM-DD',
+            help='archive the batches in partitions older than this date and drop these partitions')
+        parser.add_argument('--dry-run', action='store_true',
+            help='only print the statements which would be executed')
+
+    def execute_sql(self, sql):
+        self.stdout.write(sql)
+        if not self.dry_run:
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'mysql':
+            raise CommandError('The Edit table can only be partitioned on MySQL')
+        self.dry_run = options['dry_run']
+        self.table = Edit._meta.db_table
+        size = options['size']
+
+        ids = Edit.objects.aggregate(min_id=models.Min('id'), max_id=models.Max('id'))
+        max_edit_id = ids['max_id'] or 0
+        last_bound = (max_edit_id // size + 1 + options['ahead']) * size
+
+        partitions = list(EditPartition.objects.order_by('max_id'))
+        if not partitions:
+            # existing edits are split in partitions too
+            first_bound = ((ids['min_id'] or 0) // size + 1) * size
+            bounds = list(range(first_bound, last_bound + 1, size))
+            self.execute_sql('ALTER TABLE {} PARTITION BY RANGE (id) ({})'.format(
+                self.table, partition_definitions(bounds)))
+        else:
+            bounds = list(range(partitions[-1].max_id + size, last_bound + 1, size))
+            if bounds:
+                # the overflow partition is empty, so this is cheap
+                self.execute_sql('ALTER TABLE {} REORGANIZE PARTITION {} INTO ({})'.format(
+                    self.table, OVERFLOW_PARTITION, partition_definitions(bounds)))
+
+        if not self.dry_run:
+            for bound in bounds:
+                EditPartition.objects.create(name='p{}'.format(bound), max_id=bound)
+            for partition in EditPartition.objects.filter(complete=False, max_id__lte=max_edit_id):
+                partition.mark_complete()
+
+        if options['drop_before']:
+            try:
+                cutoff = datetime.strptime(options['drop_before'], '%Y-%m-%d').replace(tzinfo=UTC)
+            except ValueError:
+                raise CommandError('Invalid date: {}'.format(options['drop_before']))
+            self.drop_partitions(cutoff)
+
+    def drop_partitions(self, cutoff):
+        """
+        Drops the complete partitions whose edits are older than the cutoff,
+        oldest first, after archiving the batches they contain.
+        """
+        for partition in EditPartition.objects.filter(complete=True).order_by('max_id'):
+            if partition.max_timestamp is not None and partition.max_timestamp >= cutoff:
+                break
+
+            batch_ids = set(partition.edits.values_list('batch_id', flat=True).distinct())
+            batches = Batch.objects.filter(id__in=batch_ids, archived=False)
+            for batch in batches:
+                self.stdout.write('Archiving {}'.format(batch))
+                if not self.dry_run:
+                    BatchArchive.archive(batch, delete_edits=False)
+                    # the other edits of the batch are not going to be dropped
+                    Edit.objects.filter(batch=batch, id__gte=partition.max_id).delete()
+
+            self.execute_sql('ALTER TABLE {} DROP PARTITION {}'.format(self.table, partition.name))
+            if not self.dry_run:
+                partition.delete()
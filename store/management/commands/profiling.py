@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from editgroups.profiling import profiling_enabled
+from editgroups.profiling import switch_profiling
+
+
+class Command(BaseCommand):
+    help = ('Switches the profiling of the views and tasks on or off '
+            'in all the processes (see editgroups.profiling).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('state', choices=['on', 'off', 'status'])
+        parser.add_argument('--minutes', type=int, default=60,
+            help='switch profiling off after this number of minutes (0 to keep it on)')
+
+    def handle(self, *args, **options):
+        if options['state'] != 'status':
+            switch_profiling(options['state'] == 'on', options['minutes'] * 60 or None)
+        self.stdout.write('Profiling is {}'.format('on' if profiling_enabled() else 'off'))
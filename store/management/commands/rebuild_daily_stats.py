@@ -0,0 +1,45 @@
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import models
+
+from store.models import Batch
+from store.models import DailyToolStats
+from store.models import DailyUserStats
+from store.models import DailyTagStats
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the daily rollups of edits per tool, user and tag '
+            'from the edits and batches, for instance to fill them for the '
+            'first time. Archived edits are not counted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', metavar='YYYY-MM-DD',
+            help='first day to recompute (the start of the first batch by default)')
+        parser.add_argument('--step', type=int, default=7,
+            help='number of days recomputed at once')
+
+    def handle(self, *args, **options):
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Invalid date: {}'.format(options['since']))
+        else:
+            first = Batch.objects.aggregate(first=models.Min('started'))['first']
+            if first is None:
+                return
+            since = first.date()
+
+        end = date.today() + timedelta(days=1)
+        step = timedelta(days=options['step'])
+        while since < end:
+            until = min(since + step, end)
+            for model in (DailyToolStats, DailyUserStats, DailyTagStats):
+                model.reconcile(since, until)
+            self.stdout.write('Recomputed the rollups until {}'.format(until - timedelta(days=1)))
+            since = until
@@ -0,0 +1,87 @@
+from django.db import migrations, models
+from django.db import transaction
+from django_bulk_update.helper import bulk_update
+from urllib.parse import quote
+import store.fields
+
+CHUNK_SIZE = 10000
+
+def convert_in_chunks(apps, source, target):
+    """
+    Copies one column of the Edit table to another one,
+    in chunks of consecutive ids, so that the table is never
+    locked for too long.
+    """
+    Edit = apps.get_model('store', 'Edit')
+    last_id = -1
+    while True:
+        with transaction.atomic():
+            edits = list(Edit.objects.filter(id__gt=last_id)
+                .order_by('id').only('id', source)[:CHUNK_SIZE])
+            if not edits:
+                break
+            for edit in edits:
+                setattr(edit, target, getattr(edit, source))
+            bulk_update(edits, update_fields=[target])
+            last_id = edits[-1].id
+
+def compress_parsedcomments(apps, schema_editor):
+    convert_in_chunks(apps, 'parsedcomment', 'compressed_parsedcomment')
+
+def decompress_parsedcomments(apps, schema_editor):
+    convert_in_chunks(apps, 'compressed_parsedcomment', 'parsedcomment')
+
+def restore_uris(apps, schema_editor):
+    Edit = apps.get_model('store', 'Edit')
+    for edit in Edit.objects.only('id', 'title').iterator():
+        Edit.objects.filter(id=edit.id).update(
+            uri='https://www.wikidata.org/wiki/' + quote(edit.title.replace(' ', '_'), safe=';:@$!*(),/~'))
+
+def do_nothing(apps, schema_editor):
+    pass
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0005_add_editgroups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='edit',
+            name='compressed_parsedcomment',
+            field=store.fields.CompressedTextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='edit',
+            name='parsedcomment',
+            field=models.TextField(null=True),
+        ),
+        migrations.RunPython(compress_parsedcomments, decompress_parsedcomments),
+        migrations.RemoveField(
+            model_name='edit',
+            name='parsedcomment',
+        ),
+        migrations.RenameField(
+            model_name='edit',
+            old_name='compressed_parsedcomment',
+            new_name='parsedcomment',
+        ),
+        migrations.AlterField(
+            model_name='edit',
+            name='parsedcomment',
+            field=store.fields.CompressedTextField(),
+        ),
+        # the URI is now derived from the title
+        migrations.AlterField(
+            model_name='edit',
+            name='uri',
+            field=models.CharField(max_length=190, null=True),
+        ),
+        migrations.RunPython(do_nothing, restore_uris),
+        migrations.RemoveField(
+            model_name='edit',
+            name='uri',
+        ),
+    ]
@@ -0,0 +1,178 @@
+from django.db import migrations, models
+from django.db import transaction
+from django_bulk_update.helper import bulk_update
+import django.db.models.deletion
+import re
+
+CHUNK_SIZE = 10000
+
+# Frozen copy of store.models.ENTITY_TITLE_PREFIXES
+ENTITY_TITLE_PREFIXES = {
+    1: 'Q',
+    2: 'Property:P',
+    3: 'Lexeme:L',
+}
+entity_title_re = re.compile(r'^(Q|Property:P|Lexeme:L)([1-9]\d*)$')
+entity_types = { prefix: entity_type for entity_type, prefix in ENTITY_TITLE_PREFIXES.items() }
+
+def iterate_in_chunks(model, fields):
+    """
+    Iterates over all the rows of a table in chunks of
+    consecutive ids, each of them in its own transaction.
+    """
+    last_id = -1
+    while True:
+        with transaction.atomic():
+            objects = list(model.objects.filter(id__gt=last_id)
+                .order_by('id').only('id', *fields)[:CHUNK_SIZE])
+            if not objects:
+                break
+            yield objects
+            last_id = objects[-1].id
+
+def use_binary_collation(apps, schema_editor):
+    # the default collation of MySQL would consider distinct
+    # user names such as "José" and "Jose" to be the same
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE store_username MODIFY name '
+            'VARCHAR(190) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL')
+
+def intern_users(Username, names):
+    ids = dict(Username.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = set(names) - set(ids)
+    Username.objects.bulk_create([Username(name=name) for name in missing])
+    ids.update(Username.objects.filter(name__in=missing).values_list('name', 'id'))
+    return ids
+
+def intern_titles_and_users(apps, schema_editor):
+    Username = apps.get_model('store', 'Username')
+    Batch = apps.get_model('store', 'Batch')
+    Edit = apps.get_model('store', 'Edit')
+
+    for batches in iterate_in_chunks(Batch, ['user']):
+        user_ids = intern_users(Username, {batch.user for batch in batches})
+        for batch in batches:
+            batch.username_id = user_ids[batch.user]
+        bulk_update(batches, update_fields=['username'])
+
+    for edits in iterate_in_chunks(Edit, ['user', 'title']):
+        user_ids = intern_users(Username, {edit.user for edit in edits})
+        for edit in edits:
+            edit.username_id = user_ids[edit.user]
+            match = entity_title_re.match(edit.title)
+            if match:
+                edit.entity_type = entity_types[match.group(1)]
+                edit.entity_id = int(match.group(2))
+            else:
+                edit.other_title = edit.title
+        bulk_update(edits, update_fields=['username', 'entity_type', 'entity_id', 'other_title'])
+
+def restore_titles_and_users(apps, schema_editor):
+    Username = apps.get_model('store', 'Username')
+    Batch = apps.get_model('store', 'Batch')
+    Edit = apps.get_model('store', 'Edit')
+    names = dict(Username.objects.values_list('id', 'name'))
+
+    for batches in iterate_in_chunks(Batch, ['username']):
+        for batch in batches:
+            batch.user = names[batch.username_id]
+        bulk_update(batches, update_fields=['user'])
+
+    for edits in iterate_in_chunks(Edit, ['username', 'entity_type', 'entity_id', 'other_title']):
+        for edit in edits:
+            edit.user = names[edit.username_id]
+            if edit.entity_type is None:
+                edit.title = edit.other_title
+            else:
+                edit.title = ENTITY_TITLE_PREFIXES[edit.entity_type] + str(edit.entity_id)
+        bulk_update(edits, update_fields=['user', 'title'])
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0006_compact_edits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Username',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=190, unique=True)),
+            ],
+        ),
+        migrations.RunPython(use_binary_collation, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='batch',
+            name='username',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='batches', to='store.Username'),
+        ),
+        migrations.AddField(
+            model_name='edit',
+            name='username',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='edits', to='store.Username'),
+        ),
+        migrations.AddField(
+            model_name='edit',
+            name='entity_type',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='edit',
+            name='entity_id',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='edit',
+            name='other_title',
+            field=models.CharField(max_length=190, null=True),
+        ),
+        # make the old columns nullable so that they can be restored when migrating backwards
+        migrations.AlterField(
+            model_name='batch',
+            name='user',
+            field=models.CharField(max_length=190, null=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='edit',
+            name='user',
+            field=models.CharField(max_length=190, null=True),
+        ),
+        migrations.AlterField(
+            model_name='edit',
+            name='title',
+            field=models.CharField(max_length=190, null=True),
+        ),
+        migrations.RunPython(intern_titles_and_users, restore_titles_and_users),
+        migrations.AlterField(
+            model_name='batch',
+            name='username',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='batches', to='store.Username'),
+        ),
+        migrations.AlterField(
+            model_name='edit',
+            name='username',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='edits', to='store.Username'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='batch',
+            unique_together={('tool', 'uid', 'username')},
+        ),
+        migrations.RemoveField(
+            model_name='batch',
+            name='user',
+        ),
+        migrations.RemoveField(
+            model_name='edit',
+            name='user',
+        ),
+        migrations.RemoveField(
+            model_name='edit',
+            name='title',
+        ),
+        migrations.AddIndex(
+            model_name='edit',
+            index=models.Index(fields=['batch', 'entity_type', 'entity_id'], name='store_edit_batch_i_fd5a49_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+import store.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_intern_titles_and_users'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='BatchArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archived_on', models.DateTimeField(auto_now_add=True)),
+                ('chunk_size', models.IntegerField(default=1000)),
+                ('nb_archived_edits', models.IntegerField()),
+                ('nb_reverted', models.IntegerField()),
+                ('nb_pages', models.IntegerField()),
+                ('nb_new_pages', models.IntegerField()),
+                ('avg_diffsize', models.FloatField(null=True)),
+                ('batch', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='store.Batch')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EditArchiveChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('edits', store.fields.CompressedTextField()),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='store.BatchArchive')),
+            ],
+            options={
+                'unique_together': {('archive', 'index')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:50
+
+import caching.base
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_batch_archives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EditPartition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+                ('max_id', models.BigIntegerField(unique=True)),
+                ('complete', models.BooleanField(default=False)),
+                ('min_timestamp', models.DateTimeField(null=True)),
+                ('max_timestamp', models.DateTimeField(null=True)),
+            ],
+            bases=(caching.base.CachingMixin, models.Model),
+        ),
+        migrations.AlterField(
+            model_name='edit',
+            name='batch',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='edits', to='store.Batch'),
+        ),
+        migrations.AlterField(
+            model_name='edit',
+            name='username',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='edits', to='store.Username'),
+        ),
+    ]
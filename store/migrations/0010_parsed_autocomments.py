@@ -0,0 +1,91 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:56
+
+from django.db import migrations, models
+from django.db import transaction
+from django_bulk_update.helper import bulk_update
+import re
+
+CHUNK_SIZE = 10000
+
+# Frozen copy of store.models.parse_autocomment
+entity_types = {'Q': 1, 'Property:P': 2, 'Lexeme:L': 3}
+autocomment_re = re.compile(r'^/\* ([a-z\-]+):(.*?) \*/')
+language_args_re = re.compile(r'^\d+\|([a-z\-]+)$')
+claim_re = re.compile(r'\[\[Property:P([1-9]\d*)\]\](?:: \[\[(Q|Property:P|Lexeme:L)([1-9]\d*)\]\])?')
+
+def parse_autocomments(apps, schema_editor):
+    """
+    Parses the comments of the existing edits, in chunks
+    of consecutive ids, each in its own transaction.
+    """
+    Edit = apps.get_model('store', 'Edit')
+    last_id = -1
+    while True:
+        with transaction.atomic():
+            edits = list(Edit.objects.filter(id__gt=last_id)
+                .order_by('id').only('id', 'comment')[:CHUNK_SIZE])
+            if not edits:
+                break
+            for edit in edits:
+                match = autocomment_re.match(edit.comment)
+                if match:
+                    edit.action = match.group(1)[:64]
+                    language_match = language_args_re.match(match.group(2))
+                    if edit.action.startswith('wb') and language_match:
+                        edit.language = language_match.group(1)[:32]
+                claim_match = claim_re.search(edit.comment)
+                if claim_match:
+                    edit.property_id = int(claim_match.group(1))
+                    if claim_match.group(2):
+                        edit.target_type = entity_types[claim_match.group(2)]
+                        edit.target_id = int(claim_match.group(3))
+            bulk_update(edits, update_fields=['action', 'language', 'property_id', 'target_type', 'target_id'])
+            last_id = edits[-1].id
+
+def do_nothing(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0009_edit_partitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='edit',
+            name='action',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='edit',
+            name='language',
+            field=models.CharField(max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='edit',
+            name='property_id',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='edit',
+            name='target_id',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='edit',
+            name='target_type',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.RunPython(parse_autocomments, do_nothing),
+        migrations.AddIndex(
+            model_name='edit',
+            index=models.Index(fields=['action', 'batch'], name='store_edit_action_9f3a37_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='edit',
+            index=models.Index(fields=['property_id', 'batch'], name='store_edit_propert_c4cf58_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:57
+
+from django.db import migrations, models
+from django.db import transaction
+from collections import Counter
+import json
+import re
+import django.db.models.deletion
+
+CHUNK_SIZE = 1000
+
+# Frozen copy of store.models.claim_re
+claim_re = re.compile(r'\[\[Property:P([1-9]\d*)\]\]')
+
+def index_properties(apps, schema_editor):
+    """
+    Counts the properties of the edits of existing batches,
+    in chunks of consecutive batch ids.
+    """
+    Batch = apps.get_model('store', 'Batch')
+    Edit = apps.get_model('store', 'Edit')
+    EditArchiveChunk = apps.get_model('store', 'EditArchiveChunk')
+    BatchProperty = apps.get_model('store', 'BatchProperty')
+    last_id = -1
+    while True:
+        with transaction.atomic():
+            batches = list(Batch.objects.filter(id__gt=last_id)
+                .order_by('id').values_list('id', 'archived')[:CHUNK_SIZE])
+            if not batches:
+                break
+            counts = Counter()
+            rows = (Edit.objects.filter(batch_id__in=[batch_id for batch_id, _ in batches])
+                .exclude(property_id=None)
+                .values('batch_id', 'property_id')
+                .annotate(nb_edits=models.Count('id')))
+            for row in rows:
+                counts[(row['batch_id'], row['property_id'])] += row['nb_edits']
+            archived = [batch_id for batch_id, is_archived in batches if is_archived]
+            for chunk in EditArchiveChunk.objects.filter(archive__batch_id__in=archived).select_related('archive'):
+                for edit in json.loads(chunk.edits):
+                    match = claim_re.search(edit['comment'])
+                    if match:
+                        counts[(chunk.archive.batch_id, int(match.group(1)))] += 1
+            BatchProperty.objects.bulk_create([
+                BatchProperty(batch_id=batch_id, property_id=property_id, nb_edits=nb_edits)
+                for (batch_id, property_id), nb_edits in counts.items()
+            ])
+            last_id = batches[-1][0]
+
+def do_nothing(apps, schema_editor):
+    pass
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0010_parsed_autocomments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchProperty',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('property_id', models.PositiveIntegerField()),
+                ('nb_edits', models.IntegerField(default=0)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='properties', to='store.Batch')),
+            ],
+            options={
+                'unique_together': {('property_id', 'batch')},
+            },
+        ),
+        migrations.RunPython(index_properties, do_nothing),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_batch_properties'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='edit',
+            index=models.Index(fields=['entity_type', 'entity_id', 'timestamp'], name='store_edit_entity__4f5c64_idx'),
+        ),
+    ]
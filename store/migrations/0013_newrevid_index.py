@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-19 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_entity_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='edit',
+            index=models.Index(fields=['newrevid'], name='store_edit_newrevi_630ea3_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_newrevid_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
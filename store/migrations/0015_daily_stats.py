@@ -0,0 +1,60 @@
+# Generated by Django 2.2.28 on 2026-10-19 17:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagging', '0004_tag_rules'),
+        ('store', '0014_batch_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUserStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('nb_edits', models.IntegerField(default=0)),
+                ('nb_batches', models.IntegerField(default=0)),
+                ('nb_reverted', models.IntegerField(default=0)),
+                ('nb_new_pages', models.IntegerField(default=0)),
+                ('username', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.Username')),
+            ],
+            options={
+                'unique_together': {('day', 'username')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyToolStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('nb_edits', models.IntegerField(default=0)),
+                ('nb_batches', models.IntegerField(default=0)),
+                ('nb_reverted', models.IntegerField(default=0)),
+                ('nb_new_pages', models.IntegerField(default=0)),
+                ('tool', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.Tool')),
+            ],
+            options={
+                'unique_together': {('day', 'tool')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyTagStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('nb_edits', models.IntegerField(default=0)),
+                ('nb_batches', models.IntegerField(default=0)),
+                ('nb_reverted', models.IntegerField(default=0)),
+                ('nb_new_pages', models.IntegerField(default=0)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tagging.Tag')),
+            ],
+            options={
+                'unique_together': {('day', 'tag')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-19 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionStatus',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_timestamp', models.DateTimeField()),
+                ('committed', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-19 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_ingestion_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='batch',
+            index=models.Index(fields=['started'], name='store_batch_started_36ce55_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='batch',
+            index=models.Index(fields=['tool', 'started'], name='store_batch_tool_id_cf723d_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_batch_started_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='changed',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def use_binary_collation(apps, schema_editor):
+    # same as in 0007, for the databases which were migrated before it did this
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE store_username MODIFY name '
+            'VARCHAR(190) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_batch_changed'),
+    ]
+
+    operations = [
+        migrations.RunPython(use_binary_collation, migrations.RunPython.noop),
+    ]
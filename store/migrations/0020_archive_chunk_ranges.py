@@ -0,0 +1,53 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:15
+
+from django.db import migrations, models
+import json
+
+def compute_ranges(apps, schema_editor):
+    EditArchiveChunk = apps.get_model('store', 'EditArchiveChunk')
+    for chunk in EditArchiveChunk.objects.only('id', 'edits').iterator():
+        edits = json.loads(chunk.edits)
+        ranges = {}
+        for field in ('id', 'newrevid'):
+            values = [edit[field] for edit in edits]
+            ranges['min_'+field] = min(values, default=None)
+            ranges['max_'+field] = max(values, default=None)
+        EditArchiveChunk.objects.filter(id=chunk.id).update(**ranges)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_username_binary_collation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='editarchivechunk',
+            name='max_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='editarchivechunk',
+            name='max_newrevid',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='editarchivechunk',
+            name='min_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='editarchivechunk',
+            name='min_newrevid',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='editarchivechunk',
+            index=models.Index(fields=['min_id', 'max_id'], name='store_edita_min_id_6ed189_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='editarchivechunk',
+            index=models.Index(fields=['min_newrevid', 'max_newrevid'], name='store_edita_min_new_8ffd80_idx'),
+        ),
+        migrations.RunPython(compute_ranges, migrations.RunPython.noop),
+    ]
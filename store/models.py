@@ -1,22 +1,180 @@
+from django.conf import settings
 from django.db import models
 from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Cast
 from django.db.utils import IntegrityError
 from django.core.exceptions import ObjectDoesNotExist
 from django.urls import reverse
-from django_bulk_update.manager import BulkUpdateManager
+from django_bulk_update.query import BulkUpdateQuerySet
 from caching.base import CachingManager, CachingMixin
 from collections import namedtuple
 from cached_property import cached_property
 from collections import defaultdict
+from collections import Counter
 
 import re
 import json
+from urllib.parse import quote
 from pytz import UTC
 from datetime import datetime
+from datetime import timedelta
 from .utils import grouper
+from .fields import CompressedTextField
+from .live import publish_batch_updates
+from .stats import schedule_batch_stats
 
 MAX_CHARFIELD_LENGTH = 190
 
+#: Prefixes of the titles of Wikibase entity pages,
+#: indexed by the entity type codes we store
+ENTITY_TITLE_PREFIXES = {
+    1: 'Q',
+    2: 'Property:P',
+    3: 'Lexeme:L',
+}
+entity_title_re = re.compile(r'^(Q|Property:P|Lexeme:L)([1-9]\d*)$')
+entity_types = { prefix: entity_type for entity_type, prefix in ENTITY_TITLE_PREFIXES.items() }
+
+def parse_title(title):
+    """
+    Splits a page title into an entity type and a numeric id
+    if it is the title of a Wikibase entity.
+
+    :returns: a triple (entity_type, entity_id, other_title): only
+        the first two are set for entity pages, only the last one
+        for other pages
+    """
+    match = entity_title_re.match(title)
+    if match:
+        return (entity_types[match.group(1)], int(match.group(2)), None)
+    return (None, None, title[:MAX_CHARFIELD_LENGTH])
+
+def title_lookup(titles):
+    """
+    Builds the lookup matching the edits on any of the given pages,
+    from the compact representation of their titles.
+    """
+    entity_ids = defaultdict(list)
+    other_titles = []
+    for title in titles:
+        entity_type, entity_id, other_title = parse_title(title)
+        if entity_type is None:
+            other_titles.append(other_title)
+        else:
+            entity_ids[entity_type].append(entity_id)
+    lookup = Q(other_title__in=other_titles)
+    for entity_type, ids in entity_ids.items():
+        lookup |= Q(entity_type=entity_type, entity_id__in=ids)
+    return lookup
+
+def user_lookup(names):
+    """
+    Builds the lookup matching the rows made by any of the given users.
+    """
+    return Q(username__name__in=[name[:MAX_CHARFIELD_LENGTH] for name in names])
+
+class CompactLookupsMixin(object):
+    """
+    Translates the lookups on the titles and user names, which are
+    stored in a compact form (see :func:`parse_title` and :class:`Username`),
+    so that `filter(user=...)`, `exclude(title__in=...)` or `get(title=...)`
+    keep working. Only the exact and `__in` lookups passed as keyword
+    arguments are translated, not the ones nested in Q objects.
+    """
+    #: name of the lookup -> function building it from a list of values
+    compact_lookups = {}
+
+    def _filter_or_exclude(self, negate, *args, **kwargs):
+        args = list(args)
+        for key in list(kwargs):
+            name, _, suffix = key.partition('__')
+            if name in self.compact_lookups and suffix in ('', 'in'):
+                value = kwargs.pop(key)
+                args.append(self.compact_lookups[name](value if suffix else [value]))
+        return super(CompactLookupsMixin, self)._filter_or_exclude(negate, *args, **kwargs)
+
+class BatchQuerySet(CompactLookupsMixin, BulkUpdateQuerySet):
+    compact_lookups = {'user': user_lookup}
+
+class EditQuerySet(CompactLookupsMixin, models.QuerySet):
+    compact_lookups = {'user': user_lookup, 'title': title_lookup}
+
+autocomment_re = re.compile(r'^/\* ([a-z\-]+):(.*?) \*/')
+language_args_re = re.compile(r'^\d+\|([a-z\-]+)$')
+undo_args_re = re.compile(r'^0\|\|(\d+)\|')
+claim_re = re.compile(r'\[\[Property:P([1-9]\d*)\]\](?:: \[\[(Q|Property:P|Lexeme:L)([1-9]\d*)\]\])?')
+
+Autocomment = namedtuple('Autocomment', 'action language property_id target_type target_id reverted_revid')
+
+def parse_autocomment(comment):
+    """
+    Parses an edit summary starting with an autocomment, such as
+    `/* wbsetclaim-create:2||1 */ [[Property:P1297]]: [[Q5]], #quickstatements`.
+
+    :returns: an Autocomment named tuple, with the action (`wbsetclaim-create`),
+        the language of the terms edited, the first property mentioned (`1297`),
+        its value when it is an entity (`(1, 5)`, as returned by :func:`parse_title`)
+        and the revision undone, if any. They are all None when they do not apply.
+    """
+    action = language = property_id = target_type = target_id = reverted_revid = None
+    match = autocomment_re.match(comment)
+    if match:
+        action, args = match.group(1)[:64], match.group(2)
+        if action.startswith('wb'):
+            language_match = language_args_re.match(args)
+            if language_match:
+                language = language_match.group(1)[:32]
+        elif action == 'undo':
+            undo_match = undo_args_re.match(args)
+            if undo_match:
+                reverted_revid = int(undo_match.group(1))
+
+    claim_match = claim_re.search(comment)
+    if claim_match:
+        property_id = int(claim_match.group(1))
+        if claim_match.group(2):
+            target_type = entity_types[claim_match.group(2)]
+            target_id = int(claim_match.group(3))
+
+    return Autocomment(action, language, property_id, target_type, target_id, reverted_revid)
+
+class Username(models.Model):
+    """
+    A Wikidata user name, stored only once and referred
+    to by integer keys from batches and edits.
+
+    Names are compared exactly: on MySQL the column uses a binary
+    collation (see migration 0019), as the default one would
+    consider names like "José" and "Jose" to be the same.
+    """
+    name = models.CharField(max_length=MAX_CHARFIELD_LENGTH, unique=True)
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def intern(cls, names):
+        """
+        Fetches the ids of the supplied user names,
+        creating the missing ones (in one query).
+
+        :returns: a dictionary from the supplied names to their ids
+        """
+        truncated = { name: name[:MAX_CHARFIELD_LENGTH] for name in names }
+        ids = dict(cls.objects.filter(name__in=set(truncated.values())).values_list('name', 'id'))
+        missing = set(truncated.values()) - set(ids)
+        if missing:
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create([cls(name=name) for name in missing])
+            except IntegrityError:
+                # someone else created some of them in the meantime
+                for name in missing:
+                    cls.objects.get_or_create(name=name)
+            ids.update(cls.objects.filter(name__in=missing).values_list('name', 'id'))
+        return { name: ids[truncated_name] for name, truncated_name in truncated.items() }
+
 class Tool(CachingMixin, models.Model):
     """
     A tool, making edits with some ids in the edit summaries
@@ -78,23 +236,40 @@ class Batch(models.Model):
     """
     A group of edits
     """
-    objects = BulkUpdateManager()
+    objects = BatchQuerySet.as_manager()
 
     tool = models.ForeignKey(Tool, on_delete=models.CASCADE)
-    user = models.CharField(max_length=MAX_CHARFIELD_LENGTH, db_index=True)
+    username = models.ForeignKey(Username, on_delete=models.PROTECT, related_name='batches')
     uid = models.CharField(max_length=MAX_CHARFIELD_LENGTH, db_index=True)
 
     summary = models.CharField(max_length=MAX_CHARFIELD_LENGTH)
     started = models.DateTimeField()
     ended = models.DateTimeField()
     nb_edits = models.IntegerField()
+    #: The edits have been moved to a BatchArchive
+    archived = models.BooleanField(default=False)
+    #: Incremented whenever new edits or tags are added to the batch,
+    #: so that its cached renderings can be told apart
+    version = models.PositiveIntegerField(default=0)
+    #: When edits of the batch were last undone or its tags recomputed,
+    #: so that the exports can update the rows they wrote before
+    changed = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
-        unique_together = (('tool','uid','user'))
+        unique_together = (('tool','uid','username'))
+        indexes = [
+            # used to list the latest batches, for all tools or for one of them
+            models.Index(fields=['started']),
+            models.Index(fields=['tool', 'started']),
+        ]
 
     def __str__(self):
         return '<Batch {}:{} by {}>'.format(self.tool.shortid, self.uid, self.user)
 
+    @property
+    def user(self):
+        return self.username.name
+
     @property
     def full_uid(self):
         return self.tool.shortid+'/'+self.uid
@@ -119,11 +294,14 @@ class Batch(models.Model):
 
     @property
     def nb_reverted(self):
-        return self.edits.filter(reverted=True).count()
+        if self.archived:
+            return self.archive.nb_reverted
+        return self.partitioned_edits.filter(reverted=True).count()
 
     @cached_property
     def revertable_edits(self):
-        return self.edits.filter(reverted=False, oldrevid__gt=0)
+        # archived edits are too old to be reverted
+        return self.partitioned_edits.filter(reverted=False, oldrevid__gt=0)
 
     @cached_property
     def active_revert_task(self):
@@ -143,11 +321,15 @@ class Batch(models.Model):
 
     @cached_property
     def nb_pages(self):
-        return self.edits.all().values('title').distinct().count()
+        if self.archived:
+            return self.archive.nb_pages
+        return self.partitioned_edits.values('entity_type', 'entity_id', 'other_title').distinct().count()
 
     @cached_property
     def nb_new_pages(self):
-        return self.edits.all().filter(oldrevid=0).count()
+        if self.archived:
+            return self.archive.nb_new_pages
+        return self.partitioned_edits.filter(oldrevid=0).count()
 
     @property
     def nb_existing_pages(self):
@@ -155,7 +337,31 @@ class Batch(models.Model):
 
     @property
     def avg_diffsize(self):
-        return self.edits.all().aggregate(avg_diff=models.Avg('newlength')-models.Avg('oldlength')).get('avg_diff')
+        if self.archived:
+            return self.archive.avg_diffsize
+        return self.partitioned_edits.aggregate(avg_diff=models.Avg('newlength')-models.Avg('oldlength')).get('avg_diff')
+
+    @property
+    def ordered_edits(self):
+        """
+        The edits of the batch, most recent first, whether
+        they are archived or not.
+        """
+        if self.archived:
+            return self.archive.edits()
+        return self.partitioned_edits.select_related('username').order_by('-timestamp', '-id')
+
+    @property
+    def partitioned_edits(self):
+        """
+        The edits of the batch, restricted to the partitions of
+        the Edit table which can contain them (see EditPartition).
+        """
+        return self.edits.filter(self.partition_bounds)
+
+    @cached_property
+    def partition_bounds(self):
+        return EditPartition.bounds(self.started, self.ended)
 
     @property
     def url(self):
@@ -175,28 +381,68 @@ class Edit(models.Model):
     """
     A wikidata edit as returned by the Event Stream API
     """
+    objects = EditQuerySet.as_manager()
+
     id = models.IntegerField(unique=True, primary_key=True)
     oldrevid = models.IntegerField(null=True)
     newrevid = models.IntegerField()
     oldlength = models.IntegerField()
     newlength = models.IntegerField()
     timestamp = models.DateTimeField()
-    title = models.CharField(max_length=MAX_CHARFIELD_LENGTH)
+    # The title is stored as (entity_type, entity_id) for entities, in other_title otherwise
+    entity_type = models.PositiveSmallIntegerField(null=True)
+    entity_id = models.PositiveIntegerField(null=True)
+    other_title = models.CharField(max_length=MAX_CHARFIELD_LENGTH, null=True)
     namespace = models.IntegerField()
-    uri = models.CharField(max_length=MAX_CHARFIELD_LENGTH)
     comment = models.TextField()
-    parsedcomment = models.TextField()
+    parsedcomment = CompressedTextField()
     bot = models.BooleanField()
     minor = models.BooleanField()
     changetype = models.CharField(max_length=32)
-    user = models.CharField(max_length=MAX_CHARFIELD_LENGTH)
+    # Parsed from the autocomment of the comment (see parse_autocomment)
+    action = models.CharField(max_length=64, null=True)
+    language = models.CharField(max_length=32, null=True)
+    property_id = models.PositiveIntegerField(null=True)
+    target_type = models.PositiveSmallIntegerField(null=True)
+    target_id = models.PositiveIntegerField(null=True)
+    # MySQL does not support foreign key constraints on partitioned tables
+    username = models.ForeignKey(Username, on_delete=models.PROTECT, related_name='edits', db_constraint=False)
     patrolled = models.BooleanField()
 
     # Inferred by us
-    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='edits')
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='edits', db_constraint=False)
     reverted = models.BooleanField(default=False)
 
-    reverted_re = re.compile(r'^/\* undo:0\|\|(\d+)\|')
+    class Meta:
+        indexes = [
+            # used to count the distinct pages edited by a batch
+            models.Index(fields=['batch', 'entity_type', 'entity_id']),
+            # used to find the edits on a given entity
+            models.Index(fields=['entity_type', 'entity_id', 'timestamp']),
+            # used to find the batches of given revisions
+            models.Index(fields=['newrevid']),
+            # used to find the edits and batches by action or property
+            models.Index(fields=['action', 'batch']),
+            models.Index(fields=['property_id', 'batch']),
+        ]
+
+    @property
+    def title(self):
+        if self.entity_type is None:
+            return self.other_title
+        return ENTITY_TITLE_PREFIXES[self.entity_type] + str(self.entity_id)
+
+    @title.setter
+    def title(self, title):
+        self.entity_type, self.entity_id, self.other_title = parse_title(title)
+
+    @property
+    def user(self):
+        return self.username.name
+
+    @property
+    def uri(self):
+        return 'https://www.wikidata.org/wiki/' + quote(self.title.replace(' ', '_'), safe=';:@$!*(),/~')
 
     @property
     def url(self):
@@ -210,49 +456,69 @@ class Edit(models.Model):
         return '<Edit {} >'.format(self.url)
 
     @classmethod
-    def from_json(cls, json_edit, batch):
+    def from_json(cls, json_edit, batch, user_ids=None, autocomment=None):
         """
         Creates an edit from json, without saving it
+
+        :param user_ids: a dictionary from user names to their ids,
+            as returned by :meth:`Username.intern`
+        :param autocomment: the result of :func:`parse_autocomment`
+            on the comment, if it has been parsed already
         """
-        return cls(
+        if user_ids is None:
+            user_ids = Username.intern([json_edit['user']])
+        edit = cls(
             id = json_edit['id'],
             oldrevid = json_edit['revision'].get('old') or 0,
             newrevid = json_edit['revision']['new'],
             oldlength = json_edit['length'].get('old') or 0,
             newlength = json_edit['length']['new'],
             timestamp = datetime.fromtimestamp(json_edit['timestamp'], tz=UTC),
-            title = json_edit['title'][:MAX_CHARFIELD_LENGTH],
+            title = json_edit['title'],
             namespace = json_edit['namespace'],
-            uri = json_edit['meta']['uri'][:MAX_CHARFIELD_LENGTH],
             comment = json_edit['comment'],
             parsedcomment = json_edit['parsedcomment'],
             bot = json_edit['bot'],
             minor = json_edit['minor'],
             changetype = json_edit['type'],
-            user = json_edit['user'][:MAX_CHARFIELD_LENGTH],
+            username_id = user_ids[json_edit['user']],
             patrolled = json_edit['patrolled'],
             batch = batch,
             reverted = False)
+        edit.set_autocomment(autocomment or parse_autocomment(edit.comment))
+        return edit
+
+    def set_autocomment(self, autocomment):
+        """
+        Sets the fields parsed from the comment
+        """
+        self.action = autocomment.action
+        self.language = autocomment.language
+        self.property_id = autocomment.property_id
+        self.target_type = autocomment.target_type
+        self.target_id = autocomment.target_id
 
     @classmethod
     def ingest_edits(cls, json_batch):
         # Map from (toolid, uid, user) to Batch object
         batches = {}
         model_edits = []
+        saved_edits = []
+        new_batches = []
         reverted_ids = []
         new_tags = defaultdict(set)
 
         tools = Tool.objects.all()
 
+        matches = []
         for edit_json in json_batch:
             if not edit_json:
                 continue
-            timestamp = datetime.fromtimestamp(edit_json['timestamp'], tz=UTC)
 
             # First, check if this is a revert
-            revert_match = cls.reverted_re.match(edit_json['comment'])
-            if revert_match:
-                reverted_ids.append(int(revert_match.group(1)))
+            autocomment = parse_autocomment(edit_json['comment'])
+            if autocomment.reverted_revid:
+                reverted_ids.append(autocomment.reverted_revid)
 
             # Otherwise, try to match the edit with a tool
             match = None
@@ -265,6 +531,15 @@ class Edit(models.Model):
 
             if match is None:
                 continue
+            matches.append((edit_json, matching_tool, match, autocomment))
+
+        # Fetch the ids of all the users involved at once
+        user_ids = Username.intern(
+            [edit_json['user'] for edit_json, _, _, _ in matches] +
+            [match.user for _, _, match, _ in matches])
+
+        for edit_json, matching_tool, match, autocomment in matches:
+            timestamp = datetime.fromtimestamp(edit_json['timestamp'], tz=UTC)
 
             # Try to find an existing batch for that edit
             batch_key = (matching_tool.shortid, match.uid)
@@ -273,9 +548,9 @@ class Edit(models.Model):
             created = False
             if not batch:
                 batch, created = Batch.objects.get_or_create(
-                    tool=tool, uid=match.uid,
+                    tool=matching_tool, uid=match.uid,
                     defaults={
-                        'user': match.user,
+                        'username_id': user_ids[match.user],
                         'summary': match.summary,
                         'started': timestamp,
                         'ended': timestamp,
@@ -283,18 +558,22 @@ class Edit(models.Model):
                     })
 
             # Check that the batch is owned by the right user
-            if batch.user != match.user:
+            if batch.username_id != user_ids[match.user]:
                 if created:
                     batch.delete()
                 continue
 
+            if created:
+                new_batches.append(batch)
             batch.nb_edits += 1
             batch.ended = max(batch.ended, timestamp)
+            if batch_key not in batches:
+                batch.version += 1
 
             batches[batch_key] = batch
 
             # Create the edit object
-            model_edit = Edit.from_json(edit_json, batch)
+            model_edit = Edit.from_json(edit_json, batch, user_ids, autocomment)
             model_edits.append(model_edit)
 
             # Extract tags from the edit
@@ -305,12 +584,14 @@ class Edit(models.Model):
         # Create all Edit objects update all the batch objects
         if batches:
             # Create all the edit objects
+            saved_edits = model_edits
             try:
                 with transaction.atomic():
                     Edit.objects.bulk_create(model_edits)
             except IntegrityError as e:
                 # Oops! Some of them existed already!
                 # Let's add them one by one instead.
+                saved_edits = []
                 for edit in model_edits:
                     try:
                         existing_edit = Edit.objects.get(id=edit.id)
@@ -322,17 +603,77 @@ class Edit(models.Model):
                             batch.nb_edits -= 1
                     except Edit.DoesNotExist:
                         edit.save()
+                        saved_edits.append(edit)
 
-            # update batch objects
-            Batch.objects.bulk_update(list(batches.values()), update_fields=['ended', 'nb_edits'])
+            BatchProperty.add_edits(saved_edits)
+
+            # old edits can be ingested in partitions which are already complete
+            EditPartition.include_edits(model_edits)
 
-            # update tags for batches
+            # update tags for batches, before their versions
             if new_tags:
                 Tag.add_tags_to_batches(new_tags)
 
+            # update batch objects
+            Batch.objects.bulk_update(list(batches.values()), update_fields=['ended', 'nb_edits', 'version'])
+
         # If we saw any "undo" edit, mark all matching edits as reverted
+        reverted_edits = []
         if reverted_ids:
-            Edit.objects.filter(newrevid__in=reverted_ids).update(reverted=True)
+            reverted_edits = list(Edit.objects.filter(newrevid__in=reverted_ids, reverted=False)
+                .values('id', 'timestamp', 'batch_id', 'batch__tool_id', 'batch__username_id'))
+            Edit.objects.filter(id__in=[edit['id'] for edit in reverted_edits]).update(reverted=True)
+            Batch.objects.filter(id__in={edit['batch_id'] for edit in reverted_edits}).update(
+                changed=datetime.now(UTC))
+
+        add_daily_stats(saved_edits, batches.values(), new_batches, new_tags, reverted_edits)
+
+        # push the changes to the pages watching these batches
+        if batches or reverted_ids:
+            transaction.on_commit(lambda: publish_batch_updates(
+                list(batches.values()), new_tags, reverted_ids))
+        if batches:
+            transaction.on_commit(lambda: schedule_batch_stats(
+                [batch.id for batch in batches.values()], settings.BATCH_STATS_REFRESH_DELAY))
+
+    def to_archive(self):
+        """
+        Returns the fields of the edit as a JSON-serializable dictionary,
+        to be stored in a BatchArchive.
+        """
+        return {
+            'id': self.id,
+            'oldrevid': self.oldrevid,
+            'newrevid': self.newrevid,
+            'oldlength': self.oldlength,
+            'newlength': self.newlength,
+            'timestamp': self.timestamp.timestamp(),
+            'title': self.title,
+            'namespace': self.namespace,
+            'comment': self.comment,
+            'parsedcomment': self.parsedcomment,
+            'bot': self.bot,
+            'minor': self.minor,
+            'changetype': self.changetype,
+            'user': self.user,
+            'patrolled': self.patrolled,
+            'reverted': self.reverted,
+        }
+
+    @classmethod
+    def from_archive(cls, fields, batch, username=None):
+        """
+        Creates an edit from the output of :meth:`to_archive`, without saving it.
+
+        :param username: the Username object for this edit. If not provided,
+            an unsaved one is created, which is enough to read the edit.
+        """
+        fields = dict(fields)
+        fields['timestamp'] = datetime.fromtimestamp(fields['timestamp'], tz=UTC)
+        user = fields.pop('user')
+        edit = cls(batch=batch, username=username or Username(name=user), **fields)
+        edit.set_autocomment(parse_autocomment(edit.comment))
+        return edit
 
     @classmethod
     def ingest_jsonlines(cls, fname, batch_size=50):
@@ -348,3 +689,581 @@ class Edit(models.Model):
         for batch in grouper(lines_generator(), batch_size, ):
             cls.ingest_edits(batch)
 
+class BatchProperty(models.Model):
+    """
+    The number of edits of a batch which mention a property,
+    used to find the batches which touched a given property.
+    """
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='properties')
+    #: The numeric id of the property (31 for P31)
+    property_id = models.PositiveIntegerField()
+    nb_edits = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('property_id', 'batch'))
+
+    def __str__(self):
+        return '<BatchProperty P{} in {}: {} edits>'.format(self.property_id, self.batch_id, self.nb_edits)
+
+    @classmethod
+    def add_edits(cls, edits):
+        """
+        Counts the properties of newly saved edits (their
+        `property_id` field) in the batches they belong to.
+        """
+        counts = Counter((edit.batch_id, edit.property_id) for edit in edits if edit.property_id)
+        if not counts:
+            return
+        existing = {
+            (batch_id, property_id): id
+            for batch_id, property_id, id in cls.objects.filter(
+                batch_id__in={batch_id for batch_id, _ in counts},
+                property_id__in={property_id for _, property_id in counts},
+            ).values_list('batch_id', 'property_id', 'id')
+        }
+        cls.objects.bulk_create([
+            cls(batch_id=batch_id, property_id=property_id, nb_edits=nb_edits)
+            for (batch_id, property_id), nb_edits in counts.items()
+            if (batch_id, property_id) not in existing
+        ])
+        for key, id in existing.items():
+            if key in counts:
+                cls.objects.filter(id=id).update(nb_edits=models.F('nb_edits') + counts[key])
+
+def utc_day(field):
+    """
+    The day of a date field, in UTC as the dates are stored. Unlike
+    TruncDate, this does not convert the dates to the current time zone,
+    which requires the time zone tables of MySQL.
+    """
+    return Cast(field, models.DateField())
+
+class DailyStats(models.Model):
+    """
+    Rollups of the edits per day and per value of a field added by
+    subclasses: numbers of edits, of batches started, of edits undone
+    and of page creations. They are updated as edits are ingested and
+    recomputed for the last days by a periodic task (see :meth:`reconcile`).
+    """
+    #: The field the rollups are grouped by
+    key = None
+    #: The lookups of this field from Edit and from Batch
+    edit_key = None
+    batch_key = None
+
+    day = models.DateField()
+    nb_edits = models.IntegerField(default=0)
+    nb_batches = models.IntegerField(default=0)
+    nb_reverted = models.IntegerField(default=0)
+    nb_new_pages = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def add(cls, counts):
+        """
+        Adds counts to the rollups.
+
+        :param counts: a dictionary from (day, key) pairs to Counters
+            of the fields to increment
+        """
+        if not counts:
+            return
+        existing = {
+            (day, key): id
+            for day, key, id in cls.objects.filter(**{
+                'day__in': {day for day, _ in counts},
+                cls.key+'__in': {key for _, key in counts},
+            }).values_list('day', cls.key, 'id')
+        }
+        # rows created concurrently by the periodic task are recomputed by it anyway
+        cls.objects.bulk_create([
+            cls(day=day, **{cls.key: key}, **fields)
+            for (day, key), fields in counts.items()
+            if (day, key) not in existing
+        ], ignore_conflicts=True)
+        for day_key, id in existing.items():
+            if day_key in counts:
+                cls.objects.filter(id=id).update(**{
+                    field: models.F(field) + count
+                    for field, count in counts[day_key].items()
+                })
+
+    @classmethod
+    def reconcile(cls, since, until):
+        """
+        Recomputes the rollups of the days from `since` (included)
+        to `until` (excluded) from the edits and batches.
+        """
+        start = datetime(since.year, since.month, since.day, tzinfo=UTC)
+        end = datetime(until.year, until.month, until.day, tzinfo=UTC)
+        counts = defaultdict(Counter)
+
+        # only the edits of the batches active during these days are read
+        batches = Batch.objects.filter(started__lt=end, ended__gte=start)
+        edits = (Edit.objects.filter(EditPartition.bounds(start, end),
+                batch__in=batches, timestamp__gte=start, timestamp__lt=end)
+            .annotate(day=utc_day('timestamp'))
+            .values('day', cls.edit_key)
+            .annotate(
+                nb_edits=models.Count('id'),
+                nb_reverted=models.Count('id', filter=models.Q(reverted=True)),
+                nb_new_pages=models.Count('id', filter=models.Q(oldrevid=0)))
+            .order_by())
+        for row in edits:
+            if row[cls.edit_key] is not None:
+                counts[row['day'], row[cls.edit_key]].update({
+                    field: row[field] for field in ('nb_edits', 'nb_reverted', 'nb_new_pages')
+                })
+
+        started = (batches.filter(started__gte=start)
+            .annotate(day=utc_day('started'))
+            .values('day', cls.batch_key)
+            .annotate(nb_batches=models.Count('id'))
+            .order_by())
+        for row in started:
+            if row[cls.batch_key] is not None:
+                counts[row['day'], row[cls.batch_key]]['nb_batches'] += row['nb_batches']
+
+        with transaction.atomic():
+            cls.objects.filter(day__gte=since, day__lt=until).delete()
+            cls.objects.bulk_create([
+                cls(day=day, **{cls.key: key}, **fields)
+                for (day, key), fields in counts.items()
+            ])
+
+class DailyToolStats(DailyStats):
+    """
+    The rollups of the tools
+    """
+    key = 'tool_id'
+    edit_key = 'batch__tool_id'
+    batch_key = 'tool_id'
+
+    tool = models.ForeignKey(Tool, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = (('day', 'tool'))
+
+class DailyUserStats(DailyStats):
+    """
+    The rollups of the authors of the batches
+    """
+    key = 'username_id'
+    edit_key = 'batch__username_id'
+    batch_key = 'username_id'
+
+    username = models.ForeignKey(Username, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = (('day', 'username'))
+
+class DailyTagStats(DailyStats):
+    """
+    The rollups of the tags of the batches: the edits
+    of a batch are counted for each of its tags.
+    """
+    key = 'tag_id'
+    edit_key = 'batch__tags__id'
+    batch_key = 'tags__id'
+
+    tag = models.ForeignKey('tagging.Tag', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = (('day', 'tag'))
+
+def add_daily_stats(edits, batches, new_batches, new_tags, reverted_edits):
+    """
+    Adds newly ingested edits to the daily rollups.
+
+    :param edits: the saved edits
+    :param batches: the batches of these edits
+    :param new_batches: the batches created by these edits
+    :param new_tags: a dictionary from batch ids to the ids of their new tags
+    :param reverted_edits: the edits newly marked as undone, as dictionaries
+        with their `id`, `timestamp`, `batch_id`, `batch__tool_id` and `batch__username_id`
+    """
+    tools, users, tags = defaultdict(Counter), defaultdict(Counter), defaultdict(Counter)
+    edit_ids = {edit.id for edit in edits}
+    batch_ids = {edit.batch_id for edit in edits} | {edit['batch_id'] for edit in reverted_edits}
+    batch_tags = defaultdict(set)
+    if batch_ids:
+        for batch_id, tag_id in Tag.batches.through.objects.filter(
+                batch_id__in=batch_ids).values_list('batch_id', 'tag_id'):
+            batch_tags[batch_id].add(tag_id)
+
+    for edit in edits:
+        day = edit.timestamp.date()
+        fields = {'nb_edits': 1, 'nb_new_pages': int(edit.oldrevid == 0)}
+        tools[day, edit.batch.tool_id].update(fields)
+        users[day, edit.batch.username_id].update(fields)
+        for tag_id in batch_tags[edit.batch_id]:
+            tags[day, tag_id].update(fields)
+
+    for batch in new_batches:
+        day = batch.started.date()
+        tools[day, batch.tool_id]['nb_batches'] += 1
+        users[day, batch.username_id]['nb_batches'] += 1
+    for batch in batches:
+        for tag_id in new_tags.get(batch.id, ()):
+            tags[batch.started.date(), tag_id]['nb_batches'] += 1
+
+    # the edits ingested before a batch got a new tag are counted for it now
+    tagged_batches = [batch for batch in batches
+        if new_tags.get(batch.id) and batch not in new_batches]
+    if tagged_batches:
+        earlier_edits = (Edit.objects.filter(
+                EditPartition.bounds(min(batch.started for batch in tagged_batches),
+                    max(batch.ended for batch in tagged_batches)),
+                batch__in=tagged_batches)
+            .exclude(id__in=edit_ids)
+            .annotate(day=utc_day('timestamp'))
+            .values('day', 'batch_id')
+            .annotate(
+                nb_edits=models.Count('id'),
+                nb_reverted=models.Count('id', filter=models.Q(reverted=True)),
+                nb_new_pages=models.Count('id', filter=models.Q(oldrevid=0)))
+            .order_by())
+        for row in earlier_edits:
+            for tag_id in new_tags[row['batch_id']]:
+                tags[row['day'], tag_id].update({
+                    field: row[field] for field in ('nb_edits', 'nb_reverted', 'nb_new_pages')
+                })
+
+    for edit in reverted_edits:
+        day = edit['timestamp'].date()
+        tools[day, edit['batch__tool_id']]['nb_reverted'] += 1
+        users[day, edit['batch__username_id']]['nb_reverted'] += 1
+        tag_ids = batch_tags[edit['batch_id']]
+        if edit['id'] not in edit_ids:
+            # already counted with the earlier edits above
+            tag_ids = tag_ids - new_tags.get(edit['batch_id'], set())
+        for tag_id in tag_ids:
+            tags[day, tag_id]['nb_reverted'] += 1
+
+    DailyToolStats.add(tools)
+    DailyUserStats.add(users)
+    DailyTagStats.add(tags)
+
+class IngestionStatus(models.Model):
+    """
+    How far the ingestion of the stream of edits is, recorded by the
+    listener after each chunk of events (see :func:`store.status.record_chunk`).
+    There is only one row.
+    """
+    #: Timestamp of the newest event of the last chunk
+    event_timestamp = models.DateTimeField()
+    #: When this chunk was ingested
+    committed = models.DateTimeField()
+
+    def __str__(self):
+        return '<IngestionStatus: events up to {} ingested at {}>'.format(self.event_timestamp, self.committed)
+
+class EditPartition(CachingMixin, models.Model):
+    """
+    A range partition of the Edit table, on MySQL (see the
+    partition_edits command). Edit ids are recent changes ids,
+    which grow with time, so each partition contains the edits
+    made during some period, which we record once it is complete.
+    """
+    objects = CachingManager()
+
+    #: Edits in partitions which are not complete yet are assumed
+    #: to be at most that older than the edits of the complete ones
+    TIMESTAMP_SKEW = timedelta(days=1)
+
+    name = models.CharField(max_length=32, unique=True)
+    #: The ids of the edits in this partition are lower than this bound,
+    #: and greater or equal to the bound of the previous partition
+    max_id = models.BigIntegerField(unique=True)
+    #: Set when edits with higher ids are being ingested
+    complete = models.BooleanField(default=False)
+    #: Timestamps of the edits in the partition, once it is complete
+    min_timestamp = models.DateTimeField(null=True)
+    max_timestamp = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return '<EditPartition {} (ids < {})>'.format(self.name, self.max_id)
+
+    @classmethod
+    def bounds(cls, started, ended):
+        """
+        Restricts a query on edits made between the two given dates
+        to the partitions which can contain them, so that MySQL can
+        prune the others.
+
+        :returns: a Q object on edit ids
+        """
+        if not settings.PARTITION_EDITS:
+            return models.Q()
+
+        min_id = None
+        max_id = None
+        found = False
+        last_timestamp = None
+        previous_max_id = None
+        for partition in sorted(cls.objects.all(), key=lambda partition: partition.max_id):
+            if not partition.complete:
+                break
+            if partition.min_timestamp is not None:
+                last_timestamp = max(last_timestamp or partition.max_timestamp, partition.max_timestamp)
+                if partition.min_timestamp <= ended and partition.max_timestamp >= started:
+                    if not found:
+                        min_id = previous_max_id
+                        found = True
+                    max_id = partition.max_id
+            previous_max_id = partition.max_id
+
+        # the remaining partitions only contain edits newer than the complete ones
+        if not found or ended >= last_timestamp - cls.TIMESTAMP_SKEW:
+            if not found:
+                min_id = previous_max_id
+            max_id = None
+
+        q = models.Q()
+        if min_id is not None:
+            q &= models.Q(id__gte=min_id)
+        if max_id is not None:
+            q &= models.Q(id__lt=max_id)
+        return q
+
+    @classmethod
+    def include_edits(cls, edits):
+        """
+        Extends the timestamps recorded for complete partitions
+        when the given edits are saved in them.
+        """
+        if not edits or not settings.PARTITION_EDITS:
+            return
+        partitions = [partition for partition in cls.objects.all() if partition.complete]
+        if not partitions:
+            return
+        partitions.sort(key=lambda partition: partition.max_id)
+        changed = set()
+        for edit in edits:
+            for partition in partitions:
+                if edit.id < partition.max_id:
+                    break
+            else:
+                continue
+            if partition.min_timestamp is None or edit.timestamp < partition.min_timestamp:
+                partition.min_timestamp = edit.timestamp
+                changed.add(partition)
+            if partition.max_timestamp is None or edit.timestamp > partition.max_timestamp:
+                partition.max_timestamp = edit.timestamp
+                changed.add(partition)
+        for partition in changed:
+            partition.save(update_fields=['min_timestamp', 'max_timestamp'])
+
+    @property
+    def min_id(self):
+        """
+        The lowest id an edit of this partition can have (None for the first one)
+        """
+        previous = EditPartition.objects.filter(max_id__lt=self.max_id).order_by('-max_id').first()
+        return previous.max_id if previous else None
+
+    @property
+    def edits(self):
+        q = models.Q(id__lt=self.max_id)
+        if self.min_id is not None:
+            q &= models.Q(id__gte=self.min_id)
+        return Edit.objects.filter(q)
+
+    def mark_complete(self):
+        """
+        Records the timestamps of the edits in this partition,
+        which should not receive new edits anymore.
+        """
+        timestamps = self.edits.aggregate(
+            min_timestamp=models.Min('timestamp'), max_timestamp=models.Max('timestamp'))
+        self.min_timestamp = timestamps['min_timestamp']
+        self.max_timestamp = timestamps['max_timestamp']
+        self.complete = True
+        self.save()
+
+class BatchArchive(models.Model):
+    """
+    The edits of a batch which is too old to be looked at often,
+    stored as compressed chunks of edits instead of rows of the
+    Edit table, together with the aggregates that were computed
+    from them.
+    """
+    batch = models.OneToOneField(Batch, on_delete=models.CASCADE, related_name='archive')
+    archived_on = models.DateTimeField(auto_now_add=True)
+    #: Number of edits in each chunk (except the last one)
+    chunk_size = models.IntegerField(default=1000)
+    nb_archived_edits = models.IntegerField()
+
+    nb_reverted = models.IntegerField()
+    nb_pages = models.IntegerField()
+    nb_new_pages = models.IntegerField()
+    avg_diffsize = models.FloatField(null=True)
+
+    def __str__(self):
+        return '<BatchArchive for {}>'.format(self.batch)
+
+    @classmethod
+    def archive(cls, batch, chunk_size=1000, delete_edits=True):
+        """
+        Moves the edits of the batch to an archive.
+
+        :param delete_edits: if False, the edits are left in the Edit table,
+            where they will be ignored. This is used when they are about to
+            be deleted by dropping their partition.
+        """
+        with transaction.atomic():
+            archive = cls.objects.create(
+                batch=batch,
+                chunk_size=chunk_size,
+                nb_archived_edits=batch.partitioned_edits.count(),
+                nb_reverted=batch.nb_reverted,
+                nb_pages=batch.nb_pages,
+                nb_new_pages=batch.nb_new_pages,
+                avg_diffsize=batch.avg_diffsize)
+
+            edits = batch.ordered_edits.iterator()
+            for index, chunk in enumerate(grouper(edits, chunk_size)):
+                fields = [edit.to_archive() for edit in chunk if edit is not None]
+                EditArchiveChunk.objects.create(
+                    archive=archive,
+                    index=index,
+                    edits=json.dumps(fields),
+                    **EditArchiveChunk.ranges(fields))
+
+            if delete_edits:
+                batch.partitioned_edits.delete()
+            batch.archived = True
+            batch.save(update_fields=['archived'])
+        return archive
+
+    def restore(self):
+        """
+        Moves the archived edits back to the Edit table.
+        """
+        batch = self.batch
+        with transaction.atomic():
+            for chunk in self.chunks.order_by('index').iterator():
+                fields = json.loads(chunk.edits)
+                user_ids = Username.intern([edit['user'] for edit in fields])
+                edits = [
+                    Edit.from_archive(edit, batch, Username(id=user_ids[edit['user']], name=edit['user']))
+                    for edit in fields
+                ]
+                Edit.objects.bulk_create(edits)
+                EditPartition.include_edits(edits)
+            batch.archived = False
+            batch.save(update_fields=['archived'])
+            self.delete()
+
+    def edits(self):
+        """
+        The archived edits, most recent first, as
+        a lazy sequence of (unsaved) Edit objects.
+        """
+        return ArchivedEdits(self)
+
+    @classmethod
+    def find_edits(cls, field, ids):
+        """
+        Finds archived edits by their id or revision id, only
+        decompressing the chunks whose range contains one of them.
+
+        :param field: the field to look the ids up in (`id` or `newrevid`)
+        :returns: a dictionary from the ids found to the (unsaved) edits
+        """
+        if not ids:
+            return {}
+        ranges = Q()
+        for id in ids:
+            ranges |= Q(**{'min_'+field+'__lte': id, 'max_'+field+'__gte': id})
+        chunks = (EditArchiveChunk.objects.filter(ranges)
+            .select_related('archive__batch__tool', 'archive__batch__username'))
+        ids = set(ids)
+        found = {}
+        for chunk in chunks:
+            for fields in json.loads(chunk.edits):
+                if fields[field] in ids:
+                    found[fields[field]] = Edit.from_archive(fields, chunk.archive.batch)
+        return found
+
+class EditArchiveChunk(models.Model):
+    """
+    A chunk of consecutive edits of an archived batch
+    """
+    archive = models.ForeignKey(BatchArchive, on_delete=models.CASCADE, related_name='chunks')
+    #: Position of the chunk in the archive, most recent edits first
+    index = models.IntegerField()
+    #: The edits, as a JSON list of the outputs of Edit.to_archive
+    edits = CompressedTextField()
+    #: Ranges of the ids and revision ids of the edits, to find
+    #: the chunks which can contain some edits without reading them
+    min_id = models.IntegerField(null=True)
+    max_id = models.IntegerField(null=True)
+    min_newrevid = models.IntegerField(null=True)
+    max_newrevid = models.IntegerField(null=True)
+
+    class Meta:
+        unique_together = (('archive', 'index'))
+        indexes = [
+            models.Index(fields=['min_id', 'max_id']),
+            models.Index(fields=['min_newrevid', 'max_newrevid']),
+        ]
+
+    @staticmethod
+    def ranges(edits):
+        """
+        Computes the ranges of a chunk of edits, given as outputs of Edit.to_archive
+        """
+        ranges = {}
+        for field in ('id', 'newrevid'):
+            values = [edit[field] for edit in edits]
+            ranges['min_'+field] = min(values, default=None)
+            ranges['max_'+field] = max(values, default=None)
+        return ranges
+
+class ArchivedEdits(object):
+    """
+    The edits of a BatchArchive, as a sequence which only
+    decompresses the chunks needed to access the required edits.
+    This makes it possible to paginate it like a queryset.
+    """
+    def __init__(self, archive):
+        self.archive = archive
+
+    def __len__(self):
+        return self.archive.nb_archived_edits
+
+    def count(self):
+        return len(self)
+
+    def load(self, chunks):
+        edits = []
+        for chunk in chunks:
+            edits += [Edit.from_archive(edit, self.archive.batch) for edit in json.loads(chunk.edits)]
+        return edits
+
+    def __iter__(self):
+        for chunk in self.archive.chunks.order_by('index').iterator():
+            for edit in self.load([chunk]):
+                yield edit
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError('archived edit index out of range')
+            return self[key:key+1][0]
+
+        start, stop, step = key.indices(len(self))
+        if start >= stop:
+            return []
+        chunk_size = self.archive.chunk_size
+        first_chunk = start // chunk_size
+        last_chunk = (stop - 1) // chunk_size
+        chunks = self.archive.chunks.filter(
+            index__gte=first_chunk, index__lte=last_chunk).order_by('index')
+        offset = first_chunk * chunk_size
+        return self.load(chunks)[start-offset:stop-offset:step]
@@ -0,0 +1,31 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders JSON with orjson when it is installed, producing the
+    same bytes as JSONRenderer (compact separators, no ASCII escaping).
+
+    Falls back on JSONRenderer when orjson is missing, when the output
+    should be indented or when the data contains values orjson does not
+    serialize like the standard encoder (lazy strings, non-string keys…).
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or
+            not self.compact or self.ensure_ascii or
+            self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data)
+        except TypeError:
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as JSONRenderer, to output a strict javascript subset
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -5,30 +5,61 @@ from .models import Edit
 from .models import Tool
 from revert.serializers import RevertTaskSerializer
 from tagging.serializers import TagSerializer
+from tagging.models import Tag
+from .templatetags.fixwikilinks import fixwikilinks
 
 
+class SparseFieldsetsMixin(object):
+    """
+    Lets API clients choose the fields they need with `?fields=a,b`,
+    or the ones they do not need with `?omit=a,b`. The other fields
+    are removed from the serializer, so they are never computed.
+    """
+    def __init__(self, *args, **kwargs):
+        super(SparseFieldsetsMixin, self).__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        fields = request.query_params.get('fields')
+        if fields:
+            requested = { name.strip() for name in fields.split(',') }
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+        omitted = request.query_params.get('omit')
+        if omitted:
+            for name in omitted.split(','):
+                self.fields.pop(name.strip(), None)
+
 class ToolSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tool
         fields = ('name', 'shortid', 'url')
 
 class EditSerializer(serializers.ModelSerializer):
+    title = serializers.CharField()
+    user = serializers.CharField()
+    uri = serializers.CharField()
     url = serializers.CharField()
     revert_url = serializers.CharField()
     class Meta:
         model = Edit
-        fields = '__all__'
+        exclude = ('entity_type', 'entity_id', 'other_title', 'username',
+            'action', 'language', 'property_id', 'target_type', 'target_id')
 
 class LimitedListSerializer(serializers.ListSerializer):
     """
     A serializer that only prints the most recent children objects
     """
     limit = 11
-    model_ordering = '-timestamp'
+    model_ordering = ('-timestamp', '-id')
 
     def to_representation(self, data):
         iterable = data.all() if isinstance(data, db.models.Manager) else data
-        limited_iterable = iterable.order_by(self.model_ordering)[:self.limit]
+        if isinstance(iterable, db.models.QuerySet):
+            iterable = iterable.select_related('username').order_by(*self.model_ordering)
+        limited_iterable = iterable[:self.limit]
 
         return [
             self.child.to_representation(item) for item in limited_iterable
@@ -38,10 +69,11 @@ class LimitedListSerializer(serializers.ListSerializer):
 class LimitedEditSerializer(EditSerializer):
     class Meta:
         model = Edit
-        fields = '__all__'
+        exclude = ('entity_type', 'entity_id', 'other_title', 'username',
+            'action', 'language', 'property_id', 'target_type', 'target_id')
         list_serializer_class = LimitedListSerializer
 
-class BatchSimpleSerializer(serializers.ModelSerializer):
+class BatchSimpleSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     tool = ToolSerializer()
     url = serializers.CharField()
     author = serializers.CharField(source='user')
@@ -51,11 +83,29 @@ class BatchSimpleSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Batch
-        exclude = ('user',) # translated as 'author'
+        exclude = ('username', 'version', 'changed') # username is translated as 'author'
         depth = 1
 
 
-class BatchDetailSerializer(serializers.ModelSerializer):
+class EntityBatchSerializer(serializers.ModelSerializer):
+    """
+    A short description of a batch, for the lists of
+    edits or revisions coming from several batches
+    """
+    tool = ToolSerializer()
+    url = serializers.CharField()
+    author = serializers.CharField(source='user')
+    full_uid = serializers.CharField()
+
+    class Meta:
+        model = Batch
+        fields = ('tool', 'uid', 'full_uid', 'author', 'summary', 'started', 'ended', 'nb_edits', 'url')
+
+class EntityEditSerializer(EditSerializer):
+    batch = EntityBatchSerializer()
+
+
+class BatchDetailSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     tool = ToolSerializer()
     url = serializers.CharField()
     author = serializers.CharField(source='user')
@@ -63,7 +113,7 @@ class BatchDetailSerializer(serializers.ModelSerializer):
     full_uid = serializers.CharField()
     tags = TagSerializer(many=True)
 
-    edits = LimitedEditSerializer(many=True, read_only=True)
+    edits = LimitedEditSerializer(source='ordered_edits', many=True, read_only=True)
     entities_speed = serializers.CharField()
     duration = serializers.IntegerField()
     nb_reverted = serializers.IntegerField()
@@ -78,7 +128,162 @@ class BatchDetailSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Batch
-        exclude = ('user',) # translated as 'author'
+        exclude = ('username', 'version', 'changed') # username is translated as 'author'
         depth = 1
 
 
+class ValuesRow(object):
+    """
+    A row returned by `.values()`, on which the properties
+    of the corresponding model can be reused.
+    """
+    def __init__(self, values):
+        self.__dict__.update(values)
+
+class BatchValuesRow(ValuesRow):
+    url = Batch.url
+    full_uid = Batch.full_uid
+    duration = Batch.duration
+    editing_speed = Batch.editing_speed
+
+class EditValuesRow(ValuesRow):
+    title = Edit.title
+    uri = Edit.uri
+    url = Edit.url
+    revert_url = Edit.revert_url
+
+datetime_field = serializers.DateTimeField()
+
+def format_datetime(value):
+    return datetime_field.to_representation(value)
+
+class BatchRowSerializer(object):
+    """
+    Builds the same data as BatchSimpleSerializer for a page of batches,
+    from the rows returned by `.values()` rather than from model instances
+    and nested serializers. The tools and tags of the page are fetched
+    in one query each.
+
+    With `native=True`, dates are left as datetimes and the version
+    of the batch is added, for the templates.
+    """
+    values = ('id', 'tool_id', 'username__name', 'uid', 'summary',
+        'started', 'ended', 'nb_edits', 'archived', 'version')
+
+    @classmethod
+    def values_queryset(cls, queryset):
+        return queryset.values(*cls.values)
+
+    @classmethod
+    def to_representation(cls, page, native=False):
+        format_date = (lambda value: value) if native else format_datetime
+        tools = Tool.objects.in_bulk({ values['tool_id'] for values in page })
+        tool_data = {
+            tool.id: {'name': tool.name, 'shortid': tool.shortid, 'url': tool.url}
+            for tool in tools.values()
+        }
+        tags = {}
+        batch_tags = (Tag.batches.through.objects
+            .filter(batch_id__in=[values['id'] for values in page])
+            .order_by('-tag__priority', 'tag_id')
+            .values_list('batch_id', 'tag_id', 'tag__priority', 'tag__color'))
+        for batch_id, tag_id, priority, color in batch_tags:
+            display_name = Tag(id=tag_id).display_name
+            tags.setdefault(batch_id, []).append({
+                'id': tag_id,
+                'priority': priority,
+                'display_name': None if display_name is None else str(display_name),
+                'color': color,
+            })
+
+        data = []
+        for values in page:
+            row = BatchValuesRow(values)
+            row.tool = tools[row.tool_id]
+            item = {
+                'id': row.id,
+                'tool': tool_data[row.tool_id],
+                'url': row.url,
+                'author': row.username__name,
+                'editing_speed': row.editing_speed,
+                'full_uid': row.full_uid,
+                'sorted_tags': tags.get(row.id, []),
+                'uid': row.uid,
+                'summary': row.summary,
+                'started': format_date(row.started),
+                'ended': format_date(row.ended),
+                'nb_edits': row.nb_edits,
+                'archived': row.archived,
+            }
+            if native:
+                item['version'] = row.version
+            data.append(item)
+        return data
+
+class EditRowSerializer(object):
+    """
+    Builds the same data as EditSerializer for a page of edits,
+    from the rows returned by `.values()`.
+
+    With `native=True`, the rows are prepared for the templates:
+    timestamps are left as datetimes, the size difference is added
+    and the links of the parsed comments point to Wikidata.
+    """
+    #: The fields of the serialized edits, as in EditSerializer
+    fields = ('id', 'title', 'user', 'uri', 'url', 'revert_url', 'oldrevid', 'newrevid',
+        'oldlength', 'newlength', 'timestamp', 'namespace', 'comment', 'parsedcomment',
+        'bot', 'minor', 'changetype', 'patrolled', 'reverted', 'batch')
+    values = ('id', 'entity_type', 'entity_id', 'other_title', 'username__name',
+        'oldrevid', 'newrevid', 'oldlength', 'newlength', 'timestamp', 'namespace',
+        'comment', 'parsedcomment', 'bot', 'minor', 'changetype', 'patrolled',
+        'reverted', 'batch_id')
+
+    @classmethod
+    def values_queryset(cls, queryset):
+        return queryset.values(*cls.values)
+
+    @classmethod
+    def instance_values(cls, edit):
+        """
+        The values of an edit which is not stored in the
+        Edit table (archived edits)
+        """
+        values = { field: getattr(edit, field) for field in cls.values if '__' not in field }
+        values['username__name'] = edit.user
+        return values
+
+    @classmethod
+    def to_representation(cls, page, native=False):
+        data = []
+        for values in page:
+            if isinstance(values, Edit):
+                values = cls.instance_values(values)
+            row = EditValuesRow(values)
+            item = {
+                'id': row.id,
+                'title': row.title,
+                'user': row.username__name,
+                'uri': row.uri,
+                'url': row.url,
+                'revert_url': row.revert_url,
+                'oldrevid': row.oldrevid,
+                'newrevid': row.newrevid,
+                'oldlength': row.oldlength,
+                'newlength': row.newlength,
+                'timestamp': format_datetime(row.timestamp),
+                'namespace': row.namespace,
+                'comment': row.comment,
+                'parsedcomment': row.parsedcomment,
+                'bot': row.bot,
+                'minor': row.minor,
+                'changetype': row.changetype,
+                'patrolled': row.patrolled,
+                'reverted': row.reverted,
+                'batch': row.batch_id,
+            }
+            if native:
+                item['timestamp'] = row.timestamp
+                item['diffsize'] = row.newlength - row.oldlength
+                item['parsedcomment'] = fixwikilinks(row.parsedcomment)
+            data.append(item)
+        return data
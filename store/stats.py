@@ -0,0 +1,214 @@
+"""
+Statistics on the edits of a batch, computed with NumPy on the
+columns of its edits, which are loaded at once. They are computed
+by a Celery task, and the pages show the last ones computed.
+"""
+from datetime import datetime
+import logging
+
+import numpy
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db import transaction
+from django.db.models import Func
+from django.db.models import IntegerField
+from kombu.exceptions import OperationalError
+from pytz import UTC
+from rest_framework.fields import DateTimeField
+
+logger = logging.getLogger(__name__)
+
+#: The columns of the edits which are loaded
+COLUMNS = ('timestamp', 'oldlength', 'newlength', 'namespace', 'oldrevid')
+#: Bounds of the bins of the histogram of size differences:
+#: each bin includes its lower bound, the first and last ones are unbounded
+DIFFSIZE_BINS = (-10000, -1000, -100, -10, 0, 1, 10, 100, 1000, 10000)
+#: The percentiles of size differences which are computed
+PERCENTILES = (5, 25, 50, 75, 95)
+#: Maximum number of points of the timeline (minutes are grouped beyond that)
+MAX_TIMELINE_POINTS = 120
+#: A burst is a run of minutes with at least this many times
+#: the median number of edits of the minutes with edits
+BURST_FACTOR = 3
+#: Number of bursts reported, the largest first
+MAX_BURSTS = 5
+
+
+class EpochSeconds(Func):
+    """
+    The number of seconds between the epoch and a date (stored in UTC),
+    computed by the database without time zone conversion.
+    """
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection,
+            template="CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)", **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection,
+            template="TIMESTAMPDIFF(SECOND, '1970-01-01 00:00:00', %(expressions)s)", **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection,
+            template="EXTRACT(EPOCH FROM %(expressions)s)::bigint", **extra_context)
+
+def load_columns(batch):
+    """
+    Loads the columns of the edits of a batch in NumPy arrays,
+    with timestamps as seconds since the epoch.
+    """
+    if batch.archived:
+        edits = list(batch.archive.edits())
+        return {
+            'timestamp': numpy.array([int(edit.timestamp.timestamp()) for edit in edits], dtype='int64'),
+            'oldlength': numpy.array([edit.oldlength for edit in edits], dtype='int64'),
+            'newlength': numpy.array([edit.newlength for edit in edits], dtype='int64'),
+            'namespace': numpy.array([edit.namespace for edit in edits], dtype='int64'),
+            'oldrevid': numpy.array([edit.oldrevid or 0 for edit in edits], dtype='int64'),
+        }
+
+    # the rows are fetched without Django's conversions, which would
+    # dominate the time spent on large batches, and the dates are
+    # converted to integers by the database rather than in Python
+    # (the annotation comes after the fields in the query)
+    queryset = (batch.partitioned_edits.annotate(epoch=EpochSeconds('timestamp'))
+        .values_list(*COLUMNS[1:], 'epoch'))
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    columns = list(zip(*rows)) or [()] * len(COLUMNS)
+    oldlength, newlength, namespace, oldrevid, timestamp = columns
+    return {
+        'timestamp': numpy.array(timestamp, dtype='int64'),
+        'oldlength': numpy.array(oldlength, dtype='int64'),
+        'newlength': numpy.array(newlength, dtype='int64'),
+        'namespace': numpy.array(namespace, dtype='int64'),
+        'oldrevid': numpy.array([revid or 0 for revid in oldrevid], dtype='int64'),
+    }
+
+def format_timestamp(seconds):
+    return DateTimeField().to_representation(datetime.fromtimestamp(int(seconds), UTC))
+
+def runs(mask):
+    """
+    The (start, end) indices of the runs of true values of a boolean array
+    """
+    edges = numpy.diff(numpy.concatenate(([0], mask.astype('int8'), [0])))
+    return numpy.flatnonzero(edges == 1), numpy.flatnonzero(edges == -1)
+
+def compute_stats(columns):
+    """
+    Computes the statistics of a batch from the columns of its edits.
+    """
+    nb_edits = len(columns['timestamp'])
+    if not nb_edits:
+        return None
+
+    diffsize = columns['newlength'] - columns['oldlength']
+    bins = numpy.bincount(numpy.searchsorted(DIFFSIZE_BINS, diffsize, side='right'),
+        minlength=len(DIFFSIZE_BINS) + 1)
+    bounds = (None,) + DIFFSIZE_BINS + (None,)
+    histogram = [
+        {'min': bounds[i], 'max': bounds[i+1], 'nb_edits': int(count)}
+        for i, count in enumerate(bins)
+    ]
+
+    timestamp = columns['timestamp']
+    start = timestamp.min()
+    per_minute = numpy.bincount((timestamp - start) // 60)
+    minutes_per_point = -(-len(per_minute) // MAX_TIMELINE_POINTS)
+    padded = numpy.zeros(minutes_per_point * -(-len(per_minute) // minutes_per_point), dtype='int64')
+    padded[:len(per_minute)] = per_minute
+    timeline = padded.reshape(-1, minutes_per_point).sum(axis=1)
+
+    threshold = BURST_FACTOR * numpy.median(per_minute[per_minute > 0])
+    burst_starts, burst_ends = runs(per_minute >= threshold)
+    cumulated = numpy.concatenate(([0], numpy.cumsum(per_minute)))
+    burst_edits = cumulated[burst_ends] - cumulated[burst_starts]
+    bursts = [
+        {
+            'start': format_timestamp(start + 60 * burst_starts[i]),
+            'minutes': int(burst_ends[i] - burst_starts[i]),
+            'nb_edits': int(burst_edits[i]),
+            'max_edits_per_minute': int(per_minute[burst_starts[i]:burst_ends[i]].max()),
+        }
+        for i in numpy.argsort(-burst_edits, kind='stable')[:MAX_BURSTS]
+    ]
+
+    namespaces, namespace_counts = numpy.unique(columns['namespace'], return_counts=True)
+    nb_new_pages = int(numpy.count_nonzero(columns['oldrevid'] == 0))
+
+    return {
+        'nb_edits': nb_edits,
+        'diffsize': {
+            'mean': float(diffsize.mean()),
+            'min': int(diffsize.min()),
+            'max': int(diffsize.max()),
+            'percentiles': {
+                str(p): float(value)
+                for p, value in zip(PERCENTILES, numpy.percentile(diffsize, PERCENTILES))
+            },
+            'histogram': histogram,
+        },
+        'timeline': {
+            'start': format_timestamp(start),
+            'minutes_per_point': minutes_per_point,
+            'edits': timeline.tolist(),
+        },
+        'max_edits_per_minute': int(per_minute.max()),
+        'bursts': bursts,
+        'pages': {
+            'new': nb_new_pages,
+            'existing': nb_edits - nb_new_pages,
+        },
+        'namespaces': {
+            str(namespace): int(count)
+            for namespace, count in zip(namespaces, namespace_counts)
+        },
+    }
+
+def stats_key(batch_id):
+    return 'batchstats:{}'.format(batch_id)
+
+def batch_stats(batch):
+    """
+    The last statistics computed for a batch (see :func:`compute_stats`),
+    which are None when the batch has no edits or when they have not
+    been computed yet. They are computed again in the background when
+    they are older than the batch.
+    """
+    cached = cache.get(stats_key(batch.id))
+    if cached is None or cached['version'] != batch.version:
+        transaction.on_commit(lambda: schedule_batch_stats([batch.id]))
+    return cached and cached['stats']
+
+def refresh_batch_stats(batch):
+    """
+    Computes the statistics of a batch and caches them with its version
+    (even when they are None, so that empty batches are not recomputed).
+    """
+    stats = compute_stats(load_columns(batch))
+    cache.set(stats_key(batch.id), {'version': batch.version, 'stats': stats},
+        settings.BATCH_STATS_CACHE_TIMEOUT)
+    cache.delete(stats_key(batch.id) + ':scheduled')
+    return stats
+
+def schedule_batch_stats(batch_ids, delay=0):
+    """
+    Schedules the computation of the statistics of batches in `delay`
+    seconds, unless it is scheduled already: the statistics of a running
+    batch are computed at most once in this delay.
+    """
+    from .tasks import compute_batch_stats
+
+    for batch_id in batch_ids:
+        # the mark expires in case the task is lost
+        if not cache.add(stats_key(batch_id) + ':scheduled', True, delay + 5*60):
+            continue
+        try:
+            compute_batch_stats.apply_async(args=[batch_id], countdown=delay)
+        except OperationalError as e:
+            logger.warning('Could not schedule the statistics of batch %s: %s', batch_id, e)
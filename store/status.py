@@ -0,0 +1,108 @@
+"""
+The freshness of the ingested edits: the listener records the newest
+event of each chunk it ingests, and the lag behind the stream is
+shown on the pages and the API.
+"""
+from bisect import bisect_left
+from datetime import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from pytz import UTC
+
+from .models import IngestionStatus
+from .utils import incr_counter
+
+#: Upper bounds of the buckets of the histogram of ingestion lags, in seconds
+LAG_BUCKETS = (1, 5, 10, 30, 60, 300, 900, 3600)
+#: Cache keys of the counters of the lags in each bucket
+#: (above the bound of the previous one and up to its own)
+lag_keys = ['ingestionlag:bucket:{}'.format(bound) for bound in LAG_BUCKETS + ('inf',)]
+lag_sum_key = 'ingestionlag:sum'
+#: The status shown on the pages is read again after this number of seconds
+STATUS_CHECK_INTERVAL = 5
+
+_status = {'checked_at': None, 'row': None}
+
+
+def record_chunk(events):
+    """
+    Records that a chunk of events of the stream was ingested
+    (the chunk can be padded with None values).
+    """
+    timestamps = [event['timestamp'] for event in events if event]
+    if not timestamps:
+        return
+    now = datetime.now(UTC)
+    newest = datetime.fromtimestamp(max(timestamps), tz=UTC)
+    IngestionStatus.objects.update_or_create(id=1,
+        defaults={'event_timestamp': newest, 'committed': now})
+    _status['checked_at'] = None
+    record_lag((now - newest).total_seconds())
+
+def record_lag(seconds):
+    """
+    Counts a lag in the histogram.
+    """
+    incr_counter(lag_keys[bisect_left(LAG_BUCKETS, seconds)])
+    incr_counter(lag_sum_key, max(0, int(round(seconds))))
+
+def lag_histogram():
+    """
+    The histogram of the lags, in the format of Prometheus: the
+    buckets are cumulative, each counts the lags up to its bound.
+    """
+    counts = cache.get_many(lag_keys + [lag_sum_key])
+    buckets = []
+    total = 0
+    for bound, key in zip(LAG_BUCKETS + (None,), lag_keys):
+        total += counts.get(key, 0)
+        buckets.append({'le': bound, 'count': total})
+    return {
+        'buckets': buckets,
+        'count': total,
+        'sum': counts.get(lag_sum_key, 0),
+    }
+
+def ingestion_status(max_age=0):
+    """
+    The time of the newest event ingested and of its ingestion,
+    and how long ago they were, in seconds.
+
+    :param max_age: for how many seconds the status read
+        by this process can be reused
+    """
+    now = time.monotonic()
+    if _status['checked_at'] is None or now - _status['checked_at'] > max_age:
+        _status['row'] = IngestionStatus.objects.filter(id=1).first()
+        _status['checked_at'] = now
+    status = _status['row']
+    if status is None:
+        return {
+            'event_timestamp': None,
+            'committed': None,
+            'lag': None,
+            'seconds_since_commit': None,
+            'lagging': None,
+        }
+    now = datetime.now(UTC)
+    lag = int((now - status.event_timestamp).total_seconds())
+    return {
+        'event_timestamp': status.event_timestamp,
+        'committed': status.committed,
+        'lag': lag,
+        'seconds_since_commit': int((now - status.committed).total_seconds()),
+        'lagging': lag > settings.INGESTION_LAG_WARNING,
+    }
+
+def context_processor(request):
+    """
+    Adds the ingestion lag to the pages when it is above the
+    threshold, so that they can warn that batches may look finished
+    while they are still running.
+    """
+    status = ingestion_status(max_age=STATUS_CHECK_INTERVAL)
+    if status['lagging']:
+        return {'ingestion_lag': status['lag']}
+    return {}
@@ -0,0 +1,31 @@
+from datetime import date
+from datetime import timedelta
+
+from django.conf import settings
+from editgroups.celery import app
+from .models import Batch
+from .models import DailyToolStats
+from .models import DailyUserStats
+from .models import DailyTagStats
+from .stats import refresh_batch_stats
+
+
+@app.task(name='reconcile_daily_stats')
+def reconcile_daily_stats(days=None):
+    """
+    Recomputes the daily rollups of the last days (including today),
+    to make up for the counts missed or duplicated by the ingestion.
+    """
+    until = date.today() + timedelta(days=1)
+    since = until - timedelta(days=days or settings.DAILY_STATS_RECONCILE_DAYS)
+    for model in (DailyToolStats, DailyUserStats, DailyTagStats):
+        model.reconcile(since, until)
+
+@app.task(name='compute_batch_stats')
+def compute_batch_stats(batch_id):
+    """
+    Computes the statistics of a batch, shown on its page.
+    """
+    batch = Batch.objects.filter(id=batch_id).first()
+    if batch is not None:
+        refresh_batch_stats(batch)
@@ -3,17 +3,82 @@ from datetime import datetime
 import unittest
 from pytz import UTC
 import html5lib
+import contextlib
+import io
+import os
+import signal
+import tempfile
+import csv
+import gzip
+import json
+import re
+from unittest.mock import Mock
+from unittest.mock import patch
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.test import TestCase
 from django.test import Client
+from django.test import override_settings
+from django.test import RequestFactory
+from django.db.models import Q
+from django.db.models import F
+from django.core.cache import cache
+from django.core.management import call_command
 from django.urls import reverse
+from django.urls import get_resolver
+from django.urls import URLResolver
+from django.contrib.auth.models import User
 from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from django.utils.translation import ugettext_lazy
 from caching import invalidation
 
+from tagging.models import Tag
+from tagging.filters import TaggingFilterBackend
+from revert.models import RevertTask
+from editgroups.profiling import profiled
+from editgroups.profiling import profiling_enabled
+from editgroups.profiling import switch_profiling
+from editgroups.profiling import SignalProfiler
+
 from .models import Tool
 from .models import Edit
 from .models import Batch
+from .models import Username
+from .models import BatchArchive
+from .models import EditPartition
+from .models import BatchProperty
+from .models import DailyToolStats
+from .models import DailyUserStats
+from .models import DailyTagStats
+from .management.commands.partition_edits import partition_definitions
+from .management.commands.export_columnar import keyset_chunks
+from .management.commands.export_columnar import pyarrow as columnar_pyarrow
+from .models import parse_title
+from .models import parse_autocomment
 from .stream import WikidataEditStream
+from .serializers import BatchSimpleSerializer
+from .serializers import EditSerializer
+from .serializers import EditRowSerializer
+from .renderers import FastJSONRenderer
+from .fragments import BatchRowCache
+from .live import batch_updates
+from .live import publish_batch_updates
+from .export import iterate_edit_rows
+from .stats import batch_stats
+from .stats import refresh_batch_stats
+from .stats import compute_stats
+from .stats import numpy
+from .tasks import reconcile_daily_stats
+from .tasks import compute_batch_stats
+from .status import record_chunk
+from .status import record_lag
+from .status import lag_histogram
+from .status import context_processor as status_context_processor
+from .status import ingestion_status
+from .status import _status as ingestion_status_memo
+from .utils import grouper
 
 class ToolTest(TestCase):
     def setUp(self):
@@ -135,6 +200,81 @@ class EditTest(TestCase):
         self.assertEquals('https://www.wikidata.org/wiki/index.php?diff=644512815&oldid=376870215', edit.url)
         self.assertEquals('<Edit https://www.wikidata.org/wiki/index.php?diff=644512815&oldid=376870215 >', str(edit))
 
+    def test_derived_uri(self):
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        edit = Edit.objects.all().order_by('timestamp')[0]
+        self.assertEquals('https://www.wikidata.org/wiki/Q4115189', edit.uri)
+        edit.title = 'Wikidata:WikiProject every politician/Spain/data/Deputies/1st (bio)'
+        self.assertEquals('https://www.wikidata.org/wiki/Wikidata:WikiProject_every_politician/Spain/data/Deputies/1st_(bio)', edit.uri)
+
+    def test_compressed_parsedcomment(self):
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        edit = Edit.objects.all().order_by('timestamp')[0]
+        self.assertTrue(edit.parsedcomment.startswith('\u200e<span dir="auto"><span class="autocomment">Created claim: </span></span>'))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT parsedcomment FROM store_edit WHERE id = %s', [edit.id])
+            stored = cursor.fetchone()[0]
+        self.assertTrue(len(stored) < len(edit.parsedcomment.encode('utf-8')) / 2)
+
+    def test_parse_title(self):
+        self.assertEquals((1, 42, None), parse_title('Q42'))
+        self.assertEquals((2, 31, None), parse_title('Property:P31'))
+        self.assertEquals((3, 7, None), parse_title('Lexeme:L7'))
+        self.assertEquals((None, None, 'User:Pintoch'), parse_title('User:Pintoch'))
+        self.assertEquals((None, None, 'P31'), parse_title('P31'))
+
+    def test_interned_titles_and_users(self):
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_new_items.json')
+        edit = Edit.objects.all().order_by('timestamp')[0]
+        self.assertEquals('Q50570219', edit.title)
+        self.assertEquals((1, 50570219), (edit.entity_type, edit.entity_id))
+        self.assertEquals('QuickStatementsBot', edit.user)
+        self.assertEquals({'QuickStatementsBot', 'Beireke1'}, set(Username.objects.values_list('name', flat=True)))
+
+    def test_parse_autocomment(self):
+        autocomment = parse_autocomment('/* wbsetclaim-create:2||1 */ [[Property:P1297]]: [[Q5]], #quickstatements')
+        self.assertEquals(('wbsetclaim-create', None, 1297, 1, 5, None), autocomment)
+        self.assertEquals(('wbsetlabel-add', 'ru', None, None, None, None),
+            parse_autocomment('/* wbsetlabel-add:1|ru */ Eupelops brevicuspis'))
+        self.assertEquals(('undo', None, None, None, None, 1234),
+            parse_autocomment('/* undo:0||1234|Rageux */ this was just dumb'))
+        self.assertEquals((None, None, None, None, None, None), parse_autocomment('just an edit'))
+
+    def test_parsed_autocomments(self):
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        edit = Edit.objects.order_by('timestamp')[0]
+        self.assertEquals('wbcreateclaim-create', edit.action)
+        self.assertEquals((3896, None), (edit.property_id, edit.target_id))
+        response = self.client.get(reverse('batch-edits', args=['QSv2', '2120'])+'?format=json&action=wbsetlabel-add')
+        self.assertEqual(0, response.data['count'])
+        response = self.client.get(reverse('batch-edits', args=['QSv2', '2120'])+'?format=json&action=wbcreateclaim-create')
+        self.assertEqual(4, response.data['count'])
+
+    def test_intern(self):
+        ids = Username.intern(['Pintoch', 'Beireke1'])
+        self.assertEquals(ids, Username.intern(['Beireke1', 'Pintoch', 'Pintoch']))
+        self.assertEquals(2, Username.objects.count())
+
+    def test_intern_similar_names(self):
+        # distinct users, even for the default collation of MySQL
+        names = ['José', 'Jose', 'FooBar', 'Foobar']
+        ids = Username.intern(names[:2])
+        ids.update(Username.intern(names))
+        self.assertEquals(4, len(set(ids.values())))
+        self.assertEquals(names, [Username.objects.get(id=ids[name]).name for name in names])
+
+    def test_compact_lookups(self):
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_new_items.json')
+        self.assertEquals(Edit.objects.filter(username__name='Beireke1').count(),
+            Edit.objects.filter(user='Beireke1').count())
+        self.assertEquals(0, Edit.objects.exclude(user__in=['Beireke1', 'QuickStatementsBot']).count())
+        on_item = Edit.objects.filter(entity_type=1, entity_id=50570219).count()
+        self.assertEquals({'Q50570219'}, {edit.title for edit in Edit.objects.filter(title='Q50570219')})
+        self.assertEquals(on_item, Edit.objects.filter(title__in=['Q50570219', 'User:Nobody']).count())
+        self.assertEquals(0, Edit.objects.filter(title='User:Nobody').count())
+        batch = Batch.objects.get(user='Beireke1')
+        self.assertEquals('Beireke1', batch.user)
+
 class BatchEditsViewTest(APITestCase):
     @classmethod
     def setUpClass(cls):
@@ -157,6 +297,932 @@ class BatchEditsViewTest(APITestCase):
     def tearDownClass(cls):
         Batch.objects.all().delete()
 
+class BatchArchiveTest(APITestCase):
+    def setUp(self):
+        invalidation.cache.clear()
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_new_items.json')
+        self.batch = Batch.objects.get()
+        self.latest_edits = list(self.batch.ordered_edits.values_list('newrevid', flat=True))
+
+    def test_archive(self):
+        aggregates = (self.batch.nb_reverted, self.batch.nb_pages, self.batch.nb_new_pages, self.batch.avg_diffsize)
+        BatchArchive.archive(self.batch, chunk_size=20)
+        self.assertEquals(0, Edit.objects.count())
+
+        batch = Batch.objects.get()
+        self.assertTrue(batch.archived)
+        self.assertEquals(aggregates, (batch.nb_reverted, batch.nb_pages, batch.nb_new_pages, batch.avg_diffsize))
+        edits = batch.ordered_edits
+        self.assertEquals(82, len(edits))
+        self.assertEquals(self.latest_edits, [edit.newrevid for edit in edits])
+        self.assertEquals(self.latest_edits[15:45], [edit.newrevid for edit in edits[15:45]])
+        self.assertEquals('QuickStatementsBot', edits[-1].user)
+
+    def test_archived_edits_view(self):
+        BatchArchive.archive(self.batch, chunk_size=20)
+        response = self.client.get(reverse('batch-edits', args=['QSv2', '2213'])+'?format=json&offset=30')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(82, response.data['count'])
+        self.assertEqual(self.latest_edits[30:80], [edit['newrevid'] for edit in response.data['results']])
+        response = self.client.get(self.batch.url)
+        self.assertEqual(200, response.status_code)
+
+    def test_restore(self):
+        BatchArchive.archive(self.batch, chunk_size=20)
+        Batch.objects.get().archive.restore()
+        batch = Batch.objects.get()
+        self.assertFalse(batch.archived)
+        self.assertEquals(0, BatchArchive.objects.count())
+        self.assertEquals(self.latest_edits, list(batch.ordered_edits.values_list('newrevid', flat=True)))
+
+@override_settings(PARTITION_EDITS=True)
+class EditPartitionTest(TestCase):
+    def setUp(self):
+        invalidation.cache.clear()
+        for max_id in [680000000, 685000000, 690000000, 695000000]:
+            EditPartition.objects.create(name='p{}'.format(max_id), max_id=max_id, complete=max_id < 690000000)
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_new_items.json')
+        EditPartition.objects.get(max_id=690000000).mark_complete()
+        self.old_batch = Batch.objects.get(uid='2120')
+        self.new_batch = Batch.objects.get(uid='2213')
+
+    def test_include_edits(self):
+        partition = EditPartition.objects.get(max_id=685000000)
+        self.assertEquals(self.old_batch.started, partition.min_timestamp)
+        self.assertEquals(self.old_batch.ended, partition.max_timestamp)
+        self.assertEquals(None, EditPartition.objects.get(max_id=680000000).min_timestamp)
+
+    def test_bounds(self):
+        self.assertEquals(Q(id__gte=680000000, id__lt=685000000), self.old_batch.partition_bounds)
+        self.assertEquals(Q(id__gte=685000000), self.new_batch.partition_bounds)
+        self.assertEquals(4, self.old_batch.partitioned_edits.count())
+        self.assertEquals(82, self.new_batch.partitioned_edits.count())
+        self.assertEquals(82, self.new_batch.ordered_edits.count())
+
+    def test_partition_definitions(self):
+        self.assertEquals('PARTITION p10 VALUES LESS THAN (10), PARTITION p20 VALUES LESS THAN (20), '
+            'PARTITION pmax VALUES LESS THAN MAXVALUE', partition_definitions([10, 20]))
+
+class BatchPropertyTest(APITestCase):
+    def setUp(self):
+        invalidation.cache.clear()
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_new_items.json')
+        self.batch = Batch.objects.get(uid='2120')
+
+    def test_index(self):
+        expected = {3896: 1, 2534: 1, 18: 1, 856: 1}
+        self.assertEquals(expected, dict(self.batch.properties.values_list('property_id', 'nb_edits')))
+        # ingesting the same edits again does not change the counts
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        self.assertEquals(expected, dict(self.batch.properties.values_list('property_id', 'nb_edits')))
+
+    def test_filter(self):
+        for value in ['P3896', '3896', 'Property:P3896']:
+            response = self.client.get(reverse('api-list-batches')+'?format=json&property='+value)
+            self.assertEqual(['2120'], [batch['uid'] for batch in response.data['results']])
+        response = self.client.get(reverse('api-list-batches')+'?format=json&property=P9999')
+        self.assertEqual(0, response.data['count'])
+        response = self.client.get(reverse('api-list-batches')+'?format=json&tool=QSv2&property=Q42')
+        self.assertEqual(0, response.data['count'])
+        response = self.client.get(reverse('list-batches')+'?property=P3896')
+        self.assertContains(response, 'Property:P3896')
+
+class EntityViewTest(APITestCase):
+    def setUp(self):
+        invalidation.cache.clear()
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_reverts.json')
+
+    def test_entity_history(self):
+        response = self.client.get(reverse('api-entity-view', args=['Q4115189'])+'?format=json')
+        self.assertEqual(200, response.status_code)
+        edits = response.data['results']
+        self.assertEqual(Edit.objects.filter(entity_type=1, entity_id=4115189).count(), response.data['count'])
+        self.assertEqual(sorted([edit['timestamp'] for edit in edits], reverse=True), [edit['timestamp'] for edit in edits])
+        self.assertEqual(['2121', '2120'], [batch['uid'] for batch in response.data['batches']])
+        self.assertEqual('QSv2', edits[0]['batch']['tool']['shortid'])
+        self.assertFalse(response.data['archived_batches_not_listed'])
+
+    def test_archived_batches(self):
+        BatchArchive.archive(Batch.objects.get(uid='2121'))
+        response = self.client.get(reverse('api-entity-view', args=['Q4115189'])+'?format=json')
+        self.assertEqual(['2120'], [batch['uid'] for batch in response.data['batches']])
+        self.assertTrue(response.data['archived_batches_not_listed'])
+        response = self.client.get(reverse('entity-view', args=['Q4115189']))
+        self.assertContains(response, 'their edits are not listed here')
+
+    def test_html(self):
+        response = self.client.get(reverse('entity-view', args=['Q4115189']))
+        self.assertEqual(200, response.status_code)
+        html5lib.HTMLParser(strict=True).parse(response.content)
+
+    def test_not_an_entity(self):
+        response = self.client.get(reverse('api-entity-view', args=['User:Pintoch'])+'?format=json')
+        self.assertEqual(404, response.status_code)
+
+class RevisionsBatchesViewTest(APITestCase):
+    def setUp(self):
+        invalidation.cache.clear()
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+
+    def test_revids(self):
+        url = reverse('api-revisions-batches')+'?format=json&revids=645094166|645094153|1'
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        revisions = response.data['revisions']
+        self.assertEqual(['645094166', '645094153', '1'], list(revisions))
+        self.assertEqual('QSv2/2120', revisions['645094166']['full_uid'])
+        self.assertEqual(None, revisions['1'])
+        self.assertIn('max-age=', response['Cache-Control'])
+
+    def test_rcids(self):
+        edit = Edit.objects.order_by('id')[0]
+        response = self.client.get(reverse('api-revisions-batches')+'?format=json&rcids={},1'.format(edit.id))
+        self.assertEqual(edit.batch.url, response.data['rcids'][str(edit.id)]['url'])
+
+    def test_archived(self):
+        edits = list(Edit.objects.order_by('id'))
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_new_items.json')
+        BatchArchive.archive(Batch.objects.get(uid='2120'), chunk_size=3)
+        url = reverse('api-revisions-batches')+'?format=json&revids={}|{}|1'.format(edits[0].newrevid, edits[-1].newrevid)
+        revisions = self.client.get(url).data['revisions']
+        self.assertEqual('QSv2/2120', revisions[str(edits[0].newrevid)]['full_uid'])
+        self.assertEqual('QSv2/2120', revisions[str(edits[-1].newrevid)]['full_uid'])
+        self.assertEqual(None, revisions['1'])
+        response = self.client.get(reverse('api-revisions-batches')+'?format=json&rcids={}'.format(edits[1].id))
+        self.assertEqual('QSv2/2120', response.data['rcids'][str(edits[1].id)]['full_uid'])
+
+    def test_invalid(self):
+        url = reverse('api-revisions-batches')+'?format=json'
+        self.assertEqual(400, self.client.get(url).status_code)
+        self.assertEqual(400, self.client.get(url+'&revids=12|abc').status_code)
+        self.assertEqual(400, self.client.get(url+'&revids='+'|'.join(map(str, range(1000)))).status_code)
+
+class SparseFieldsetsTest(APITestCase):
+    expensive_fields = ['nb_reverted', 'nb_revertable_edits', 'nb_pages', 'nb_new_pages',
+        'nb_existing_pages', 'entities_speed', 'avg_diffsize', 'can_be_reverted',
+        'active_revert_task', 'edits', 'tags']
+
+    def setUp(self):
+        invalidation.cache.clear()
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        self.url = reverse('api-batch-view', args=['QSv2', '2120'])+'?format=json&'
+
+    def get(self, url):
+        invalidation.cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        return response, len(queries)
+
+    def test_fields(self):
+        response, nb_queries = self.get(self.url+'fields=nb_edits,ended')
+        self.assertEqual({'nb_edits', 'ended'}, set(response.data))
+        # only the batch itself is fetched
+        self.assertEqual(1, nb_queries)
+
+    def test_omit(self):
+        response, nb_queries = self.get(self.url+'omit='+','.join(self.expensive_fields))
+        self.assertFalse(set(self.expensive_fields) & set(response.data))
+        self.assertIn('nb_edits', response.data)
+        self.assertEqual(1, nb_queries)
+
+    def test_omitted_fields_cost_no_queries(self):
+        for field in self.expensive_fields:
+            response, nb_queries = self.get(self.url+'fields=nb_edits,'+field)
+            self.assertIn(field, response.data)
+            self.assertTrue(nb_queries > 1, field)
+
+    def test_batches_list(self):
+        response, nb_queries = self.get(reverse('api-list-batches')+'?format=json&fields=uid,nb_edits')
+        self.assertEqual([{'uid': '2120', 'nb_edits': 4}], response.data['results'])
+        # count and batches
+        self.assertEqual(2, nb_queries)
+
+class RowSerializersTest(APITestCase):
+    def setUp(self):
+        invalidation.cache.clear()
+        for fname in ['one_qs_batch', 'qs_batch_with_new_items', 'qs_batch_with_terms']:
+            Edit.ingest_jsonlines('store/testdata/{}.json'.format(fname))
+
+    def assertSameContent(self, url, serializer, queryset):
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        # what JSONRenderer returned for the serializer, before the row serializers
+        expected = dict(response.data, results=serializer(queryset, many=True).data)
+        self.assertEqual(JSONRenderer().render(expected), response.content)
+
+    def test_batches(self):
+        batches = Batch.objects.order_by('-started')
+        self.assertSameContent(reverse('api-list-batches')+'?format=json',
+            BatchSimpleSerializer, batches)
+        self.assertSameContent(reverse('api-list-batches')+'?format=json&limit=1&offset=1',
+            BatchSimpleSerializer, batches[1:2])
+
+    def test_edits(self):
+        batch = Batch.objects.get(uid='2213')
+        url = reverse('api-batch-edits', args=['QSv2', '2213'])+'?format=json'
+        self.assertSameContent(url, EditSerializer, batch.ordered_edits[:50])
+        self.assertSameContent(url+'&limit=20&offset=70', EditSerializer, batch.ordered_edits[70:90])
+        self.assertSameContent(url+'&action=wbcreateclaim-create', EditSerializer,
+            batch.ordered_edits.filter(action='wbcreateclaim-create')[:50])
+
+    def test_archived_edits(self):
+        batch = Batch.objects.get(uid='2120')
+        BatchArchive.archive(batch)
+        batch = Batch.objects.get(uid='2120')
+        self.assertSameContent(reverse('api-batch-edits', args=['QSv2', '2120'])+'?format=json',
+            EditSerializer, batch.ordered_edits)
+
+    def test_native_rows(self):
+        batch = Batch.objects.get(uid='2120')
+        edit = batch.ordered_edits.first()
+        row = EditRowSerializer.to_representation(
+            EditRowSerializer.values_queryset(batch.ordered_edits)[:1], native=True)[0]
+        self.assertEqual(edit.timestamp, row['timestamp'])
+        self.assertEqual(edit.newlength - edit.oldlength, row['diffsize'])
+        self.assertNotIn('href="/wiki/', row['parsedcomment'])
+        self.assertIn('href="https://www.wikidata.org/wiki/', row['parsedcomment'])
+        # archived edits give the same rows
+        self.assertEqual(row, EditRowSerializer.to_representation([edit], native=True)[0])
+
+    def test_html_pages(self):
+        BatchArchive.archive(Batch.objects.get(uid='2120'))
+        for url in [reverse('list-batches'),
+                    reverse('batch-view', args=['QSv2', '2120']),
+                    reverse('batch-edits', args=['QSv2', '2120']),
+                    reverse('batch-edits', args=['QSv2', '2213']),
+                    reverse('entity-view', args=['Q4115189'])]:
+            response = self.client.get(url)
+            self.assertEqual(200, response.status_code)
+            # dates are formatted from datetimes, not printed as ISO strings
+            self.assertRegex(response.content.decode('utf-8'), r'March \d+, 2018, \d')
+            self.assertNotIn('2018-03-', response.content.decode('utf-8'))
+
+    def test_renderer(self):
+        data = {'text': 'line\u2028separator\n\x01 – ok', 'ids': [1, None, True]}
+        self.assertEqual(JSONRenderer().render(data), FastJSONRenderer().render(data))
+        # not supported by orjson
+        data = {'name': ugettext_lazy('adds claims'), 1: 'one'}
+        self.assertEqual(JSONRenderer().render(data), FastJSONRenderer().render(data))
+
+@override_settings(BATCH_ROWS_STATS_SAMPLING=1)
+class BatchRowCacheTest(TestCase):
+    def setUp(self):
+        invalidation.cache.clear()
+        cache.clear()
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+
+    def test_version(self):
+        # bumped by each chunk of ingested edits containing the batch
+        batch = Batch.objects.get()
+        self.assertTrue(batch.version >= 1)
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_reverts.json')
+        self.assertEqual(batch.version, Batch.objects.get(id=batch.id).version)
+        self.assertTrue(Batch.objects.get(uid='2121').version >= 1)
+
+    def test_cached_rows(self):
+        url = reverse('list-batches')
+        first = self.client.get(url).content
+        self.assertEqual({'hits': 0, 'misses': 1, 'hit_rate': 0.}, BatchRowCache.stats())
+        self.assertEqual(first, self.client.get(url).content)
+        self.assertEqual({'hits': 1, 'misses': 1, 'hit_rate': .5}, BatchRowCache.stats())
+
+        # rows are only rendered again when the batch changes
+        Batch.objects.update(summary='new summary')
+        self.assertNotIn('new summary', self.client.get(url).content.decode('utf-8'))
+        Batch.objects.update(version=F('version') + 1)
+        self.assertIn('new summary', self.client.get(url).content.decode('utf-8'))
+        self.assertEqual(2, BatchRowCache.stats()['misses'])
+
+    def test_filters(self):
+        content = self.client.get(reverse('list-batches')+'?user=Pintoch').content.decode('utf-8')
+        self.assertIn('class="selected-user">Pintoch</a>', content)
+        content = self.client.get(reverse('list-batches')).content.decode('utf-8')
+        self.assertNotIn('class="selected-user"', content)
+        self.assertEqual(2, BatchRowCache.stats()['misses'])
+
+        response = self.client.get(reverse('api-batch-row-cache-stats')+'?format=json')
+        self.assertEqual({'hits': 0, 'misses': 2, 'hit_rate': 0.}, response.data)
+
+    def test_pagination(self):
+        # the rows are shared by the pages, whose filter links go back to the first page
+        self.client.get(reverse('list-batches')+'?user=Pintoch')
+        content = self.client.get(reverse('list-batches')+'?offset=0&limit=20&user=Pintoch').content.decode('utf-8')
+        self.assertEqual({'hits': 1, 'misses': 1, 'hit_rate': .5}, BatchRowCache.stats())
+        self.assertIn('href="/?user=Pintoch&amp;tool=QSv2"', content)
+
+    @override_settings(BATCH_ROWS_STATS_SAMPLING=0)
+    def test_sampling(self):
+        self.client.get(reverse('list-batches'))
+        self.assertEqual({'hits': 0, 'misses': 0, 'hit_rate': None}, BatchRowCache.stats())
+
+class BatchUpdatesTest(TestCase):
+    def setUp(self):
+        invalidation.cache.clear()
+
+    def test_new_edits(self):
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        batch = Batch.objects.get()
+        updates = batch_updates([batch], {batch.id: {'wbcreateclaim-create', 'lang-en'}})
+        self.assertEqual([{
+            'full_uid': 'QSv2/2120',
+            'nb_edits': 4,
+            'ended': '2018-03-07T16:20:14Z',
+            'tags': [
+                {'id': 'wbcreateclaim-create', 'priority': 10, 'display_name': 'adds claims', 'color': '#5cb85c'},
+            ],
+        }], updates)
+
+    def test_reverted_edits(self):
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_reverts.json')
+        reverted = list(Edit.objects.filter(reverted=True).values_list('newrevid', flat=True))
+        self.assertTrue(reverted)
+        updates = batch_updates([], reverted_ids=reverted)
+        self.assertEqual(1, len(updates))
+        batch = Batch.objects.get(uid='2121')
+        self.assertEqual({'full_uid': 'QSv2/2121', 'nb_reverted': batch.nb_reverted}, updates[0])
+        self.assertTrue(batch.nb_reverted > 0)
+
+    def test_stream_view(self):
+        response = self.client.get(reverse('api-batch-updates')+'?batches=QSv2/2120')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('text/event-stream', response['Content-Type'])
+        self.assertTrue(response.streaming)
+
+    def test_pages(self):
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        for url in [reverse('list-batches'), reverse('batch-view', args=['QSv2', '2120'])]:
+            content = self.client.get(url).content.decode('utf-8')
+            self.assertNotIn('data-live-updates', content)
+            with self.settings(LIVE_UPDATES_URL='/live/stream/'):
+                content = self.client.get(url).content.decode('utf-8')
+            self.assertIn('data-live-updates="/live/stream/?batches=QSv2/2120"', content)
+            self.assertIn('data-batch="QSv2/2120"', content)
+
+    @override_settings(PUBLISH_BATCH_UPDATES=True)
+    def test_publish_without_subscribers(self):
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        batch = Batch.objects.get()
+        client = Mock()
+        client.pubsub_numsub.return_value = [(b'editgroups:batch-updates', 0)]
+        with patch('store.live.redis_client', return_value=client):
+            with self.assertNumQueries(0):
+                publish_batch_updates([batch])
+            client.publish.assert_not_called()
+            client.pubsub_numsub.return_value = [(b'editgroups:batch-updates', 1)]
+            publish_batch_updates([batch])
+            client.publish.assert_called_once()
+
+class BatchEditsExportTest(TestCase):
+    def setUp(self):
+        invalidation.cache.clear()
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_new_items.json')
+        self.batch = Batch.objects.get()
+        self.ids = sorted(self.batch.edits.values_list('id', flat=True))
+
+    def get(self, export_format, params='', **kwargs):
+        response = self.client.get(reverse('api-batch-edits-export',
+            args=['QSv2', '2213', export_format])+params, **kwargs)
+        self.assertEqual(200, response.status_code)
+        return b''.join(response.streaming_content), response
+
+    def test_fields(self):
+        self.assertEqual(list(EditSerializer().fields), list(EditRowSerializer.fields))
+
+    def test_keyset_chunks(self):
+        chunks = list(iterate_edit_rows(self.batch, chunk_size=10))
+        self.assertEqual(9, len(chunks))
+        self.assertEqual(self.ids, [row['id'] for chunk in chunks for row in chunk])
+
+    def test_archived_chunks(self):
+        BatchArchive.archive(self.batch, chunk_size=30)
+        batch = Batch.objects.get()
+        chunks = list(iterate_edit_rows(batch, chunk_size=10))
+        self.assertEqual(9, len(chunks))
+        self.assertEqual(set(self.ids), {row['id'] for chunk in chunks for row in chunk})
+
+    def test_ndjson(self):
+        content, response = self.get('ndjson')
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        edits = [json.loads(line) for line in content.decode('utf-8').splitlines()]
+        self.assertEqual(self.ids, [edit['id'] for edit in edits])
+        self.assertEqual(list(EditRowSerializer.fields), list(edits[0]))
+
+    def test_csv(self):
+        content, response = self.get('csv', '?fields=id,title,reverted')
+        self.assertEqual('attachment; filename="QSv2-2213-edits.csv"', response['Content-Disposition'])
+        rows = list(csv.reader(content.decode('utf-8').splitlines()))
+        self.assertEqual(['id', 'title', 'reverted'], rows[0])
+        self.assertEqual([str(id) for id in self.ids], [row[0] for row in rows[1:]])
+
+    def test_gzip(self):
+        content, response = self.get('ndjson', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual(self.get('ndjson')[0], gzip.decompress(content))
+
+    def test_errors(self):
+        url = reverse('api-batch-edits-export', args=['QSv2', '2213', 'csv'])
+        self.assertEqual(400, self.client.get(url+'?fields=id,unknown').status_code)
+        self.assertEqual(404, self.client.get(url.replace('.csv', '.xml')).status_code)
+        self.assertEqual(404, self.client.get(url.replace('2213', '9999')).status_code)
+
+@unittest.skipUnless(columnar_pyarrow, 'pyarrow is not installed')
+class ColumnarExportTest(TestCase):
+    def setUp(self):
+        invalidation.cache.clear()
+        # edits are ingested in the order of their ids, like from the stream
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+
+    def read(self, directory, table):
+        import pyarrow.dataset
+        return pyarrow.dataset.dataset(os.path.join(directory, table),
+            partitioning='hive').to_table().to_pylist()
+
+    def test_keyset_chunks(self):
+        ids = sorted(Edit.objects.values_list('id', flat=True))
+        chunks = list(keyset_chunks(Edit.objects.values('id'), 3))
+        self.assertEqual([3, 1], [len(chunk) for chunk in chunks])
+        self.assertEqual(ids, [row['id'] for chunk in chunks for row in chunk])
+        self.assertEqual(ids[2:], [row['id'] for chunk in keyset_chunks(Edit.objects.values('id'), 3, ids[1]) for row in chunk])
+
+    def test_incremental_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            def read(table):
+                return self.read(directory, table)
+
+            call_command('export_columnar', directory, stdout=open(os.devnull, 'w'))
+            self.assertEqual(4, len(read('edits')))
+            self.assertEqual(['2120'], [batch['uid'] for batch in read('batches')])
+            self.assertEqual(['2018-03'], list({edit['month'] for edit in read('edits')}))
+            self.assertEqual(Tag.batches.through.objects.count(), len(read('batch_tags')))
+
+            Edit.ingest_jsonlines('store/testdata/qs_batch_with_new_items.json')
+            call_command('export_columnar', directory, '--chunk-size', '20', stdout=open(os.devnull, 'w'))
+            self.assertEqual(Edit.objects.count(), len(read('edits')))
+            self.assertEqual(sorted(Edit.objects.values_list('id', flat=True)),
+                sorted(edit['id'] for edit in read('edits')))
+            self.assertEqual(['2120', '2213'], sorted(batch['uid'] for batch in read('batches')))
+
+    def test_changed_rows(self):
+        def latest(table, key='id'):
+            rows = {}
+            for row in sorted(self.read(directory, table), key=lambda row: row['exported']):
+                rows[row[key]] = row
+            return rows
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('export_columnar', directory, stdout=open(os.devnull, 'w'))
+            edit = Edit.objects.order_by('id')[0]
+            self.assertFalse(latest('edits')[edit.id]['reverted'])
+            self.assertEqual(0, latest('batches')[edit.batch_id]['nb_reverted'])
+
+            # an edit is undone and a tag is removed from the batch
+            Edit.ingest_edits([{
+                'id': edit.id + 10**6, 'type': 'edit', 'title': edit.title, 'namespace': 0,
+                'revision': {'old': edit.newrevid, 'new': edit.newrevid + 10**6},
+                'length': {'old': 100, 'new': 90}, 'timestamp': int(edit.timestamp.timestamp()) + 60,
+                'comment': '/* undo:0||{}|QuickStatementsBot */'.format(edit.newrevid),
+                'parsedcomment': '', 'bot': False, 'minor': False, 'user': 'Reviewer', 'patrolled': True,
+            }])
+            Tag.batches.through.objects.filter(batch_id=edit.batch_id)[0].delete()
+            call_command('export_columnar', directory, stdout=open(os.devnull, 'w'))
+
+            self.assertTrue(latest('edits')[edit.id]['reverted'])
+            self.assertEqual(4, len(latest('edits')))
+            batch = latest('batches')[edit.batch_id]
+            self.assertEqual(1, batch['nb_reverted'])
+            links = [link for link in latest('batch_tags').values() if link['exported'] == batch['exported']]
+            self.assertEqual(sorted(Tag.batches.through.objects.filter(batch_id=edit.batch_id)
+                .values_list('tag_id', flat=True)), sorted(link['tag_id'] for link in links))
+
+class BatchStatsTest(TestCase):
+    def setUp(self):
+        invalidation.cache.clear()
+        cache.clear()
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_new_items.json')
+        self.batch = Batch.objects.get()
+
+    def test_compute_stats(self):
+        # 10 edits per minute during 20 minutes, with 100 edits in the 11th
+        timestamp = numpy.repeat(numpy.arange(20) * 60, 10)
+        timestamp = numpy.concatenate((timestamp, numpy.full(90, 10 * 60)))
+        stats = compute_stats({
+            'timestamp': timestamp,
+            'oldlength': numpy.zeros(len(timestamp), dtype='int64'),
+            'newlength': numpy.arange(len(timestamp)) % 20,
+            'namespace': numpy.zeros(len(timestamp), dtype='int64'),
+            'oldrevid': numpy.arange(len(timestamp)),
+        })
+        self.assertEqual(290, stats['nb_edits'])
+        self.assertEqual([0, 0, 0, 0, 0, 15, 135, 140, 0, 0, 0],
+            [bin['nb_edits'] for bin in stats['diffsize']['histogram']])
+        self.assertEqual(20, len(stats['timeline']['edits']))
+        self.assertEqual(100, stats['max_edits_per_minute'])
+        self.assertEqual([{'start': '1970-01-01T00:10:00Z', 'minutes': 1,
+            'nb_edits': 100, 'max_edits_per_minute': 100}], stats['bursts'])
+        self.assertEqual({'new': 1, 'existing': 289}, stats['pages'])
+
+    def test_batch_stats(self):
+        # computed in the background
+        self.assertEqual(None, batch_stats(self.batch))
+        stats = refresh_batch_stats(self.batch)
+        self.assertEqual(82, stats['nb_edits'])
+        self.assertAlmostEqual(self.batch.avg_diffsize, stats['diffsize']['mean'])
+        self.assertEqual(self.batch.nb_new_pages, stats['pages']['new'])
+        self.assertEqual(82, sum(stats['timeline']['edits']))
+        self.assertEqual(self.batch.started.timestamp(),
+            datetime.strptime(stats['timeline']['start'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=UTC).timestamp())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(stats, batch_stats(self.batch))
+
+        # the last statistics are shown until they are computed again
+        BatchArchive.archive(self.batch)
+        batch = Batch.objects.get()
+        batch.version += 1
+        self.assertEqual(stats, batch_stats(batch))
+        self.assertEqual(stats, refresh_batch_stats(batch))
+
+    def test_empty_batch(self):
+        self.batch.edits.all().delete()
+        self.assertEqual(None, refresh_batch_stats(self.batch))
+        with self.assertNumQueries(0):
+            self.assertEqual(None, batch_stats(self.batch))
+        self.assertEqual({'version': self.batch.version, 'stats': None},
+            cache.get('batchstats:{}'.format(self.batch.id)))
+
+    def test_api(self):
+        response = self.client.get(reverse('api-batch-stats', args=['QSv2', '2213']))
+        self.assertEqual(b'', response.content)
+        compute_batch_stats(self.batch.id)
+        response = self.client.get(reverse('api-batch-stats', args=['QSv2', '2213']))
+        self.assertEqual(batch_stats(self.batch), response.json())
+        response = self.client.get(reverse('batch-view', args=['QSv2', '2213']), HTTP_ACCEPT='text/html')
+        self.assertContains(response, 'Peak speed')
+
+class DailyStatsTest(TestCase):
+    def setUp(self):
+        invalidation.cache.clear()
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_reverts.json')
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_new_items.json')
+
+    def rollups(self, model):
+        return sorted(model.objects.values_list('day', model.key,
+            'nb_edits', 'nb_batches', 'nb_reverted', 'nb_new_pages'))
+
+    def test_ingestion(self):
+        day = datetime(2018, 3, 7).date()
+        tool = Tool.objects.get(shortid='QSv2')
+        self.assertEqual((day, tool.id, 9, 2, 2, 0), self.rollups(DailyToolStats)[0])
+        self.assertEqual([2, 1], [row[3] for row in self.rollups(DailyUserStats)])
+        self.assertEqual(Edit.objects.filter(reverted=True).count(),
+            sum(row[4] for row in self.rollups(DailyToolStats)))
+
+    def test_reconcile(self):
+        # the ingestion and the periodic recomputation agree
+        rollups = [self.rollups(model) for model in (DailyToolStats, DailyUserStats, DailyTagStats)]
+        for model in (DailyToolStats, DailyUserStats, DailyTagStats):
+            model.objects.update(nb_edits=0)
+            model.reconcile(datetime(2018, 3, 1).date(), datetime(2018, 4, 1).date())
+        self.assertEqual(rollups, [self.rollups(model) for model in (DailyToolStats, DailyUserStats, DailyTagStats)])
+
+        # the task only recomputes the last days
+        reconcile_daily_stats()
+        self.assertEqual(rollups[0], self.rollups(DailyToolStats))
+
+    def test_tags_added_later(self):
+        # the edits of a batch ingested before it gets a new tag are counted for that tag
+        DailyTagStats.objects.all().delete()
+        Batch.objects.all().delete()
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_new_items.json', batch_size=1)
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_reverts.json', batch_size=1)
+        rollups = self.rollups(DailyTagStats)
+        self.assertTrue(len({row[1] for row in rollups}) > 2)
+        DailyTagStats.reconcile(datetime(2018, 3, 1).date(), datetime(2018, 4, 1).date())
+        self.assertEqual(self.rollups(DailyTagStats), rollups)
+
+    def test_api(self):
+        url = reverse('api-daily-stats', args=['tools'])
+        response = self.client.get(url, {'since': '2018-03-01', 'until': '2018-03-31'})
+        self.assertEqual([{'tool': 'QSv2', 'name': 'QuickStatements', 'nb_edits': 91,
+            'nb_batches': 3, 'nb_reverted': 2, 'nb_new_pages': 9}], response.json()['totals'])
+        self.assertEqual(['2018-03-07', '2018-03-15'], [day['day'] for day in response.json()['days']])
+
+        url = reverse('api-daily-stats', args=['users'])
+        response = self.client.get(url, {'since': '2018-03-01', 'until': '2018-03-31', 'key': 'Beireke1'})
+        self.assertEqual(['2018-03-15'], [day['day'] for day in response.json()['days']])
+        self.assertEqual(0, len(self.client.get(url).json()['totals']))
+
+        self.assertEqual(400, self.client.get(url, {'since': 'yesterday'}).status_code)
+        self.assertEqual(400, self.client.get(url, {'limit': '-1'}).status_code)
+        self.assertEqual(400, self.client.get(url, {'limit': '0'}).status_code)
+        self.assertEqual(404, self.client.get(reverse('api-daily-stats', args=['pages'])).status_code)
+
+        response = self.client.get(reverse('daily-stats'), {'since': '2018-03-01', 'until': '2018-03-31'})
+        self.assertContains(response, 'Beireke1')
+
+class IngestionStatusTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        ingestion_status_memo['checked_at'] = None
+        self.addCleanup(ingestion_status_memo.update, checked_at=None)
+
+    def test_status(self):
+        url = reverse('api-status')
+        self.assertEqual(None, self.client.get(url).json()['lag'])
+
+        now = datetime.now(UTC).timestamp()
+        record_chunk([{'timestamp': now - 100}, {'timestamp': now - 20}, None])
+        status = self.client.get(url).json()
+        self.assertTrue(20 <= status['lag'] < 30)
+        self.assertFalse(status['lagging'])
+        histogram = status['lag_histogram']
+        self.assertEqual(1, histogram['count'])
+        self.assertEqual([0, 0, 0, 1, 1, 1, 1, 1, 1],
+            [bucket['count'] for bucket in histogram['buckets']])
+        self.assertEqual(None, histogram['buckets'][-1]['le'])
+        # one counter is incremented for each chunk
+        record_lag(7)
+        self.assertEqual([0, 0, 1, 2, 2, 2, 2, 2, 2],
+            [bucket['count'] for bucket in lag_histogram()['buckets']])
+
+        # the status shown on the pages is only read every few seconds
+        self.client.get(reverse('list-batches'))
+        with self.assertNumQueries(0):
+            self.assertEqual({}, status_context_processor(None))
+
+        # the pages warn about stalls
+        self.assertNotContains(self.client.get(reverse('list-batches')), 'alert-warning')
+        record_chunk([{'timestamp': now - 3600}])
+        self.assertTrue(ingestion_status()['lagging'])
+        self.assertContains(self.client.get(reverse('list-batches')), 'alert-warning')
+        self.assertEqual(3, self.client.get(url).json()['lag_histogram']['count'])
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        # the switch is also remembered by the process, beyond the cache
+        switch_profiling(False)
+        self.addCleanup(switch_profiling, False)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def profiles(self):
+        return sorted(os.listdir(self.directory.name))
+
+    def test_switch(self):
+        self.assertFalse(profiling_enabled())
+        switch_profiling(True, 60)
+        self.assertTrue(profiling_enabled())
+        switch_profiling(False)
+        self.assertFalse(profiling_enabled())
+
+    def test_views(self):
+        with self.settings(PROFILING_DIR=self.directory.name, PROFILING_SLOW_REQUEST=1000):
+            self.client.get(reverse('list-batches'))
+            switch_profiling(True)
+            self.addCleanup(switch_profiling, False)
+            with self.assertLogs('editgroups.queries') as logs:
+                self.client.get(reverse('list-batches'))
+            self.assertEqual([], self.profiles())
+            log = json.loads(logs.records[0].getMessage())
+            self.assertEqual('/', log['path'])
+            self.assertTrue(log['queries'] > 0)
+
+            with self.settings(PROFILING_SLOW_REQUEST=0), self.assertLogs('editgroups.queries'):
+                self.client.get(reverse('api-list-batches'))
+            self.assertEqual(1, len(self.profiles()))
+            self.assertTrue(self.profiles()[0].startswith('view-'))
+            self.assertTrue(self.profiles()[0].endswith('-api.prof'))
+
+    def test_tasks_and_signals(self):
+        function = profiled('sum')(sum)
+        with self.settings(PROFILING_DIR=self.directory.name):
+            self.assertEqual(3, function([1, 2]))
+            self.assertEqual([], self.profiles())
+            with self.settings(PROFILING_ENABLED=True):
+                self.assertEqual(3, function([1, 2]))
+            self.assertEqual(1, len(self.profiles()))
+
+            profiler = SignalProfiler('listener')
+            self.addCleanup(signal.signal, signal.SIGUSR1, signal.SIG_DFL)
+            with contextlib.redirect_stdout(io.StringIO()):
+                os.kill(os.getpid(), signal.SIGUSR1)
+                sum(range(10))
+                os.kill(os.getpid(), signal.SIGUSR1)
+            self.assertEqual(['process', 'task'], sorted(name.split('-')[0] for name in self.profiles()))
+
+def synthetic_events(nb_batches, edits_per_batch, start_id=900000000):
+    """
+    Generates recent changes events for QuickStatements batches, as
+    the stream would give them: property claims (some on new items,
+    a few of them undone afterwards) and description edits.
+    """
+    now = int(datetime.now(UTC).timestamp()) - 3600 * nb_batches
+    rcid = start_id
+    events = []
+    for batch_idx in range(nb_batches):
+        uid = str(50000 + batch_idx)
+        user = 'User{}'.format(batch_idx % 7)
+        for edit_idx in range(edits_per_batch):
+            rcid += 1
+            is_new = edit_idx % 5 == 0
+            if edit_idx % 2:
+                comment = '/* wbsetdescription-add:1|fr */ description, #quickstatements'
+            else:
+                comment = ('/* wbcreateclaim-create:1| */ [[Property:P{}]]: [[Q{}]], #quickstatements'
+                    .format(31 + batch_idx % 3, 5 + edit_idx))
+            events.append({
+                'id': rcid,
+                'type': 'new' if is_new else 'edit',
+                'revision': {'old': None if is_new else rcid - 100, 'new': rcid},
+                'length': {'old': None if is_new else 1000, 'new': 1000 + edit_idx},
+                'timestamp': now + 3600 * batch_idx + 2 * edit_idx,
+                'title': 'Q{}'.format(1000 + edit_idx % (edits_per_batch // 2)),
+                'namespace': 0,
+                'comment': comment + '; [[:toollabs:quickstatements/#mode=batch&batch={}|batch #{}]] by [[User:{}|]]'.format(uid, uid, user),
+                'parsedcomment': comment,
+                'bot': False,
+                'minor': False,
+                'user': 'QuickStatementsBot',
+                'patrolled': True,
+            })
+    for rcid in range(start_id + 1, start_id + 10, 3):
+        events.append({
+            'id': rcid + 10 ** 8,
+            'type': 'edit',
+            'revision': {'old': rcid + 1, 'new': rcid + 10 ** 8},
+            'length': {'old': 1000, 'new': 900},
+            'timestamp': now + 3600 * nb_batches,
+            'title': 'Q1000',
+            'namespace': 0,
+            'comment': '/* undo:0||{}|QuickStatementsBot */'.format(rcid),
+            'parsedcomment': 'undo',
+            'bot': False,
+            'minor': False,
+            'user': 'Reviewer',
+            'patrolled': True,
+        })
+    return events
+
+def full_scans(queryset, allowed=('store_tool',)):
+    """
+    The tables read entirely by the query of a queryset, according to
+    the plan of the database: the tables scanned without an index, or
+    through an index which does not give the rows in the right order
+    (so that all of them are sorted before the first ones are returned).
+    Small tables which are fine to scan can be allowed.
+    """
+    sql, params = queryset.query.sql_with_params()
+    scans = []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            details = [row[-1] for row in cursor.fetchall()]
+            sorted_afterwards = 'USE TEMP B-TREE FOR ORDER BY' in details
+            for detail in details:
+                match = sqlite_scan_re.match(detail)
+                if match and (not match.group(2) or sorted_afterwards):
+                    scans.append(match.group(1))
+        elif connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0] for column in cursor.description]
+            for row in cursor.fetchall():
+                row = dict(zip(columns, row))
+                if row['type'] == 'ALL' or (row['type'] == 'index' and 'filesort' in (row['Extra'] or '')):
+                    scans.append(row['table'])
+    return [table for table in scans if table not in allowed]
+
+sqlite_scan_re = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?( USING (?:COVERING )?INDEX| USING INTEGER PRIMARY KEY)?')
+
+
+class QueryBudgetTest(TestCase):
+    """
+    Checks that the number of queries of each page does not grow with
+    the data it shows (N+1 queries), and that the main queries keep
+    using indexes on a synthetic dataset.
+    """
+    #: URL name -> (batch in the URL, other URL arguments, query string,
+    #: maximum number of queries). The pages are requested by a logged-in
+    #: user, whose session and user are read first.
+    budgets = {
+        'list-batches': (None, {}, '', 7),
+        'batch-view': ('batch', {}, '', 12),
+        'batch-edits': ('batch', {}, '', 6),
+        'entity-view': (None, {'title': 'Q1000'}, '', 6),
+        'daily-stats': (None, {}, '', 6),
+        'logout': (None, {}, '', 4),
+        'initiate-revert': ('batch', {}, '', 7),
+        'submit-revert': ('batch', {}, '', 7),
+        'stop-revert': ('reverted_batch', {}, '', 6),
+        'api-list-batches': (None, {}, '', 6),
+        'api-batch-view': ('batch', {}, '', 11),
+        'api-batch-stats': ('batch', {}, '', 3),
+        'api-batch-edits': ('batch', {}, '', 5),
+        'api-batch-edits-export': ('batch', {'export_format': 'ndjson'}, '', 3),
+        'api-entity-view': (None, {'title': 'Q1000'}, '', 5),
+        'api-revisions-batches': (None, {}, 'revids=900000001|900000002|900000003', 3),
+        'api-status': (None, {}, '', 3),
+        'api-daily-stats': (None, {'by': 'tools'}, '', 4),
+        'api-batch-row-cache-stats': (None, {}, '', 2),
+    }
+    #: URL names which are not checked: the live updates stream from Redis
+    exempt = {'api-batch-updates'}
+    #: URL namespaces which are not checked: the pages of third-party apps
+    exempt_namespaces = {'admin', 'social', 'rest_framework'}
+    #: URL names which are posted to -> the posted data
+    posted = {
+        'submit-revert': {'comment': 'testing'},
+        'stop-revert': {},
+        'logout': {},
+    }
+    #: URL names which do not return 200 -> expected status code
+    statuses = {
+        'submit-revert': 302,
+        'stop-revert': 302,
+        'logout': 302,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        for events in grouper(synthetic_events(30, 60), 500):
+            Edit.ingest_edits(events)
+        cls.batch, cls.reverted_batch = Batch.objects.order_by('-started')[:2]
+        cls.user = User.objects.create_user('reviewer')
+        RevertTask.objects.create(batch=cls.reverted_batch, user=cls.user, comment='testing')
+
+    def setUp(self):
+        invalidation.cache.clear()
+        cache.clear()
+
+    def url(self, name):
+        batch, kwargs, query, _ = self.budgets[name]
+        if batch is not None:
+            batch = getattr(self, batch)
+            kwargs = dict(kwargs, tool=batch.tool.shortid, uid=batch.uid)
+        url = reverse(name, kwargs=kwargs or None)
+        return url + '?' + query if query else url
+
+    def count_queries(self, name):
+        invalidation.cache.clear()
+        cache.clear()
+        ingestion_status_memo['checked_at'] = None
+        self.client.force_login(self.user)
+        url = self.url(name)
+        with CaptureQueriesContext(connection) as queries:
+            if name in self.posted:
+                response = self.client.post(url, self.posted[name])
+            else:
+                response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(self.statuses.get(name, 200), response.status_code, url)
+        return len(queries)
+
+    def test_budgets(self):
+        for name, (_, _, _, budget) in sorted(self.budgets.items()):
+            with self.subTest(name):
+                self.assertLessEqual(self.count_queries(name), budget)
+
+    def test_all_urls_have_budgets(self):
+        def names(patterns):
+            for pattern in patterns:
+                if isinstance(pattern, URLResolver):
+                    if pattern.namespace not in self.exempt_namespaces:
+                        yield from names(pattern.url_patterns)
+                elif pattern.name:
+                    yield pattern.name
+        missing = set(names(get_resolver().url_patterns)) - set(self.budgets) - self.exempt
+        self.assertEqual(set(), missing)
+
+    def test_batch_list_plans(self):
+        queryset = Batch.objects.select_related('username', 'tool').order_by('-started')
+        tag = self.batch.tags.all()[0]
+        for params in [{}, {'tool': 'QSv2'}, {'user': 'User1'},
+                {'tags': tag.id}, {'property': 'P31'}]:
+            with self.subTest(params):
+                filtered = TaggingFilterBackend().filter_queryset(
+                    RequestFactory().get('/', params), queryset, None)
+                self.assertEqual([], full_scans(filtered[:50]))
+
+    def test_edits_plans(self):
+        self.assertEqual([], full_scans(self.batch.ordered_edits[:50]))
+        self.assertEqual([], full_scans(self.batch.partitioned_edits
+            .values('entity_type', 'entity_id', 'other_title').distinct()))
+        self.assertEqual([], full_scans(self.batch.partitioned_edits.filter(oldrevid=0)))
+        self.assertEqual([], full_scans(Edit.objects.filter(entity_type=1, entity_id=1000)
+            .select_related('username', 'batch__tool', 'batch__username')
+            .order_by('-timestamp', '-id')[:50]))
+
+    def test_revert_marking_plan(self):
+        self.assertEqual([], full_scans(Edit.objects.filter(
+            newrevid__in=[900000001, 900000004], reverted=False)))
+
 class WikidataEditStreamTest(unittest.TestCase):
     def test_stream(self):
         s = WikidataEditStream()
@@ -1,8 +1,21 @@
 from itertools import zip_longest
 
+from django.core.cache import cache
+
 # taken from https://docs.python.org/3/library/itertools.html
 def grouper(iterable, n):
     "Collect data into fixed-length chunks or blocks"
     # grouper('ABCDEFG', 3, 'x') --> ABC DEF Gxx"
     args = [iter(iterable)] * n
     return zip_longest(*args, fillvalue=None)
+
+def incr_counter(key, count=1):
+    """
+    Increments a counter stored in the cache (without expiry),
+    creating it if needed, in one round trip most of the time.
+    """
+    try:
+        cache.incr(key, count)
+    except ValueError: # not created yet, or evicted
+        if not cache.add(key, count, timeout=None):
+            cache.incr(key, count)
@@ -1,17 +1,89 @@
+from collections import OrderedDict
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+import re
+
 from django.shortcuts import render
 from django.http import Http404
+from django.http import StreamingHttpResponse
+from django.http import HttpResponseBadRequest
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+from django.views import View
+
+from django.utils.cache import patch_cache_control
+from django.db.models import QuerySet
+from django.db.models import Sum
 
 from rest_framework import viewsets
 from rest_framework import generics
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.exceptions import ParseError
 from rest_framework.renderers import JSONRenderer
 from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.renderers import TemplateHTMLRenderer
 
 from .models import Tool
 from .models import Edit
 from .models import Batch
+from .models import BatchArchive
+from .models import DailyToolStats
+from .models import DailyUserStats
+from .models import DailyTagStats
+from .models import parse_title
 from .serializers import BatchSimpleSerializer, BatchDetailSerializer, EditSerializer, ToolSerializer
+from .serializers import EntityEditSerializer
+from .serializers import EntityBatchSerializer
+from .serializers import LimitedListSerializer
+from .serializers import BatchRowSerializer
+from .serializers import EditRowSerializer
+from .renderers import FastJSONRenderer
+from .fragments import BatchRowCache
+from .live import batch_update_events
+from .stats import batch_stats
+from .status import ingestion_status
+from .status import lag_histogram
+from .export import EXPORT_FORMATS
+from .export import iterate_edit_rows
 from django_filters.rest_framework import DjangoFilterBackend
 from tagging.filters import TaggingFilterBackend
+from tagging.filters import context_processor as tagging_context
+from .filters import EditFilterBackend
+
+class FastListMixin(object):
+    """
+    Serializes the pages of a list view with a row serializer,
+    which works on `.values()` rather than on model instances.
+    HTML pages get native rows (datetimes, precomputed display fields)
+    so that templates do not have to parse them again.
+    The regular serializer is used for the browsable API, for sparse
+    fieldsets and for JSON lists which are not querysets (archived edits).
+    """
+    row_serializer_class = None
+
+    def get_row_serializer(self, queryset):
+        """
+        Returns the function serializing a page, and the queryset to paginate
+        """
+        format = self.request.accepted_renderer.format
+        if format == 'html':
+            if isinstance(queryset, QuerySet):
+                queryset = self.row_serializer_class.values_queryset(queryset)
+            return (lambda page: self.row_serializer_class.to_representation(page, native=True)), queryset
+        elif (format == 'json' and isinstance(queryset, QuerySet) and
+              not self.request.query_params.get('fields') and
+              not self.request.query_params.get('omit')):
+            return self.row_serializer_class.to_representation, self.row_serializer_class.values_queryset(queryset)
+        return (lambda page: self.get_serializer(page, many=True).data), queryset
+
+    def list(self, request, *args, **kwargs):
+        serialize, queryset = self.get_row_serializer(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize(page))
+        return Response(serialize(queryset))
 
 class BatchView(generics.RetrieveAPIView):
     serializer_class = BatchDetailSerializer
@@ -21,34 +93,76 @@ class BatchView(generics.RetrieveAPIView):
         batch_uid = self.kwargs.get('uid')
         tool_code = self.kwargs.get('tool')
         try:
-            return Batch.objects.get(uid=batch_uid,tool__shortid=tool_code)
+            return Batch.objects.select_related('username', 'tool').get(uid=batch_uid,tool__shortid=tool_code)
         except Batch.DoesNotExist:
             raise Http404
 
+    def retrieve(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'html':
+            return super(BatchView, self).retrieve(request, *args, **kwargs)
+
+        # the template gets native dates and edits
+        batch = self.get_object()
+        serializer = self.get_serializer(batch)
+        serializer.fields.pop('edits')
+        data = serializer.data
+        edits = batch.ordered_edits
+        if isinstance(edits, QuerySet):
+            edits = EditRowSerializer.values_queryset(edits)
+        data.update({
+            'started': batch.started,
+            'ended': batch.ended,
+            'edits': EditRowSerializer.to_representation(edits[:LimitedListSerializer.limit], native=True),
+            'stats': batch_stats(batch),
+        })
+        return Response(data)
+
 class APIBatchView(BatchView):
     """
     Gives details about a particular batch
     """
     renderer_classes = (JSONRenderer,BrowsableAPIRenderer)
 
-class BatchesView(generics.ListAPIView):
+class APIBatchStatsView(BatchView):
+    """
+    Gives statistics about the edits of a batch: distribution of
+    their size differences, edits per minute over time, bursts
+    of edits, and how many of them created pages.
+    They are computed in the background: this gives the last ones
+    computed, and an empty response when there are none yet.
+    """
+    renderer_classes = (JSONRenderer,BrowsableAPIRenderer)
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(batch_stats(self.get_object()))
+
+class BatchesView(FastListMixin, generics.ListAPIView):
     serializer_class = BatchSimpleSerializer
-    queryset = Batch.objects.all().order_by('-started')
+    row_serializer_class = BatchRowSerializer
+    queryset = Batch.objects.select_related('username', 'tool').order_by('-started')
     template_name = 'store/batches.html'
-    filter_fields = ('user',)
     filter_backends = (TaggingFilterBackend,)
 
+    def list(self, request, *args, **kwargs):
+        response = super(BatchesView, self).list(request, *args, **kwargs)
+        if request.accepted_renderer.format == 'html':
+            tagging_form = tagging_context(request).get('tagging_form')
+            BatchRowCache(request, tagging_form).add_cells(response.data['results'])
+        return response
+
 class APIBatchesView(BatchesView):
     """
     Lists the latest batches, by inverse date of creation.
     """
-    renderer_classes = (JSONRenderer,BrowsableAPIRenderer)
+    renderer_classes = (FastJSONRenderer,BrowsableAPIRenderer)
 
-class BatchEditsView(generics.ListAPIView):
+class BatchEditsView(FastListMixin, generics.ListAPIView):
     serializer_class = EditSerializer
+    row_serializer_class = EditRowSerializer
     model = Edit
     paginate_by = 50
     template_name = 'store/edits.html'
+    filter_backends = (EditFilterBackend,)
 
     def get_queryset(self):
         batch_uid = self.kwargs.get('uid')
@@ -58,11 +172,298 @@ class BatchEditsView(generics.ListAPIView):
         except Batch.DoesNotExist:
             raise Http404
 
-        queryset = batch.edits.order_by('-timestamp')
-        return queryset
+        return batch.ordered_edits
 
 class APIBatchEditsView(BatchEditsView):
     """
     Lists the edits in a particular batch
     """
+    renderer_classes = (FastJSONRenderer,BrowsableAPIRenderer)
+
+class BatchEditsExportView(View):
+    """
+    Exports all the edits of a batch as newline-delimited JSON or CSV,
+    optionally restricted to some columns (`?fields=id,title`).
+    The export is streamed, and compressed if the client accepts gzip.
+    """
+    chunk_size = 1000
+    accept_encoding_re = re.compile(r'\bgzip\b')
+
+    def get(self, request, tool, uid, export_format):
+        if export_format not in EXPORT_FORMATS:
+            raise Http404
+        try:
+            batch = Batch.objects.select_related('tool').get(uid=uid, tool__shortid=tool)
+        except Batch.DoesNotExist:
+            raise Http404
+
+        fields = EditRowSerializer.fields
+        if request.GET.get('fields'):
+            fields = [field.strip() for field in request.GET['fields'].split(',')]
+            unknown = set(fields) - set(EditRowSerializer.fields)
+            if unknown:
+                return HttpResponseBadRequest('Unknown fields: {}'.format(', '.join(sorted(unknown))))
+
+        content_type, lines = EXPORT_FORMATS[export_format]
+        content = lines(iterate_edit_rows(batch, self.chunk_size), fields)
+        compress = self.accept_encoding_re.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if compress:
+            content = compress_sequence(content)
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="{}-{}-edits.{}"'.format(
+            batch.tool.shortid, batch.uid, export_format)
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+class EntityView(generics.ListAPIView):
+    """
+    Lists the edits made on an entity by all batches, most recent first,
+    and the batches they belong to. The edits of archived batches are
+    not listed: `archived_batches_not_listed` is true when there are some.
+    """
+    serializer_class = EntityEditSerializer
+    template_name = 'store/entity.html'
+
+    def get_queryset(self):
+        entity_type, entity_id, other_title = parse_title(self.kwargs.get('title'))
+        if entity_type is None:
+            raise Http404
+        return (Edit.objects.filter(entity_type=entity_type, entity_id=entity_id)
+            .select_related('username', 'batch__tool', 'batch__username')
+            .order_by('-timestamp', '-id'))
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format == 'html':
+            return self.list_html()
+
+        response = super(EntityView, self).list(request, *args, **kwargs)
+        batches = []
+        for edit in response.data['results']:
+            if edit['batch'] not in batches:
+                batches.append(edit['batch'])
+        response.data['title'] = self.kwargs.get('title')
+        response.data['batches'] = batches
+        response.data['archived_batches_not_listed'] = BatchArchive.objects.exists()
+        return response
+
+    def list_html(self):
+        """
+        Gives native dates and edits to the template
+        """
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        response = self.get_paginated_response(EditRowSerializer.to_representation(page, native=True))
+        batches = OrderedDict()
+        for edit in page:
+            if edit.batch_id not in batches:
+                batches[edit.batch_id] = dict(EntityBatchSerializer(edit.batch).data,
+                    started=edit.batch.started, ended=edit.batch.ended)
+        response.data['title'] = self.kwargs.get('title')
+        response.data['batches'] = list(batches.values())
+        response.data['archived_batches_not_listed'] = BatchArchive.objects.exists()
+        return response
+
+class APIEntityView(EntityView):
+    """
+    Lists the edits made on an entity by all batches, most recent first,
+    and the batches they belong to. The edits of archived batches are
+    not listed: `archived_batches_not_listed` is true when there are some.
+    """
     renderer_classes = (JSONRenderer,BrowsableAPIRenderer)
+
+class APIRevisionsBatchesView(APIView):
+    """
+    Finds the batches of a list of revisions, given by their ids
+    (`revids=123|456`) or by their recent changes ids (`rcids=...`),
+    separated by pipes or commas. The revisions which are not found
+    are looked up in the archived batches.
+    """
+    renderer_classes = (JSONRenderer,BrowsableAPIRenderer)
+
+    #: Maximum number of ids in one request
+    max_ids = 500
+    #: Revisions are not always ingested yet when they are looked up,
+    #: so responses are only cached for a few minutes
+    cache_max_age = 300
+
+    def parse_ids(self, param):
+        value = self.request.query_params.get(param)
+        if not value:
+            return []
+        try:
+            ids = [int(id) for id in value.replace(',', '|').split('|') if id]
+        except ValueError:
+            raise ParseError('{} should be a list of integers'.format(param))
+        if len(ids) > self.max_ids:
+            raise ParseError('At most {} ids can be looked up at once'.format(self.max_ids))
+        return ids
+
+    def get(self, request, format=None):
+        revids = self.parse_ids('revids')
+        rcids = self.parse_ids('rcids')
+        if not revids and not rcids:
+            raise ParseError('Either revids or rcids should be provided')
+        if revids and rcids:
+            raise ParseError('Only one of revids and rcids should be provided')
+
+        field = 'newrevid' if revids else 'id'
+        ids = revids or rcids
+        edits = (Edit.objects.filter(**{field+'__in': ids})
+            .select_related('batch__tool', 'batch__username')
+            .only(field, 'batch'))
+        batches = { getattr(edit, field): EntityBatchSerializer(edit.batch).data for edit in edits }
+        archived = BatchArchive.find_edits(field, [id for id in ids if id not in batches])
+        batches.update({ id: EntityBatchSerializer(edit.batch).data for id, edit in archived.items() })
+
+        key = 'revisions' if revids else 'rcids'
+        response = Response({key: { str(id): batches.get(id) for id in ids }})
+        patch_cache_control(response, public=True, max_age=self.cache_max_age)
+        return response
+
+class APIBatchRowCacheStatsView(APIView):
+    """
+    Gives the number of rows of the list of batches which were
+    found in the cache or rendered, and the cache hit rate,
+    over a sample of the pages.
+    """
+    renderer_classes = (JSONRenderer,BrowsableAPIRenderer)
+
+    def get(self, request, format=None):
+        return Response(BatchRowCache.stats())
+
+class DailyStatsMixin(object):
+    """
+    Reads the daily rollups of edits per tool, user or tag
+    over a range of days, the last 30 by default.
+    """
+    #: The rollups, with the fields describing their keys
+    #: (the first one is matched by `?key=`)
+    rollups = OrderedDict([
+        ('tools', (DailyToolStats, OrderedDict([('tool', 'tool__shortid'), ('name', 'tool__name')]))),
+        ('users', (DailyUserStats, OrderedDict([('user', 'username__name')]))),
+        ('tags', (DailyTagStats, OrderedDict([('tag', 'tag_id')]))),
+    ])
+    counts = ('nb_edits', 'nb_batches', 'nb_reverted', 'nb_new_pages')
+    default_days = 30
+
+    def parse_day(self, param, default):
+        value = self.request.query_params.get(param)
+        if not value:
+            return default
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise ParseError('{} should be a date (YYYY-MM-DD)'.format(param))
+
+    def get_days(self):
+        until = self.parse_day('until', date.today())
+        since = self.parse_day('since', until - timedelta(days=self.default_days - 1))
+        return since, until
+
+    def totals(self, by, since, until, limit):
+        """
+        The counts of the most active keys over the days, most edits first
+        """
+        model, fields = self.rollups[by]
+        rows = (model.objects.filter(day__gte=since, day__lte=until)
+            .values(*fields.values())
+            .annotate(**{count: Sum(count) for count in self.counts})
+            .order_by('-nb_edits', *fields.values())[:limit])
+        return [
+            dict([(name, row[field]) for name, field in fields.items()] +
+                 [(count, row[count]) for count in self.counts])
+            for row in rows
+        ]
+
+    def days(self, by, since, until, key=None):
+        """
+        The counts of each day, for all keys or for one of them
+        """
+        model, fields = self.rollups[by]
+        rows = model.objects.filter(day__gte=since, day__lte=until)
+        if key is not None:
+            rows = rows.filter(**{next(iter(fields.values())): key})
+        return list(rows.values('day')
+            .annotate(**{count: Sum(count) for count in self.counts})
+            .order_by('day'))
+
+class DailyStatsView(DailyStatsMixin, APIView):
+    """
+    Shows the most active tools, users and tags over the last days
+    """
+    renderer_classes = (TemplateHTMLRenderer,)
+    template_name = 'store/stats.html'
+    limit = 20
+
+    def get(self, request, format=None):
+        since, until = self.get_days()
+        return Response({
+            'since': since,
+            'until': until,
+            'rollups': [(by, self.totals(by, since, until, self.limit)) for by in self.rollups],
+        })
+
+class APIDailyStatsView(DailyStatsMixin, APIView):
+    """
+    Gives the numbers of edits, batches started, edits undone and page
+    creations per tool, user or tag over a range of days (the last 30
+    by default, or `?since=YYYY-MM-DD&until=YYYY-MM-DD`): the totals
+    of the most active ones (`?limit=`), and the numbers per day,
+    for all of them or for one of them (`?key=`). The edits of
+    a batch are counted for each of its tags.
+    """
+    renderer_classes = (JSONRenderer,BrowsableAPIRenderer)
+    default_limit = 50
+    max_limit = 500
+
+    def get(self, request, by, format=None):
+        if by not in self.rollups:
+            raise Http404
+        since, until = self.get_days()
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            raise ParseError('limit should be an integer')
+        if limit < 1:
+            raise ParseError('limit should be positive')
+        key = request.query_params.get('key')
+        return Response({
+            'since': since,
+            'until': until,
+            'totals': self.totals(by, since, until, limit),
+            'days': self.days(by, since, until, key),
+        })
+
+class APIStatusView(APIView):
+    """
+    Tells how far behind the stream of edits the ingestion is: the
+    timestamp of the newest edit ingested, when it was ingested, the
+    lag in seconds and whether it is above the threshold of the pages.
+    The histogram of the lags measured at each ingested chunk, with
+    cumulative buckets (`le`: upper bound in seconds), can be used for
+    alerting.
+    """
+    renderer_classes = (JSONRenderer,BrowsableAPIRenderer)
+
+    def get(self, request, format=None):
+        status = ingestion_status()
+        status['lag_histogram'] = lag_histogram()
+        response = Response(status)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+class BatchUpdatesStreamView(View):
+    """
+    Streams the changes of batches as server-sent events, for all
+    batches or for the ones given as `?batches=QSv2/2120,QSv2/2121`.
+    """
+    def get(self, request):
+        full_uids = set(request.GET.get('batches', '').split(',')) - {''}
+        response = StreamingHttpResponse(batch_update_events(full_uids),
+            content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # do not let proxies buffer the events
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -2,10 +2,18 @@
 from rest_framework import filters
 from django import forms
 
+import re
+
+property_re = re.compile(r'^(?:Property:)?[Pp]?([1-9]\d*)$')
+
+#: The parameters of the pagination, which are not filters
+pagination_params = ('limit', 'offset')
+
 class FilteringForm(forms.Form):
     user = forms.CharField(required=False)
     tool = forms.CharField(required=False)
     tags = forms.CharField(required=False)
+    property = forms.CharField(required=False)
 
     def clean_tags(self):
         if not self.cleaned_data.get('tags'):
@@ -13,21 +21,37 @@ class FilteringForm(forms.Form):
         else:
             return self.cleaned_data['tags'].split(',')
 
+    def clean_property(self):
+        """
+        Accepts properties as P31 or 31, and returns their numeric id
+        """
+        value = self.cleaned_data.get('property')
+        if not value:
+            return None
+        match = property_re.match(value.strip())
+        if not match:
+            raise forms.ValidationError('Invalid property')
+        return int(match.group(1))
+
 class TaggingFilterBackend(filters.BaseFilterBackend):
     def filter_queryset(self, request, queryset, view):
         tags = []
         form = FilteringForm(data=request.GET)
         if not form.is_valid():
-            return queryset
+            # an invalid filter matches nothing, rather than being ignored
+            # with the other filters
+            return queryset.none()
 
         filtered = queryset
 
         for tag in form.cleaned_data['tags']:
             filtered = filtered.filter(tags__id=tag)
         if form.cleaned_data.get('user'):
-            filtered = filtered.filter(user=form.cleaned_data['user'])
+            filtered = filtered.filter(username__name=form.cleaned_data['user'])
         if form.cleaned_data.get('tool'):
             filtered = filtered.filter(tool__shortid=form.cleaned_data['tool'])
+        if form.cleaned_data.get('property'):
+            filtered = filtered.filter(properties__property_id=form.cleaned_data['property'])
         return filtered
 
 
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from tagging.models import Tag
+
+
+class Command(BaseCommand):
+    help = 'Applies the tag rules which were added or changed to all the edits.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000,
+            help='number of edits read at once')
+        parser.add_argument('--processes', type=int, default=1,
+            help='number of worker processes extracting the tags')
+        parser.add_argument('--resume', action='store_true',
+            help='resume the last unfinished backfill')
+
+    def handle(self, *args, **options):
+        rules = Tag.backfill_rules(
+            chunk_size=options['chunk_size'],
+            processes=options['processes'],
+            resume=options['resume'])
+        for rule in rules:
+            self.stdout.write('Applied {}'.format(rule))
+        if not rules:
+            self.stdout.write('All tag rules are up to date')
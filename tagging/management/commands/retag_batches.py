@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from tagging.models import Tag
+
+
+class Command(BaseCommand):
+    help = 'Tags all the batches again, from their edits.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000,
+            help='number of edits read at once')
+        parser.add_argument('--processes', type=int, default=1,
+            help='number of worker processes extracting the tags')
+        parser.add_argument('--resume', action='store_true',
+            help='resume the last unfinished run instead of starting from the first edit')
+
+    def handle(self, *args, **options):
+        Tag.retag_all_batches(
+            chunk_size=options['chunk_size'],
+            processes=options['processes'],
+            resume=options['resume'])
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagging', '0002_tag_color'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetaggingProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField(auto_now_add=True)),
+                ('last_edit_id', models.BigIntegerField(default=-1)),
+                ('complete', models.BooleanField(default=False)),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:54
+
+from django.db import migrations, models
+
+def record_existing_rules(apps, schema_editor):
+    """
+    Existing tags were created by the first versions
+    of the 'action' and 'language' rules.
+    """
+    Tag = apps.get_model('tagging', 'Tag')
+    AppliedTagRule = apps.get_model('tagging', 'AppliedTagRule')
+    Tag.objects.filter(id__startswith='lang-').update(rule='language')
+    Tag.objects.exclude(id__startswith='lang-').update(rule='action')
+    AppliedTagRule.objects.bulk_create([
+        AppliedTagRule(name='action', version=1),
+        AppliedTagRule(name='language', version=1),
+    ])
+
+def do_nothing(apps, schema_editor):
+    pass
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tagging', '0003_retagging_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppliedTagRule',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('version', models.IntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='retaggingprogress',
+            name='rules',
+            field=models.CharField(blank=True, default='', max_length=256),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='rule',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(record_existing_rules, do_nothing),
+    ]
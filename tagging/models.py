@@ -3,9 +3,15 @@ from django.db import models
 from caching.base import CachingManager, CachingMixin
 from django.utils.translation import ugettext_lazy as _
 from store.models import Batch
-from collections import defaultdict
+from collections import deque
+from multiprocessing import Pool
 
 import re
+import json
+from datetime import datetime
+from pytz import UTC
+
+from .rules import tag_rules
 
 tag_to_readable_name = {
 	"wbsetitem": _("new items"),
@@ -74,8 +80,36 @@ tag_to_readable_name = {
         "undo": _("undo"),
 }
 
-action_re = re.compile('^/\* ([a-z\-]*):.*')
-language_re = re.compile('^/\* wb[a-z\-]*:\d+\|([a-z\-]+) \*/')
+# kept for compatibility: the tags are now extracted by the rules of .rules
+action_re = tag_rules['action'].regex
+language_re = tag_rules['language'].regex
+
+def extract_tag_names(comment, rules=None):
+    """
+    Extracts the names of the tags of an edit from its comment.
+
+    :param rules: the names of the tag rules to apply (all of them by default)
+    :returns: a list of pairs of tag names and of the fields to
+        use to create the corresponding tags, if they do not exist
+    """
+    return [
+        (tag_name, rule.defaults)
+        for rule, tag_name in tag_rules.extract(comment, rules)
+    ]
+
+def extract_chunk_tags(chunk, rules=None):
+    """
+    Extracts the tags of a chunk of edits, given as (id, batch_id, comment)
+    tuples. This is run in worker processes by :meth:`Tag.retag_all_batches`.
+
+    :returns: the id of the last edit in the chunk, and the set of
+        (batch id, tag name, defaults) tuples found in it
+    """
+    tags = set()
+    for edit_id, batch_id, comment in chunk:
+        for tag_name, defaults in extract_tag_names(comment, rules):
+            tags.add((batch_id, tag_name, tuple(sorted(defaults.items()))))
+    return chunk[-1][0], tags
 
 class Tag(CachingMixin, models.Model):
     """
@@ -92,6 +126,8 @@ class Tag(CachingMixin, models.Model):
     batches = models.ManyToManyField(Batch, related_name='tags')
     #: Color for the tag (HTML coded, including hash)
     color = models.CharField(max_length=32, default='#939393')
+    #: Name of the tag rule which created this tag
+    rule = models.CharField(max_length=64, null=True, blank=True)
 
     @property
     def display_name(self):
@@ -132,46 +168,165 @@ class Tag(CachingMixin, models.Model):
         :returns: a list of tags
         """
         tags = []
-
-        # Extract action types
-        action_match = action_re.match(edit.comment)
-        if action_match:
-            tag_name = action_match.group(1)
-            if not tag_name in edit.batch.tag_ids:
-                tag, created = cls.objects.get_or_create(id=tag_name,
-                    defaults={'priority': 10})
-                tags.append(tag)
-
-        # Extract properties
-        # TODO
-
-        # Extract languages
-        language_match = language_re.match(edit.comment)
-        if language_match:
-            tag_name = 'lang-'+language_match.group(1)
+        for tag_name, defaults in extract_tag_names(edit.comment):
             if not tag_name in edit.batch.tag_ids:
                 tag, created = cls.objects.get_or_create(id=tag_name,
-                    defaults={'priority':5, 'color':'#3eabab'})
+                    defaults=defaults)
                 tags.append(tag)
-
         return tags
 
     @classmethod
-    def retag_all_batches(cls):
+    def retag_all_batches(cls, chunk_size=10000, processes=1, resume=False, rules=None):
         """
         Useful to retag all batches after creating new tags.
         Existing tags should be cleared first.
+
+        Edits are read in chunks of consecutive ids, which are tagged
+        by a pool of worker processes. Progress is saved after each
+        chunk, so that an interrupted run can be resumed. The edits of
+        archived batches are read from their archives afterwards (all
+        of them again when resuming).
+
+        :param chunk_size: the number of edits in each chunk
+        :param processes: the number of worker processes
+        :param resume: resume the last unfinished run, if any
+        :param rules: the names of the tag rules to apply (all of them by default)
         """
-        from store.models import Edit
-        batch_to_tags = defaultdict(set)
-        for edit in Edit.objects.all():
-            tags = cls.extract(edit)
-            batch_to_tags[edit.batch_id].update(tags)
+        rule_names = ','.join(sorted(rules)) if rules is not None else ''
+        progress = None
+        if resume:
+            progress = (RetaggingProgress.objects.filter(complete=False, rules=rule_names)
+                .order_by('-started').first())
+        if progress is None:
+            progress = RetaggingProgress.objects.create(rules=rule_names)
+
+        cls.tag_chunks(progress.edit_chunks(chunk_size), processes, rules, progress)
+        cls.tag_chunks(progress.archived_edit_chunks(), processes, rules)
+
+        progress.complete = True
+        progress.save(update_fields=['complete'])
+        AppliedTagRule.record([rule for rule in tag_rules if rules is None or rule.name in rules])
+
+    @classmethod
+    def tag_chunks(cls, chunks, processes, rules=None, progress=None):
+        """
+        Extracts and saves the tags of chunks of edits, recording
+        the progress after each of them if provided.
+        """
+        if processes <= 1:
+            for chunk in chunks:
+                cls.save_chunk_tags(extract_chunk_tags(chunk, rules), progress)
+        else:
+            # the workers do not use the database: they only get the edits
+            # read by this process, and the tags are saved here too
+            with Pool(processes) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.apply_async(extract_chunk_tags, (chunk, rules)))
+                    if len(pending) >= 2*processes:
+                        cls.save_chunk_tags(pending.popleft().get(), progress)
+                while pending:
+                    cls.save_chunk_tags(pending.popleft().get(), progress)
+
+    @classmethod
+    def backfill_rules(cls, chunk_size=10000, processes=1, resume=False):
+        """
+        Applies the tag rules which were added or changed since
+        the last retagging to all the edits, leaving the tags
+        created by other rules untouched.
+
+        :returns: the list of rules which were applied
+        """
+        applied = dict(AppliedTagRule.objects.values_list('name', 'version'))
+        changed = [rule for rule in tag_rules if applied.get(rule.name) != rule.version]
+        if not changed:
+            return []
+        names = [rule.name for rule in changed]
+
+        if not resume:
+            # remove the tags added by previous versions of these rules
+            Batch.objects.filter(tags__rule__in=names).update(
+                version=models.F('version') + 1, changed=datetime.now(UTC))
+            cls.batches.through.objects.filter(tag__rule__in=names).delete()
+
+        cls.retag_all_batches(chunk_size=chunk_size, processes=processes, resume=resume, rules=names)
+        return changed
+
+    @classmethod
+    def save_chunk_tags(cls, result, progress, batch_size=1000):
+        """
+        Saves the tags found in a chunk of edits by :func:`extract_chunk_tags`,
+        and records that this chunk has been retagged (if progress is provided).
+        """
+        last_edit_id, tags = result
+        existing = set(cls.objects.filter(
+            id__in={tag_name for _, tag_name, _ in tags}).values_list('id', flat=True))
+        for _, tag_name, defaults in tags:
+            if tag_name not in existing:
+                cls.objects.get_or_create(id=tag_name, defaults=dict(defaults))
+                existing.add(tag_name)
 
         ThroughModel = cls.batches.through
-        instances = []
-        for batch_id, tags in batch_to_tags.items():
-            for tag in tags:
-                instances.append(ThroughModel(batch_id=batch_id,tag_id=tag.id))
+        ThroughModel.objects.bulk_create([
+                ThroughModel(batch_id=batch_id, tag_id=tag_name)
+                for batch_id, tag_name in {(batch_id, tag_name) for batch_id, tag_name, _ in tags}
+            ], batch_size=batch_size, ignore_conflicts=True)
+        Batch.objects.filter(id__in={batch_id for batch_id, _, _ in tags}).update(
+            version=models.F('version') + 1, changed=datetime.now(UTC))
 
-        ThroughModel.objects.bulk_create(instances)
+        if progress is not None:
+            progress.last_edit_id = last_edit_id
+            progress.save(update_fields=['last_edit_id'])
+
+class RetaggingProgress(models.Model):
+    """
+    The progress of a run of :meth:`Tag.retag_all_batches`
+    """
+    started = models.DateTimeField(auto_now_add=True)
+    #: The names of the tag rules applied, separated by commas (empty for all of them)
+    rules = models.CharField(max_length=256, blank=True, default='')
+    #: All the edits up to this id have been retagged
+    last_edit_id = models.BigIntegerField(default=-1)
+    complete = models.BooleanField(default=False)
+
+    def edit_chunks(self, chunk_size):
+        """
+        Reads the edits which remain to be retagged, as lists
+        of (id, batch_id, comment) tuples of consecutive ids.
+        """
+        from store.models import Edit
+        last_id = self.last_edit_id
+        while True:
+            chunk = list(Edit.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'batch_id', 'comment')[:chunk_size])
+            if not chunk:
+                break
+            yield chunk
+            last_id = chunk[-1][0]
+
+    def archived_edit_chunks(self):
+        """
+        Reads the edits of the archived batches, which are not in
+        the Edit table anymore, in the same form (one chunk of
+        their archive at a time).
+        """
+        from store.models import EditArchiveChunk
+        chunks = (EditArchiveChunk.objects.select_related('archive')
+            .order_by('archive_id', 'index'))
+        for chunk in chunks.iterator():
+            batch_id = chunk.archive.batch_id
+            edits = [(edit['id'], batch_id, edit['comment']) for edit in json.loads(chunk.edits)]
+            if edits:
+                yield edits
+
+class AppliedTagRule(models.Model):
+    """
+    The version of a tag rule which has been applied to all the edits
+    """
+    name = models.CharField(max_length=64, primary_key=True)
+    version = models.IntegerField()
+
+    @classmethod
+    def record(cls, rules):
+        for rule in rules:
+            cls.objects.update_or_create(name=rule.name, defaults={'version': rule.version})
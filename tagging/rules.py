@@ -0,0 +1,122 @@
+"""
+The rules used to extract tags from edit summaries.
+
+Each rule has a version, which should be incremented whenever
+the rule is changed, so that it can be applied again to past
+edits (see :meth:`tagging.models.Tag.backfill_rules`).
+"""
+import re
+
+
+class TagRule(object):
+    """
+    A rule matching edit summaries with a regular expression.
+
+    :param name: a unique identifier for the rule
+    :param version: the version of the rule
+    :param pattern: a regular expression, matched at the start of the
+        edit summary (start it with `.*?` to search the whole summary)
+    :param tag: the id of the tag, formatted with the groups of the match
+    :param priority: the priority of the tags created by the rule
+    :param color: the color of the tags created by the rule
+    """
+
+    def __init__(self, name, version, pattern, tag='{0}', priority=0, color='#939393'):
+        self.name = name
+        self.version = version
+        self.regex = re.compile(pattern)
+        self.tag = tag
+        self.priority = priority
+        self.color = color
+
+    def __str__(self):
+        return '<TagRule {} (version {})>'.format(self.name, self.version)
+
+    @property
+    def defaults(self):
+        """
+        The fields of the tags created by this rule
+        """
+        return {'priority': self.priority, 'color': self.color, 'rule': self.name}
+
+
+class TagRuleRegistry(object):
+    """
+    A set of tag rules, which are evaluated in a single
+    pass over each edit summary.
+    """
+
+    def __init__(self):
+        self.rules = []
+        self.compiled = {}
+
+    def register(self, rule):
+        if rule.name in self:
+            raise ValueError('A tag rule named {} already exists'.format(rule.name))
+        self.rules.append(rule)
+        self.compiled = {}
+        return rule
+
+    def unregister(self, name):
+        self.rules.remove(self[name])
+        self.compiled = {}
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __contains__(self, name):
+        return any(rule.name == name for rule in self.rules)
+
+    def __getitem__(self, name):
+        for rule in self.rules:
+            if rule.name == name:
+                return rule
+        raise KeyError(name)
+
+    def compile(self, names=None):
+        """
+        Combines the rules (or the rules with the given names) in a single
+        regular expression, where each rule is an optional lookahead.
+
+        :returns: the regular expression, and for each rule,
+            the indices of its groups in the combined expression
+        """
+        key = None if names is None else tuple(sorted(names))
+        if key not in self.compiled:
+            rules = [rule for rule in self.rules if names is None or rule.name in names]
+            patterns = []
+            groups = []
+            offset = 1
+            for rule in rules:
+                patterns.append('(?:(?=({})))?'.format(rule.regex.pattern))
+                groups.append((rule, offset, rule.regex.groups))
+                offset += rule.regex.groups + 1
+            self.compiled[key] = (re.compile(''.join(patterns)), groups)
+        return self.compiled[key]
+
+    def extract(self, comment, names=None):
+        """
+        Extracts tags from an edit summary.
+
+        :param names: the names of the rules to apply (all of them by default)
+        :returns: a list of pairs of rules and tag ids
+        """
+        regex, groups = self.compile(names)
+        match = regex.match(comment)
+        tags = []
+        for rule, offset, nb_groups in groups:
+            if match.group(offset) is not None:
+                values = match.groups()[offset:offset+nb_groups]
+                tags.append((rule, rule.tag.format(*values)))
+        return tags
+
+
+tag_rules = TagRuleRegistry()
+
+tag_rules.register(TagRule('action', 1,
+    r'^/\* ([a-z\-]*):.*',
+    tag='{0}', priority=10))
+
+tag_rules.register(TagRule('language', 1,
+    r'^/\* wb[a-z\-]*:\d+\|([a-z\-]+) \*/',
+    tag='lang-{0}', priority=5, color='#3eabab'))
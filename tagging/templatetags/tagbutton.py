@@ -2,6 +2,8 @@ from django import template
 from django.urls import reverse
 from django.utils.http import urlencode
 
+from tagging.filters import pagination_params
+
 register = template.Library()
 
 @register.simple_tag(takes_context=True)
@@ -24,7 +26,8 @@ def tagbutton(context, tag):
 @register.simple_tag(takes_context=True)
 def set_get_param(context, key, value):
     request = context['request']
-    new_get_params = dict(request.GET.items())
+    # changing the filters goes back to the first page
+    new_get_params = { k: v for k, v in request.GET.items() if k not in pagination_params }
     if value:
         new_get_params[key] = value
     else:
@@ -1,7 +1,13 @@
 from django.test import TestCase
 from store.models import Edit
 from store.models import Batch
+from store.models import BatchArchive
 from .models import Tag
+from .models import RetaggingProgress
+from .models import extract_tag_names
+from .models import AppliedTagRule
+from .rules import tag_rules
+from .rules import TagRule
 from .models import action_re
 from .models import language_re
 from caching import invalidation
@@ -35,6 +41,68 @@ class TagTest(TestCase):
         batch = Batch.objects.get()
         self.assertEquals(['wbcreateclaim-create'], list(batch.tag_ids))
 
+    def test_retag_in_chunks(self):
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_terms.json')
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        tag_ids = { batch.id: set(batch.tag_ids) for batch in Batch.objects.all() }
+        Tag.objects.all().delete()
+        Tag.retag_all_batches(chunk_size=3, processes=2)
+        self.assertEquals(tag_ids, { batch.id: set(batch.tag_ids) for batch in Batch.objects.all() })
+        self.assertTrue(RetaggingProgress.objects.get().complete)
+
+    def test_resume_retagging(self):
+        Edit.ingest_jsonlines('store/testdata/qs_batch_with_new_items.json')
+        Tag.objects.all().delete()
+        # the first edits were retagged before an interruption
+        edits = list(Edit.objects.order_by('id'))
+        RetaggingProgress.objects.create(last_edit_id=edits[40].id)
+        Tag.retag_all_batches(chunk_size=7, resume=True)
+        progress = RetaggingProgress.objects.get()
+        self.assertTrue(progress.complete)
+        self.assertEquals(edits[-1].id, progress.last_edit_id)
+        expected = { tag_name for edit in edits[41:] for tag_name, _ in extract_tag_names(edit.comment) }
+        self.assertEquals(expected, set(Batch.objects.get().tag_ids))
+
+    def test_rules(self):
+        self.assertEquals([('action', 'wbsetlabel-add'), ('language', 'lang-ru')],
+            [(rule.name, tag) for rule, tag in tag_rules.extract('/* wbsetlabel-add:1|ru */ Eupelops brevicuspis')])
+        self.assertEquals([('language', 'lang-ru')],
+            [(rule.name, tag) for rule, tag in tag_rules.extract('/* wbsetlabel-add:1|ru */ Eupelops brevicuspis', ['language'])])
+        self.assertEquals([], tag_rules.extract('Eupelops brevicuspis'))
+
+    def test_backfill_new_rule(self):
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        self.assertEquals([], Tag.backfill_rules())
+        tag_rules.register(TagRule('quickstatements', 1, r'.*?#(quickstatements)', priority=1))
+        try:
+            self.assertEquals(['quickstatements'], [rule.name for rule in Tag.backfill_rules(chunk_size=2)])
+            batch = Batch.objects.get()
+            self.assertEquals(['wbcreateclaim-create', 'quickstatements'], list(batch.tag_ids))
+            self.assertEquals('quickstatements', Tag.objects.get(id='quickstatements').rule)
+            self.assertEquals(1, AppliedTagRule.objects.get(name='quickstatements').version)
+            self.assertEquals([], Tag.backfill_rules())
+        finally:
+            tag_rules.unregister('quickstatements')
+
+    def test_retag_archived_batches(self):
+        Edit.ingest_jsonlines('store/testdata/one_qs_batch.json')
+        BatchArchive.archive(Batch.objects.get(), chunk_size=3)
+        tag_rules.register(TagRule('quickstatements', 1, r'.*?#(quickstatements)', priority=1))
+        try:
+            Tag.backfill_rules(chunk_size=2)
+            # a new version of the rule is applied to the archived edits too
+            tag_rules.unregister('quickstatements')
+            tag_rules.register(TagRule('quickstatements', 2, r'.*?#(quickstatements)', priority=1))
+            Tag.backfill_rules(chunk_size=2)
+            batch = Batch.objects.get()
+            self.assertEquals(['wbcreateclaim-create', 'quickstatements'], list(batch.tag_ids))
+        finally:
+            tag_rules.unregister('quickstatements')
+
+        Tag.objects.all().delete()
+        Tag.retag_all_batches()
+        self.assertEquals(['wbcreateclaim-create'], list(Batch.objects.get().tag_ids))
+
     def test_language_re(self):
         self.assertEquals('ru', language_re.match('/* wbsetlabel-add:1|ru */ Eupelops brevicuspis').group(1))
 